@@ -0,0 +1,122 @@
+"""
+Benchmark of the memory allocated by `get_consumptions` for the scheduled (not taken)
+consumptions of a heavy user: 20 medicines with three daily hours over a 90 days range.
+
+It compares building a SQLAlchemy Consumption per slot, as it used to be done, with the
+ScheduledConsumption value objects, and then measures a whole get_consumptions call.
+"""
+import asyncio
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from utils import create_tables, create_user, print_table
+
+from api.medicine.models import Consumption, Medicine, ScheduledConsumption
+from api.medicine.schedule import get_medicine_schedule
+from api.medicine.service import get_consumptions
+from database import database
+
+MEDICINES = 20
+HOURS = ["08:00", "14:00", "20:00"]
+DAYS = 90
+
+
+def orm_consumption(medicine_id: int, date: datetime) -> Consumption:
+    consumption = Consumption(
+        date=date, real_consumption_date=date, medicine_id=medicine_id
+    )
+    consumption.consumed = False
+    return consumption
+
+
+def measure(function, *args) -> tuple[int, int]:
+    tracemalloc.start()
+    result = function(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak
+
+
+def build_slots(build, medicines: list[Medicine], start: datetime, end: datetime):
+    return [
+        build(medicine.id, date)
+        for medicine in medicines
+        for date in get_medicine_schedule(medicine, start, end).tolist()
+    ]
+
+
+async def measure_get_consumptions(user, start: datetime, end: datetime):
+    tracemalloc.start()
+    consumptions = await get_consumptions(user, start, end)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(consumptions), current, peak
+
+
+async def main():
+    create_tables()
+    await database.connect()
+    start = datetime.now()
+    end = start + timedelta(days=DAYS)
+    medicines = [
+        Medicine(
+            id=i,
+            start_date=start.replace(hour=0, minute=0, second=0, microsecond=0),
+            interval=1,
+            hours=HOURS,
+        )
+        for i in range(MEDICINES)
+    ]
+    # Warm up the SQLAlchemy mappers so their configuration is not measured.
+    orm_consumption(0, start)
+
+    rows = []
+    for name, build in [
+        ("Consumption (ORM)", orm_consumption),
+        ("ScheduledConsumption", ScheduledConsumption),
+    ]:
+        current, peak = measure(build_slots, build, medicines, start, end)
+        rows.append(
+            {
+                "slots": name,
+                "amount": len(build_slots(build, medicines, start, end)),
+                "retained_kb": current / 1024,
+                "peak_kb": peak / 1024,
+            }
+        )
+    print_table(rows)
+    print()
+
+    async with database.transaction(force_rollback=True):
+        user = await create_user("benchmark_consumption_allocations")
+        for medicine in medicines:
+            await database.execute(
+                insert(Medicine).values(
+                    user_id=user.id,
+                    name=f"Medicine {medicine.id}",
+                    start_date=medicine.start_date,
+                    presentation="Pastilla",
+                    dosis_unit="mg",
+                    dosis=1,
+                    interval=1,
+                    hours=HOURS,
+                )
+            )
+        amount, current, peak = await measure_get_consumptions(user, start, end)
+    await database.disconnect()
+    print_table(
+        [
+            {
+                "get_consumptions": f"{DAYS} days",
+                "consumptions": amount,
+                "retained_kb": current / 1024,
+                "peak_kb": peak / 1024,
+            }
+        ]
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
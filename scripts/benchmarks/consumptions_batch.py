@@ -0,0 +1,95 @@
+"""
+Benchmark of the logging of the consumptions of a client that was offline: queries and
+milliseconds to create a backlog of consumptions of MEDICINES medicines one request at a
+time (create_consumption) and in a single request (create_consumptions).
+
+The medicines have a stock and a stock warning, so the low stock is notified once on
+both ways.
+
+Usage (from the src folder):
+    PYTHONPATH=. python ../scripts/benchmarks/consumptions_batch.py
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+from utils import count_queries, create_tables, create_user, print_table
+
+from api.medicine.models import Medicine
+from api.medicine.schemas import CreateConsumptionSchema
+from api.medicine.service import create_consumption, create_consumptions
+from api.user.models import User
+from database import database
+
+CONSUMPTIONS = [10, 50, 200]
+MEDICINES = 5
+
+
+async def create_backlog(user, amount: int) -> list[CreateConsumptionSchema]:
+    days = amount // MEDICINES
+    start = (datetime.now() - timedelta(days=days)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    backlog = []
+    for i in range(MEDICINES):
+        insert_query = (
+            insert(Medicine)
+            .values(
+                user_id=user.id,
+                name=f"Medicamento {i}",
+                start_date=start,
+                stock=days + 3,
+                stock_warning=5,
+                presentation="Pastilla",
+                dosis_unit="mg",
+                dosis=1,
+                interval=1,
+                hours=["08:00"],
+            )
+            .returning(Medicine.id)
+        )
+        medicine_id = await database.execute(query=insert_query)
+        for day in range(days):
+            date = start + timedelta(days=day, hours=8)
+            backlog.append(
+                CreateConsumptionSchema(
+                    medicine_id=medicine_id, date=date, real_consumption_date=date
+                )
+            )
+    return backlog
+
+
+async def one_by_one(user, backlog: list[CreateConsumptionSchema]):
+    for consumption in backlog:
+        await create_consumption(user, consumption)
+
+
+async def measure(name: str, user, amount: int, log) -> dict:
+    backlog = await create_backlog(user, amount)
+    with count_queries() as counter:
+        start = time.perf_counter()
+        await log(user, backlog)
+        ms = (time.perf_counter() - start) * 1000
+    return {"consumptions": amount, "logging": name, "ms": ms, **counter}
+
+
+async def main():
+    create_tables()
+    await database.connect()
+    rows = []
+    async with database.transaction(force_rollback=True):
+        await create_user("benchmark_consumptions_batch")
+        # The row, like the one of the authenticated user
+        select_query = select(User).where(User.id == "benchmark_consumptions_batch")
+        user = await database.fetch_one(query=select_query)
+        for amount in CONSUMPTIONS:
+            rows.append(await measure("one by one", user, amount, one_by_one))
+            rows.append(await measure("batch", user, amount, create_consumptions))
+    await database.disconnect()
+    print(f"Logging a backlog of consumptions of {MEDICINES} medicines:")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+"""
+Benchmark of the digests of the notifications: provider calls and queries of the worker to
+send a burst of low-stock notifications (NOTIFICATIONS_PER_USER for every user, like the
+alerts of the consumptions of a day of a user with supervisors), with every delivery sent
+alone and with the deliveries coalesced into a digest for every user and channel.
+
+It also shows the low-stock notifications of the consumptions of a medicine that stays
+under its stock warning, which are sent once instead of on every consumption.
+
+Usage (from the src folder):
+    PYTHONPATH=. python ../scripts/benchmarks/digest.py [users]
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select, update
+from utils import count_queries, create_tables, create_user, print_table
+
+from api.medicine.models import Medicine
+from api.medicine.schemas import CreateConsumptionSchema
+from api.medicine.service import create_consumption
+from api.notification.models.message import LowStockMessage
+from api.notification.models.notification import Notification
+from api.notification.models.notification_preference import NotificationPreference
+from api.notification.models.outbox import NotificationOutbox
+from api.notification.service import send_notifications_bulk
+from api.notification.worker import Worker
+from api.user.models import User
+from config import NOTIFICATION_DIGEST_SECONDS
+from database import database
+
+NOTIFICATIONS_PER_USER = 6
+CHANNELS = ["email", "whatsapp"]
+CONSUMPTIONS = 10
+
+
+async def create_users(amount: int) -> list:
+    users = []
+    for i in range(amount):
+        user = await create_user(f"benchmark_digest_{i:05d}")
+        user.phone = "+5493510000000"
+        users.append(user)
+    await database.execute(
+        insert(NotificationPreference).values(
+            [
+                {"user_id": user.id, "notification_preference": channel}
+                for user in users
+                for channel in CHANNELS
+            ]
+        )
+    )
+    return users
+
+
+async def send_burst(users: list, window: int) -> dict:
+    NOTIFICATION_DIGEST_SECONDS["low_stock"] = window
+    for i in range(NOTIFICATIONS_PER_USER):
+        medicine = Medicine(name=f"Medicamento {i}")
+        await send_notifications_bulk(
+            [(LowStockMessage(medicine=medicine), user) for user in users]
+        )
+    # The window is over
+    await database.execute(
+        update(NotificationOutbox)
+        .where(NotificationOutbox.status == NotificationOutbox.PENDING)
+        .values(next_attempt_at=func.now() - func.make_interval(0, 0, 0, 0, 0, 1))
+    )
+
+    calls = []
+
+    async def send(payload: dict):
+        calls.append(payload)
+
+    worker = Worker(senders={channel: send for channel in CHANNELS})
+    with count_queries() as counter:
+        for channel in CHANNELS:
+            while await worker.drain(channel):
+                pass
+    return {"window": window, "provider calls": len(calls), **counter}
+
+
+async def consume_under_warning() -> int:
+    await create_user("benchmark_digest_consumer")
+    # The row, like the one of the authenticated user
+    select_query = select(User).where(User.id == "benchmark_digest_consumer")
+    user = await database.fetch_one(query=select_query)
+    start = datetime.now() - timedelta(days=CONSUMPTIONS)
+    insert_query = (
+        insert(Medicine)
+        .values(
+            name="Medicamento bajo",
+            start_date=start,
+            stock=CONSUMPTIONS,
+            stock_warning=CONSUMPTIONS,
+            presentation="Pastilla",
+            dosis_unit="mg",
+            dosis=1,
+            interval=1,
+            hours=["08:00"],
+            user_id=user.id,
+        )
+        .returning(Medicine.id)
+    )
+    medicine_id = await database.execute(query=insert_query)
+    for day in range(CONSUMPTIONS):
+        date = (start + timedelta(days=day)).replace(hour=8, minute=0, second=0)
+        await create_consumption(
+            user,
+            CreateConsumptionSchema(
+                medicine_id=medicine_id, date=date, real_consumption_date=date
+            ),
+        )
+    select_query = select(func.count()).where(Notification.user_id == user.id)
+    return await database.fetch_val(query=select_query)
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    create_tables()
+    await database.connect()
+    rows = []
+    async with database.transaction(force_rollback=True):
+        population = await create_users(users)
+        for window in [0, 600]:
+            rows.append(await send_burst(population, window))
+        low_stock = await consume_under_warning()
+    await database.disconnect()
+    print(
+        f"Sending {NOTIFICATIONS_PER_USER} notifications to {users} users "
+        f"by {' and '.join(CHANNELS)}:"
+    )
+    print_table(rows)
+    print(f"Low-stock notifications of {CONSUMPTIONS} consumptions under the warning:")
+    print_table([{"consumptions": CONSUMPTIONS, "notifications": low_stock}])
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
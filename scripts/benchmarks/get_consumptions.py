@@ -0,0 +1,82 @@
+"""
+Benchmark of `get_consumptions` as the number of medicines of a user grows.
+
+Every medicine has three daily hours and half of its doses taken, and the calendar
+range is the default one (15 days before and after today).
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from utils import count_queries, create_tables, create_user, print_table, timeit
+
+from api.medicine.models import Consumption, Medicine
+from api.medicine.service import get_consumptions
+from database import database
+
+MEDICINES = [1, 5, 10, 20, 40]
+HOURS = ["08:00", "14:00", "20:00"]
+
+
+async def create_medicines(user, amount: int, start: datetime):
+    for i in range(amount):
+        medicine = await database.fetch_one(
+            insert(Medicine)
+            .values(
+                user_id=user.id,
+                name=f"Medicine {i}",
+                start_date=start,
+                presentation="Pastilla",
+                dosis_unit="mg",
+                dosis=1,
+                interval=1,
+                hours=HOURS,
+            )
+            .returning(Medicine)
+        )
+        await database.execute_many(
+            insert(Consumption),
+            [
+                {
+                    "medicine_id": medicine.id,
+                    "date": date,
+                    "real_consumption_date": date,
+                }
+                for day in range(0, 30, 2)
+                for hour in HOURS
+                for date in [
+                    datetime.combine(
+                        (start + timedelta(days=day)).date(),
+                        datetime.strptime(hour, "%H:%M").time(),
+                    )
+                ]
+            ],
+        )
+
+
+async def main():
+    create_tables()
+    await database.connect()
+    start = datetime.now() - timedelta(days=15)
+    end = datetime.now() + timedelta(days=15)
+    rows = []
+    async with database.transaction(force_rollback=True):
+        for amount in MEDICINES:
+            user = await create_user(f"benchmark_get_consumptions_{amount}")
+            await create_medicines(user, amount, start.replace(hour=0, minute=0))
+            with count_queries() as counter:
+                consumptions = await get_consumptions(user, start, end)
+            rows.append(
+                {
+                    "medicines": amount,
+                    "consumptions": len(consumptions),
+                    "queries": counter["queries"],
+                    **await timeit(get_consumptions, user, start, end),
+                }
+            )
+    await database.disconnect()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
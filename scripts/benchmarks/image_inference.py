@@ -0,0 +1,109 @@
+"""
+Benchmark of the predictions by image under concurrent mixed traffic: latency of the
+light requests (which only wait LIGHT_MS for I/O, like a query) and of the predictions
+that arrive meanwhile, with the model run in the event loop (like predict_by_image did)
+and in the inference pool.
+
+The model is a stand-in that takes the CPU for MODEL_MS per prediction, like a forward
+pass of the Keras model, so it can run where TensorFlow is not installed.
+
+Usage (from the src folder):
+    PYTHONPATH=. python ../scripts/benchmarks/image_inference.py [model_ms]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from utils import print_table
+
+from api.prediction import inference, registry
+
+LIGHT_REQUESTS = 1000
+LIGHT_MS = 2
+PREDICTIONS = 50
+SECONDS = 2  # The traffic arrives evenly during this time
+
+
+class StandInModel:
+    def __init__(self, ms: float):
+        self.ms = ms
+
+    def predict(self, tensor: np.ndarray) -> np.ndarray:
+        end = time.perf_counter() + self.ms / 1000
+        while time.perf_counter() < end:
+            pass
+        return np.full((len(tensor), 7), 1 / 7)
+
+
+def load_stand_in_model():
+    # The processes of the pool are spawned, so they get MODEL_MS from the environment
+    model_ms = float(os.environ["MODEL_MS"])
+    registry.MODELS["by_image"] = (lambda path: StandInModel(model_ms), "")
+    registry.get_model("by_image")
+
+
+async def predict_in_loop(tensor: np.ndarray) -> np.ndarray:
+    return registry.get_model("by_image").predict(tensor)
+
+
+def percentiles(latencies: list[float]) -> tuple[float, float]:
+    latencies = sorted(latencies)
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99)]
+
+
+async def run(name: str, predict) -> dict:
+    light, predictions = [], []
+    tensor = np.random.rand(1, 32, 32, 3)
+
+    async def light_request(delay: float):
+        await asyncio.sleep(delay)
+        start = time.perf_counter()
+        await asyncio.sleep(LIGHT_MS / 1000)
+        light.append((time.perf_counter() - start) * 1000)
+
+    async def prediction(delay: float):
+        await asyncio.sleep(delay)
+        start = time.perf_counter()
+        await predict(tensor)
+        predictions.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[light_request(SECONDS * i / LIGHT_REQUESTS) for i in range(LIGHT_REQUESTS)],
+        *[prediction(SECONDS * i / PREDICTIONS) for i in range(PREDICTIONS)],
+    )
+    seconds = time.perf_counter() - start
+    light_p50, light_p99 = percentiles(light)
+    prediction_p50, prediction_p99 = percentiles(predictions)
+    return {
+        "model": name,
+        "light p50 ms": light_p50,
+        "light p99 ms": light_p99,
+        "prediction p50 ms": prediction_p50,
+        "prediction p99 ms": prediction_p99,
+        "seconds": seconds,
+    }
+
+
+async def main():
+    model_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 30
+    os.environ["MODEL_MS"] = str(model_ms)
+    load_stand_in_model()
+    rows = [await run("in the event loop", predict_in_loop)]
+    inference.load_model = load_stand_in_model
+    await inference.start()
+    rows.append(await run("inference pool", inference.predict))
+    inference.shutdown()
+    print(
+        f"{LIGHT_REQUESTS} light requests and {PREDICTIONS} predictions of "
+        f"{model_ms:g} ms in {SECONDS} s ({inference.PREDICTION_IMAGE_WORKERS} "
+        f"processes in the pool):"
+    )
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,153 @@
+"""
+Benchmark of the daily notification jobs: queries sent and wall time for a synthetic
+population of users, each one with medicines and an appointment today, where every
+fourth user supervises the next three.
+
+The jobs process the chunks of users with connections of their own, so the population
+is committed and deleted at the end instead of living in a rolled back transaction.
+
+Usage (from the src folder):
+    PYTHONPATH=. python ../scripts/benchmarks/jobs.py [users]
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert
+from utils import count_queries, create_tables, print_table
+
+from api.appointment.models import Appointment
+from api.jobs.models import JobRun
+from api.jobs.service import (
+    send_today_user_appointments_notification,
+    send_today_user_medicines_notification,
+    send_yesterday_user_didnt_take_medicines_notification,
+    start_job_run,
+)
+from api.medicine.models import Medicine
+from api.medicine.service import get_scheduled_doses_window, insert_scheduled_doses
+from api.notification.models.notification import Notification
+from api.user.models import Supervised, User
+from database import database
+
+MEDICINES_PER_USER = 2
+INSERT_CHUNK_SIZE = 2000
+
+JOBS = [
+    send_today_user_appointments_notification,
+    send_today_user_medicines_notification,
+    send_yesterday_user_didnt_take_medicines_notification,
+]
+
+
+async def insert_in_chunks(model, rows: list[dict]) -> list:
+    results = []
+    for i in range(0, len(rows), INSERT_CHUNK_SIZE):
+        insert_query = insert(model).values(rows[i : i + INSERT_CHUNK_SIZE])
+        results += await database.fetch_all(query=insert_query.returning(model))
+    return results
+
+
+async def create_population(users: int, prefix: str = "benchmark_jobs") -> datetime:
+    """
+    Creates the synthetic population and returns the moment it was created, which
+    `delete_population` uses to find the job runs of the benchmark.
+    """
+
+    created_at = datetime.now()
+    users_ids = [f"{prefix}_{i:06d}" for i in range(users)]
+    await insert_in_chunks(
+        User,
+        [
+            {"id": user_id, "email": f"{user_id}@benchmark.com", "invitation": user_id}
+            for user_id in users_ids
+        ],
+    )
+    medicines = await insert_in_chunks(
+        Medicine,
+        [
+            {
+                "user_id": user_id,
+                "name": f"Medicine {j}",
+                "start_date": datetime.now() - timedelta(days=7),
+                "presentation": "Pastilla",
+                "dosis_unit": "mg",
+                "dosis": 1,
+                "interval": 1,
+                "hours": ["08:00", "14:00", "20:00"],
+            }
+            for user_id in users_ids
+            for j in range(MEDICINES_PER_USER)
+        ],
+    )
+    await insert_scheduled_doses(
+        [Medicine(**medicine) for medicine in medicines],
+        *get_scheduled_doses_window(),
+    )
+    await insert_in_chunks(
+        Appointment,
+        [
+            {
+                "user_id": user_id,
+                "name": "Consulta",
+                "doctor": "Dr. Juan Perez",
+                "speciality": "Cardiología",
+                "location": "Hospital",
+                "date": datetime.now().replace(hour=12, minute=0),
+            }
+            for user_id in users_ids
+        ],
+    )
+    await insert_in_chunks(
+        Supervised,
+        [
+            {"supervisor_id": users_ids[i - i % 4], "supervised_id": user_id}
+            for i, user_id in enumerate(users_ids)
+            if i % 4
+        ],
+    )
+    return created_at
+
+
+async def delete_population(created_at: datetime, prefix: str = "benchmark_jobs"):
+    pattern = f"{prefix}_%"
+    for delete_query in [
+        delete(Notification).where(Notification.user_id.like(pattern)),
+        delete(Supervised).where(Supervised.supervisor_id.like(pattern)),
+        delete(Appointment).where(Appointment.user_id.like(pattern)),
+        delete(Medicine).where(Medicine.user_id.like(pattern)),
+        delete(User).where(User.id.like(pattern)),
+        delete(JobRun).where(JobRun.created_at >= created_at),
+    ]:
+        await database.execute(query=delete_query)
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    create_tables()
+    await database.connect()
+    rows = []
+    created_at = await create_population(users)
+    try:
+        for job in JOBS:
+            start = time.perf_counter()
+            with count_queries() as counter:
+                job_run, _ = await start_job_run(job.__name__)
+                await job(job_run)
+            rows.append(
+                {
+                    "job": job.__name__,
+                    "users": users,
+                    "queries": counter["queries"],
+                    "wall_ms": (time.perf_counter() - start) * 1000,
+                }
+            )
+    finally:
+        await delete_population(created_at)
+        await database.disconnect()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""
+Benchmark of the concurrency of the notification jobs: wall time of the today medicines
+job over a synthetic population of users, processing 1, 8 and 32 chunks of users at
+once.
+
+The pool must have a connection for every concurrent chunk, so DB_POOL_SIZE defaults to
+the highest concurrency of the benchmark.
+
+Usage (from the src folder):
+    PYTHONPATH=. python ../scripts/benchmarks/jobs_concurrency.py [users]
+"""
+import os
+
+os.environ.setdefault("DB_POOL_SIZE", "32")
+
+import asyncio  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+
+from jobs import create_population, delete_population  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+from utils import create_tables, print_table  # noqa: E402
+
+from api.jobs.models import JobRun  # noqa: E402
+from api.jobs.service import (  # noqa: E402
+    send_today_user_medicines_notification,
+    start_job_run,
+)
+from api.notification.models.notification import Notification  # noqa: E402
+from database import database  # noqa: E402
+
+CONCURRENCIES = [1, 8, 32]
+PREFIX = "benchmark_jobs_concurrency"
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    create_tables()
+    await database.connect()
+    rows = []
+    created_at = await create_population(users, PREFIX)
+    try:
+        for concurrency in CONCURRENCIES:
+            job_run, _ = await start_job_run(
+                send_today_user_medicines_notification.__name__
+            )
+            start = time.perf_counter()
+            await send_today_user_medicines_notification(
+                job_run, concurrency=concurrency
+            )
+            wall = time.perf_counter() - start
+            rows.append(
+                {
+                    "concurrency": concurrency,
+                    "users": users,
+                    "wall_ms": wall * 1000,
+                    "users_per_s": users / wall,
+                }
+            )
+            # Every run notifies the same users from scratch
+            await database.execute(
+                delete(Notification).where(Notification.user_id.like(f"{PREFIX}_%"))
+            )
+            await database.execute(
+                delete(JobRun).where(JobRun.created_at >= created_at)
+            )
+    finally:
+        await delete_population(created_at, PREFIX)
+        await database.disconnect()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
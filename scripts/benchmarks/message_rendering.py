@@ -0,0 +1,85 @@
+"""
+Benchmark of the rendering of the notification messages: seconds to render the email,
+WhatsApp and push messages of many TodayUserMedicines messages, calling the methods of
+every channel (like send_notification did, where the push message was built twice, for
+the notification and for its delivery), and with the renderer, which renders every
+channel of a message once, one message at a time and in a batch.
+
+Usage (from the src folder):
+    PYTHONPATH=. python ../scripts/benchmarks/message_rendering.py [messages]
+"""
+import sys
+import time
+
+from utils import print_table
+
+from api.notification.models.message import TodayUserMedicines
+from api.notification.renderer import render, render_batch
+from api.user.models import User
+
+CHANNELS = ["email", "whatsapp", "push"]
+
+
+def create_messages(amount: int) -> list:
+    return [
+        TodayUserMedicines(
+            user=User(first_name=f"Usuario {i}", last_name="Meddly"),
+            medicines={
+                j: {"name": f"Medicamento {j}", "hours": ["08:00", "14:00", "20:00"]}
+                for j in range(3)
+            },
+            supervised_medicines=[
+                {
+                    "name": "Supervisado",
+                    "medicines": {0: {"name": "Ibuprofeno", "hours": ["09:00"]}},
+                }
+            ],
+        )
+        for i in range(amount)
+    ]
+
+
+def render_every_call(messages: list):
+    for message in messages:
+        message.push()  # The notification
+        for channel in CHANNELS:
+            getattr(message, channel)()
+
+
+def render_one_by_one(messages: list):
+    for message in messages:
+        render(message, "push")  # The notification
+        for channel in CHANNELS:
+            render(message, channel)
+
+
+def render_in_batch(messages: list):
+    for channel in CHANNELS:
+        render_batch(messages, channel)
+
+
+def main():
+    amount = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rows = []
+    for name, render_messages in [
+        ("every call", render_every_call),
+        ("renderer", render_one_by_one),
+        ("renderer (batch)", render_in_batch),
+    ]:
+        messages = create_messages(amount)
+        start = time.perf_counter()
+        render_messages(messages)
+        seconds = time.perf_counter() - start
+        rows.append(
+            {
+                "rendering": name,
+                "seconds": seconds,
+                "messages/s": int(amount / seconds),
+            }
+        )
+    print(f"Rendering of the email, WhatsApp and push of {amount} messages:")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
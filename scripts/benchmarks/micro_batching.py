@@ -0,0 +1,79 @@
+"""
+Benchmark of the micro-batching of the predictions by image: throughput and latency of
+CLIENTS concurrent clients that predict an image after another for SECONDS, with several
+batch sizes and waits (a batch size of 1 is the prediction of every image alone).
+
+The model is a stand-in that takes the CPU for CALL_MS per call plus IMAGE_MS per image,
+like the overhead of a call to the Keras model and its forward pass, so it can run where
+TensorFlow is not installed.
+
+Usage (from the src folder):
+    PYTHONPATH=. python ../scripts/benchmarks/micro_batching.py [clients]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+import numpy as np
+from utils import print_table
+
+from api.prediction import inference, registry
+
+CALL_MS = 10
+IMAGE_MS = 0.5
+SECONDS = 3
+# (max batch size, max wait in ms)
+SETTINGS = [(1, 0), (4, 2), (8, 2), (16, 5), (32, 5), (32, 20)]
+
+
+class StandInModel:
+    def predict(self, tensor: np.ndarray) -> np.ndarray:
+        end = time.perf_counter() + (CALL_MS + IMAGE_MS * len(tensor)) / 1000
+        while time.perf_counter() < end:
+            pass
+        return np.full((len(tensor), 7), 1 / 7)
+
+
+async def run(clients: int, max_size: int, max_wait_ms: float) -> dict:
+    batcher = inference.MicroBatcher(inference.predict, max_size, max_wait_ms)
+    latencies = []
+    tensor = np.random.rand(1, 32, 32, 3)
+    end = time.perf_counter() + SECONDS
+
+    async def client():
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            await batcher.predict(tensor)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(clients)])
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "batch size": max_size,
+        "wait ms": max_wait_ms,
+        "predictions/s": int(len(latencies) / seconds),
+        "p50 ms": statistics.median(latencies),
+        "p99 ms": latencies[int(len(latencies) * 0.99)],
+    }
+
+
+async def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    # The processes of the pool are forked, so they load the stand-in too
+    registry.MODELS["by_image"] = (lambda path: StandInModel(), "")
+    await inference.start()
+    rows = [await run(clients, *setting) for setting in SETTINGS]
+    inference.shutdown()
+    print(
+        f"{clients} clients predicting for {SECONDS} s, {CALL_MS} ms per call and "
+        f"{IMAGE_MS} ms per image ({inference.PREDICTION_IMAGE_WORKERS} processes "
+        f"in the pool):"
+    )
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
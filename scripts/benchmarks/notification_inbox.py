@@ -0,0 +1,194 @@
+"""
+Benchmark of the notification inbox of a user with many notifications: latency of a page
+at increasing depths with the OFFSET pagination of `get_notifications` (without marking
+the page as read) and with the keyset pagination of `get_inbox`, and of the unread badge
+with count(*) and with the counter. Then, with 24 more months of history, the latency and
+the partitions scanned by the first page without bounds of created_at and by `get_inbox`,
+which is bounded by the retention cutoff so the older partitions are pruned.
+
+The notification table is partitioned first if it predates the partitioning.
+
+Usage (from the src folder):
+    PYTHONPATH=. python ../scripts/benchmarks/notification_inbox.py [notifications]
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects import postgresql
+from utils import create_tables, create_user, print_table, timeit
+
+from api.notification.models.notification import Notification
+from api.notification.partitions import (
+    add_months,
+    create_partition,
+    ensure_partitions,
+    get_partitions,
+    partition_existing_table,
+)
+from api.notification.service import (
+    encode_cursor,
+    get_inbox,
+    get_retention_cutoff,
+    get_unread_count,
+)
+from database import database
+
+PER_PAGE = 20
+DEPTHS = [1, 100, 1000, 4500]  # Pages
+HISTORY_MONTHS = 24
+HISTORY_PER_MONTH = 2000
+
+
+async def create_partitions(start: datetime):
+    """
+    Creates the partitions from the month of `start`, before the notifications are
+    inserted, as they would be in production (instead of moving them out of the default
+    partition in this transaction, which leaves its index full of dead rows).
+    """
+
+    month = start.date().replace(day=1)
+    existing = set(await get_partitions())
+    while month <= datetime.now().date():
+        if month not in existing:
+            await create_partition(month)
+        month = add_months(month, 1)
+    await ensure_partitions()
+
+
+async def create_notifications(user, amount: int, start: datetime, step: timedelta):
+    for i in range(0, amount, 5000):
+        await database.execute(
+            insert(Notification).values(
+                [
+                    {
+                        "user_id": user.id,
+                        "title": "Medicamento por agotarse",
+                        "body": f"Notificación {j}",
+                        "type": "medicine",
+                        "created_at": start + step * j,
+                        "is_read": j % 3 == 0,
+                    }
+                    for j in range(i, min(i + 5000, amount))
+                ]
+            )
+        )
+
+
+async def get_offset_page(user, page: int):
+    select_query = (
+        select(Notification)
+        .where(Notification.user_id == user.id)
+        .order_by(Notification.created_at.desc())
+        .offset((page - 1) * PER_PAGE)
+        .limit(PER_PAGE)
+    )
+    return await database.fetch_all(query=select_query)
+
+
+def get_first_page_query(user, bounded: bool):
+    select_query = (
+        select(Notification)
+        .where(Notification.user_id == user.id)
+        .order_by(Notification.created_at.desc(), Notification.id.desc())
+        .limit(PER_PAGE + 1)
+    )
+    if bounded:
+        select_query = select_query.where(
+            Notification.created_at >= get_retention_cutoff()
+        )
+    return select_query
+
+
+async def count_scanned_partitions(select_query) -> int:
+    query = select_query.compile(dialect=postgresql.dialect(paramstyle="named"))
+    plan = await database.fetch_all(f"EXPLAIN ANALYZE {query}", query.params)
+    return sum(
+        1
+        for row in plan
+        if " on notification_" in row[0] and "never executed" not in row[0]
+    )
+
+
+async def count_unread(user):
+    count_query = select(func.count()).where(
+        Notification.user_id == user.id, Notification.is_read.is_(False)
+    )
+    return await database.fetch_val(query=count_query)
+
+
+async def main():
+    amount = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    create_tables()
+    await database.connect()
+    await partition_existing_table()
+    rows = []
+    async with database.transaction(force_rollback=True):
+        user = await create_user("benchmark_notification_inbox")
+        start = datetime.now() - timedelta(minutes=amount)
+        await create_partitions(start)
+        await create_notifications(user, amount, start, timedelta(minutes=1))
+        await database.execute("ANALYZE notification")
+        for depth in DEPTHS:
+            # The cursor that the previous page would have returned
+            previous = (
+                (await get_offset_page(user, depth - 1))[-1] if depth > 1 else None
+            )
+            cursor = encode_cursor(previous) if previous else None
+            rows.append(
+                {
+                    "page": depth,
+                    "offset": (await timeit(get_offset_page, user, depth))["median_ms"],
+                    "keyset": (
+                        await timeit(get_inbox, user, cursor=cursor, limit=PER_PAGE)
+                    )["median_ms"],
+                }
+            )
+        await get_unread_count(user)
+        badge = {
+            "count(*)": (await timeit(count_unread, user))["median_ms"],
+            "counter": (await timeit(get_unread_count, user))["median_ms"],
+        }
+
+        history_start = datetime.combine(
+            add_months(start.date().replace(day=1), -HISTORY_MONTHS),
+            datetime.min.time(),
+        )
+        await create_partitions(history_start)
+        await create_notifications(
+            user,
+            HISTORY_MONTHS * HISTORY_PER_MONTH,
+            history_start,
+            (
+                datetime.combine(start.date().replace(day=1), datetime.min.time())
+                - history_start
+            )
+            / (HISTORY_MONTHS * HISTORY_PER_MONTH),
+        )
+        await database.execute("ANALYZE notification")
+        pruning = [
+            {
+                "query": name,
+                "median_ms": (
+                    await timeit(
+                        database.fetch_all, get_first_page_query(user, bounded)
+                    )
+                )["median_ms"],
+                "partitions": await count_scanned_partitions(
+                    get_first_page_query(user, bounded)
+                ),
+            }
+            for name, bounded in [("unbounded", False), ("get_inbox", True)]
+        ]
+    await database.disconnect()
+    print(f"Page latency (median ms) with {amount} notifications:")
+    print_table(rows)
+    print("Unread badge (median ms):")
+    print_table([badge])
+    print(f"First page with {HISTORY_MONTHS} more months of history:")
+    print_table(pruning)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
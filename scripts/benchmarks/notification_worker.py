@@ -0,0 +1,152 @@
+"""
+Benchmark of the notification worker: deliveries per second of every channel, draining
+an outbox of notifications for users that have the three notification preferences,
+against local stand-ins of SendGrid, Twilio and FCM that answer after LATENCY_MS.
+
+Usage (from the src folder):
+    PYTHONPATH=. python ../scripts/benchmarks/notification_worker.py [users]
+"""
+import os
+
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "AC00000000000000000000000000000000")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "stand-in")
+# Every delivery is sent alone, as soon as possible
+os.environ.setdefault("NOTIFICATION_DIGEST_LOW_STOCK_SECONDS", "0")
+
+import asyncio  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+
+from sqlalchemy import delete, func, insert, select  # noqa: E402
+from stand_ins import use_stand_ins  # noqa: E402
+from utils import create_tables, print_table  # noqa: E402
+
+from api.medicine.models import Medicine  # noqa: E402
+from api.notification.models.message import LowStockMessage  # noqa: E402
+from api.notification.models.notification import Notification  # noqa: E402
+from api.notification.models.notification_preference import (  # noqa: E402
+    NotificationPreference,
+)
+from api.notification.models.outbox import NotificationOutbox  # noqa: E402
+from api.notification.service import send_notification, send_pushes  # noqa: E402
+from api.notification.transports import SendGridTransport, TwilioTransport  # noqa: E402
+from api.notification.worker import Worker  # noqa: E402
+from api.user.models import Device, User  # noqa: E402
+from config import OUTBOX_CONCURRENCY  # noqa: E402
+from database import database  # noqa: E402
+
+LATENCY_MS = 20
+PREFIX = "benchmark_worker"
+
+
+async def create_population(users: int) -> list[User]:
+    users = [
+        User(id=f"{PREFIX}_{i:06d}", email=f"{i}@benchmark.com", phone="+5493510000000")
+        for i in range(users)
+    ]
+    await database.execute(
+        insert(User).values(
+            [
+                {
+                    "id": user.id,
+                    "email": user.email,
+                    "phone": user.phone,
+                    "invitation": user.id,
+                }
+                for user in users
+            ]
+        )
+    )
+    await database.execute(
+        insert(NotificationPreference).values(
+            [
+                {"user_id": user.id, "notification_preference": preference}
+                for user in users
+                for preference in NotificationPreference.OPTIONS
+            ]
+        )
+    )
+    await database.execute(
+        insert(Device).values(
+            [{"user_id": user.id, "token": f"token_{user.id}"} for user in users]
+        )
+    )
+    message = LowStockMessage(medicine=Medicine(name="Ibuprofeno"))
+    for user in users:
+        await send_notification(message, user)
+    return users
+
+
+async def delete_population():
+    pattern = f"{PREFIX}_%"
+    for delete_query in [
+        delete(Notification).where(Notification.user_id.like(pattern)),
+        delete(NotificationPreference).where(
+            NotificationPreference.user_id.like(pattern)
+        ),
+        delete(Device).where(Device.user_id.like(pattern)),
+        delete(User).where(User.id.like(pattern)),
+    ]:
+        await database.execute(query=delete_query)
+
+
+async def count_pending() -> dict[str, int]:
+    select_query = (
+        select(NotificationOutbox.channel, func.count())
+        .where(NotificationOutbox.status == NotificationOutbox.PENDING)
+        .group_by(NotificationOutbox.channel)
+    )
+    return dict(list(row.values()) for row in await database.fetch_all(select_query))
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    stand_in = use_stand_ins(LATENCY_MS)
+    create_tables()
+    await database.connect()
+    try:
+        await create_population(users)
+        # The stand-ins have no rate limits
+        email = SendGridTransport(stand_in.url, rate=10_000)
+        whatsapp = TwilioTransport(stand_in.url, rate=10_000)
+        worker = Worker(
+            senders={
+                "email": email.send,
+                "whatsapp": whatsapp.send,
+                "push": send_pushes,
+            }
+        )
+        start = time.perf_counter()
+        task = asyncio.create_task(worker.run())
+        drained = {}
+        while len(drained) < len(OUTBOX_CONCURRENCY):
+            pending = await count_pending()
+            for channel in OUTBOX_CONCURRENCY:
+                if channel not in drained and not pending.get(channel):
+                    drained[channel] = time.perf_counter() - start
+            await asyncio.sleep(0.05)
+        worker.stop()
+        await task
+        await email.close()
+        await whatsapp.close()
+    finally:
+        await delete_population()
+        await database.disconnect()
+    requests = {"email": "sendgrid", "whatsapp": "twilio", "push": "fcm"}
+    print_table(
+        [
+            {
+                "channel": channel,
+                "concurrency": OUTBOX_CONCURRENCY[channel],
+                "deliveries": users,
+                "requests": stand_in.requests[requests[channel]],
+                "seconds": drained[channel],
+                "per_second": users / drained[channel],
+            }
+            for channel in OUTBOX_CONCURRENCY
+        ]
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
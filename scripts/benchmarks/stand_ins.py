@@ -0,0 +1,120 @@
+"""
+Local stand-ins of the SendGrid, Twilio and FCM APIs, to benchmark the notification
+delivery without sending anything.
+
+Every stand-in answers like the real API after `latency_ms`, and counts the requests it
+receives. The FCM stand-in answers UNREGISTERED to the tokens that start with
+"unregistered". `use_stand_ins` points the clients of the app to them.
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import firebase_admin
+from firebase_admin import credentials, messaging
+from google.oauth2.credentials import Credentials
+
+from config import SENDGRID_CONFIG, WhatsappClient
+
+
+class StandInCredential(credentials.Base):
+    def get_credential(self):
+        return Credentials(token="stand-in")
+
+
+class StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency_ms: float):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.latency_ms = latency_ms
+        self.requests = {"sendgrid": 0, "twilio": 0, "fcm": 0, "fcm_unregistered": 0}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> "StandIn":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # The headers and the body are written apart, which Nagle would delay
+    disable_nagle_algorithm = True
+
+    ROUTES = [
+        ("sendgrid", re.compile(r"^/v3/mail/send$"), 202, b""),
+        (
+            "twilio",
+            re.compile(r"^/2010-04-01/Accounts/[^/]+/Messages.json$"),
+            201,
+            json.dumps({"sid": "SM00000000000000000000000000000000"}).encode(),
+        ),
+        (
+            "fcm",
+            re.compile(r"^/v1/projects/[^/]+/messages:send$"),
+            200,
+            json.dumps({"name": "projects/stand-in/messages/1"}).encode(),
+        ),
+    ]
+
+    UNREGISTERED = json.dumps(
+        {
+            "error": {
+                "code": 404,
+                "message": "Requested entity was not found.",
+                "status": "NOT_FOUND",
+                "details": [
+                    {
+                        "@type": "type.googleapis.com/google.firebase.fcm.v1.FcmError",
+                        "errorCode": "UNREGISTERED",
+                    }
+                ],
+            }
+        }
+    ).encode()
+
+    def do_POST(self):
+        request = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.latency_ms / 1000)
+        for api, path, status, body in self.ROUTES:
+            if path.match(self.path):
+                if api == "fcm" and json.loads(request)["message"]["token"].startswith(
+                    "unregistered"
+                ):
+                    api, status, body = "fcm_unregistered", 404, self.UNREGISTERED
+                with self.server.lock:
+                    self.server.requests[api] += 1
+                break
+        else:
+            status, body = 404, b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def use_stand_ins(latency_ms: float = 20) -> StandIn:
+    """
+    Starts the stand-ins and points the SendGrid, Twilio and Firebase clients to them.
+    """
+
+    stand_in = StandIn(latency_ms).start()
+    SENDGRID_CONFIG["host"] = stand_in.url
+    WhatsappClient.api.base_url = stand_in.url
+    messaging._MessagingService.FCM_URL = (
+        stand_in.url + "/v1/projects/{0}/messages:send"
+    )
+    firebase_admin.initialize_app(
+        StandInCredential(), options={"projectId": "stand-in"}, name="[DEFAULT]"
+    )
+    return stand_in
@@ -0,0 +1,71 @@
+"""
+Benchmark of the startup of the processes: seconds and max RSS to `import app` (like
+every API worker, test run and job process does), and to load the prediction models
+after it (like the first prediction, or the warm-up, does).
+
+Every measure runs in a new interpreter, REPEAT times, and the median is reported.
+
+Usage (from the src folder):
+    PYTHONPATH=. python ../scripts/benchmarks/startup.py
+"""
+import json
+import statistics
+import subprocess
+import sys
+
+from utils import print_table
+
+REPEAT = 5
+
+MEASURE = """
+import json, resource, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+loaded = None
+try:
+    from api.prediction.registry import warm_up
+except ImportError:
+    pass  # The models were loaded by the import
+else:
+    start = time.perf_counter()
+    warm_up(["by_image", "by_symptom"])
+    loaded = time.perf_counter() - start
+print(json.dumps({
+    "imported": imported,
+    "rss": rss,
+    "loaded": loaded,
+    "loaded_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+"""
+
+
+def measure() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    runs = [measure() for _ in range(REPEAT)]
+    loaded = [run["loaded"] for run in runs if run["loaded"] is not None]
+    print(f"Startup of a process (median of {REPEAT}):")
+    print_table(
+        [
+            {
+                "import app (s)": statistics.median(run["imported"] for run in runs),
+                "RSS (MB)": statistics.median(run["rss"] for run in runs) / 1024,
+                "load models (s)": statistics.median(loaded) if loaded else "-",
+                "RSS with models (MB)": statistics.median(
+                    run["loaded_rss"] for run in runs
+                )
+                / 1024,
+            }
+        ]
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark of the predictions by symptoms: latency per call of the model by symptom with
+the features built as a DataFrame of every symptom (like predict_by_symptoms did) and as
+a NumPy row (predict_symptoms), for random sets of symptoms.
+
+Usage (from the src folder):
+    PYTHONPATH=. python ../scripts/benchmarks/symptom_prediction.py [calls]
+"""
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from utils import print_table
+
+from api.prediction.registry import get_model
+from api.prediction.service import predict_symptoms
+
+
+def predict_symptoms_with_dataframe(symptoms_typed: list[str]) -> list[dict]:
+    model = get_model("by_symptom")
+    symptoms = model.feature_names_in_
+    for symptom in symptoms_typed:
+        if symptom not in symptoms:
+            raise ValueError(symptom)
+    symptoms_df = pd.DataFrame(
+        [{**{s: 0 for s in symptoms}, **{s: 1 for s in symptoms_typed}}]
+    )
+    probabilities = model.predict_proba(symptoms_df.reindex(columns=symptoms))
+    predictions = np.argsort(probabilities[0])[-5:][::-1]
+    return [
+        {"disease": model.classes_[i], "probability": probabilities[0][i]}
+        for i in predictions
+    ]
+
+
+def measure(name: str, predict, inputs: list[list[str]]) -> dict:
+    latencies = []
+    for symptoms_typed in inputs:
+        start = time.perf_counter()
+        predict(symptoms_typed)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "features": name,
+        "median_ms": statistics.median(latencies),
+        "p99_ms": latencies[int(len(latencies) * 0.99)],
+    }
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    symptoms = list(get_model("by_symptom").feature_names_in_)
+    generator = random.Random(0)
+    inputs = [generator.sample(symptoms, generator.randint(1, 6)) for _ in range(calls)]
+    # Loads the model and the columns before measuring
+    predict_symptoms(inputs[0])
+
+    different = sum(
+        predict_symptoms(i) != predict_symptoms_with_dataframe(i) for i in inputs
+    )
+    rows = [
+        measure("DataFrame", predict_symptoms_with_dataframe, inputs),
+        measure("NumPy", predict_symptoms, inputs),
+    ]
+    print(f"{calls} predictions by symptoms ({different} with different results):")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
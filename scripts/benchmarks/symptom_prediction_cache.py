@@ -0,0 +1,68 @@
+"""
+Benchmark of the cache of the predictions by symptoms: latency per call and hit ratio
+without the cache (predict_symptoms) and with it (predict_symptoms_cached), for calls
+whose sets of symptoms are drawn from SETS sets with a Zipf distribution, like the
+common complaints (a headache, a fever...) that most users type.
+
+Usage (from the src folder):
+    PYTHONPATH=. python ../scripts/benchmarks/symptom_prediction_cache.py [calls]
+"""
+import random
+import statistics
+import sys
+import time
+
+from utils import print_table
+
+from api.prediction.registry import get_model
+from api.prediction.service import (
+    predict_symptoms,
+    predict_symptoms_cached,
+    predictions_cache,
+)
+
+SETS = 2000
+
+
+def measure(name: str, predict, inputs: list[list[str]]) -> dict:
+    hits, misses = predictions_cache.hits, predictions_cache.misses
+    latencies = []
+    for symptoms_typed in inputs:
+        start = time.perf_counter()
+        predict(symptoms_typed)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    hits, misses = predictions_cache.hits - hits, predictions_cache.misses - misses
+    return {
+        "predictions": name,
+        "hit ratio": hits / max(hits + misses, 1),
+        "median_ms": statistics.median(latencies),
+        "p99_ms": latencies[int(len(latencies) * 0.99)],
+        "total_s": sum(latencies) / 1000,
+    }
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    symptoms = list(get_model("by_symptom").feature_names_in_)
+    generator = random.Random(0)
+    sets = [generator.sample(symptoms, generator.randint(1, 4)) for _ in range(SETS)]
+    weights = [1 / rank for rank in range(1, SETS + 1)]
+    inputs = [
+        # The same symptoms are typed in any order
+        generator.sample(symptoms_typed, len(symptoms_typed))
+        for symptoms_typed in generator.choices(sets, weights, k=calls)
+    ]
+    # Loads the model and the columns before measuring
+    predict_symptoms(inputs[0])
+
+    rows = [
+        measure("uncached", predict_symptoms, inputs),
+        measure("cached", predict_symptoms_cached, inputs),
+    ]
+    print(f"{calls} predictions by symptoms of {SETS} sets of symptoms (Zipf):")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
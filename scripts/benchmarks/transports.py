@@ -0,0 +1,118 @@
+"""
+Benchmark of the transports of SendGrid and Twilio: messages per second sent with a new
+SDK client for every email and the shared Twilio SDK client (like the worker did before
+the transports, with a thread for every message that can be sent at once), and with the
+pooled transports, against local stand-ins that answer after LATENCY_MS.
+
+Usage (from the src folder):
+    PYTHONPATH=. python ../scripts/benchmarks/transports.py [messages]
+"""
+import os
+
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "AC00000000000000000000000000000000")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "stand-in")
+
+import asyncio  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+from concurrent.futures import ThreadPoolExecutor  # noqa: E402
+
+from sendgrid import Mail, SendGridAPIClient  # noqa: E402
+from stand_ins import use_stand_ins  # noqa: E402
+from utils import print_table  # noqa: E402
+
+from api.notification.transports import SendGridTransport, TwilioTransport  # noqa: E402
+from config import (  # noqa: E402
+    OUTBOX_CONCURRENCY,
+    SENDGRID_CONFIG,
+    TWILIO_NUMBER,
+    WhatsappClient,
+)
+
+LATENCY_MS = 20
+
+EMAIL = {
+    "to": "user@benchmark.com",
+    "hi_message": "Hola!",
+    "message": "Te queda poco stock de Ibuprofeno",
+    "subject": "Stock bajo",
+}
+WHATSAPP = {"to": "+5493510000000", "message": "Te queda poco stock de Ibuprofeno"}
+
+
+def send_email_with_sdk(payload: dict):
+    message = Mail(from_email="app@benchmark.com", to_emails=payload["to"])
+    message.template_id = "d-5e634cd5cd6548b4b440f188c1d2a40a"
+    message.dynamic_template_data = {
+        "hi_message": payload["hi_message"],
+        "message": payload["message"],
+        "subject": payload["subject"],
+    }
+    SendGridAPIClient("stand-in", host=SENDGRID_CONFIG["host"]).send(message)
+
+
+def send_whatsapp_with_sdk(payload: dict):
+    WhatsappClient.messages.create(
+        from_=f"whatsapp:{TWILIO_NUMBER}",
+        body=payload["message"],
+        to=f"whatsapp:{payload['to']}",
+    )
+
+
+def run_sdk(sender, payload: dict, messages: int, concurrency: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(sender, [payload] * messages))
+    return time.perf_counter() - start
+
+
+async def run_transport(transport, payload: dict, messages: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send():
+        async with semaphore:
+            await transport.send(payload)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[send() for _ in range(messages)])
+    seconds = time.perf_counter() - start
+    await transport.close()
+    return seconds
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    stand_in = use_stand_ins(LATENCY_MS)
+    rows = []
+    for channel, payload, sdk_sender, transport_class in [
+        ("email", EMAIL, send_email_with_sdk, SendGridTransport),
+        ("whatsapp", WHATSAPP, send_whatsapp_with_sdk, TwilioTransport),
+    ]:
+        concurrency = OUTBOX_CONCURRENCY[channel]
+        # The stand-ins have no rate limits
+        transport = transport_class(stand_in.url, rate=10_000, connections=concurrency)
+        for sender, seconds in [
+            (
+                "sdk",
+                run_sdk(sdk_sender, payload, messages, concurrency),
+            ),
+            (
+                "transport",
+                asyncio.run(run_transport(transport, payload, messages, concurrency)),
+            ),
+        ]:
+            rows.append(
+                {
+                    "channel": channel,
+                    "sender": sender,
+                    "concurrency": concurrency,
+                    "messages": messages,
+                    "seconds": seconds,
+                    "per_second": messages / seconds,
+                }
+            )
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
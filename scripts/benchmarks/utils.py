@@ -0,0 +1,90 @@
+"""
+Helpers shared by the benchmark scripts.
+
+The benchmarks talk to the database configured in DB_URL and must be run from the
+src folder, i.e.:
+
+    cd src
+    PYTHONPATH=. python ../scripts/benchmarks/<benchmark>.py
+"""
+import statistics
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import insert
+
+from api.user.models import User
+from database import Base, database, engine
+
+QUERY_METHODS = ["fetch_all", "fetch_one", "fetch_val", "execute", "execute_many"]
+
+
+def create_tables():
+    """
+    Creates the tables of the models imported by the benchmark, if they are missing.
+    """
+
+    Base.metadata.create_all(bind=engine)
+
+
+@contextmanager
+def count_queries():
+    """
+    Counts the queries sent through the `database` object while the context is open.
+    """
+
+    counter = {"queries": 0}
+    originals = {method: getattr(database, method) for method in QUERY_METHODS}
+
+    def wrap(method):
+        async def wrapper(*args, **kwargs):
+            counter["queries"] += 1
+            return await originals[method](*args, **kwargs)
+
+        return wrapper
+
+    for method in QUERY_METHODS:
+        setattr(database, method, wrap(method))
+    try:
+        yield counter
+    finally:
+        for method, original in originals.items():
+            setattr(database, method, original)
+
+
+async def timeit(function, *args, repeat: int = 10, **kwargs) -> dict:
+    """
+    Awaits `function` `repeat` times and returns the median and p99 latency in ms.
+    """
+
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await function(*args, **kwargs)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "median_ms": statistics.median(latencies),
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+    }
+
+
+async def create_user(user_id: str) -> User:
+    insert_query = (
+        insert(User)
+        .values(id=user_id, email=f"{user_id}@benchmark.com", invitation=user_id)
+        .returning(User)
+    )
+    return User(**await database.fetch_one(query=insert_query))
+
+
+def print_table(rows: list[dict]):
+    columns = list(rows[0].keys())
+    widths = [max(len(str(c)), *(len(_format(r[c])) for r in rows)) for c in columns]
+    print("  ".join(str(c).rjust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(_format(row[c]).rjust(w) for c, w in zip(columns, widths)))
+
+
+def _format(value) -> str:
+    return f"{value:.2f}" if isinstance(value, float) else str(value)
@@ -34,6 +34,34 @@ async def get_appointments(
     return await database.fetch_all(query=select_query)
 
 
+async def get_users_appointments(
+    users_ids: list[str], start: datetime, end: datetime
+) -> dict[str, list[Appointment]]:
+    """
+    Get appointments of many users.
+
+    Retrieves appointments for the specified users within the specified time range, with a single query.
+
+    Args:
+        users_ids (list[str]): The IDs of the users.
+        start (datetime): The start datetime of the time range.
+        end (datetime): The end datetime of the time range.
+
+    Returns:
+        dict[str, list[Appointment]]: The list of appointments of each user, by user ID.
+    """
+
+    select_query = select(Appointment).where(
+        Appointment.user_id.in_(users_ids),
+        Appointment.date >= start,
+        Appointment.date <= end,
+    )
+    appointments = {}
+    for appointment in await database.fetch_all(query=select_query):
+        appointments.setdefault(appointment.user_id, []).append(appointment)
+    return appointments
+
+
 async def create_appointment(
     user: User, appointment: CreateUpdateAppointmentSchema
 ) -> Appointment:
@@ -1,9 +1,12 @@
+import secrets
+
 from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from firebase_admin import auth
 
 from api.user.models import User
 from api.user.service import assert_device, get_or_create_user
+from config import INTERNAL_TOKEN, PROD
 
 
 async def authenticate(
@@ -42,3 +45,28 @@ async def authenticate(
     if device:
         await assert_device(user, device)
     return user
+
+
+async def authenticate_internal(
+    cred: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
+):
+    """
+    Authenticate a caller of the internal routes (i.e. the monitoring) with a Bearer token,
+    the INTERNAL_TOKEN. If it is not set, the internal routes are open outside production
+    and closed in production.
+
+    Args:
+        cred (HTTPAuthorizationCredentials): The HTTP authorization credentials.
+    """
+
+    if INTERNAL_TOKEN is None and not PROD:
+        return
+    if (
+        INTERNAL_TOKEN is None
+        or cred is None
+        or not secrets.compare_digest(cred.credentials, INTERNAL_TOKEN)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Internal authentication required",
+        )
@@ -3,7 +3,7 @@ import random
 from typing import Literal
 
 import requests
-from fastapi import APIRouter, BackgroundTasks
+from fastapi import APIRouter, BackgroundTasks, Depends
 from firebase_admin import auth, messaging
 from firebase_admin._auth_utils import UserNotFoundError
 from pydantic import BaseModel, EmailStr
@@ -12,14 +12,24 @@ from sqlalchemy import insert, select
 
 import database
 from api.appointment.models import Appointment
+from api.auth.dependencies import authenticate_internal
 from api.measurement.models import Measurement
 from api.medicine.models import Medicine
+from api.medicine.service import fill_scheduled_doses
+from api.prediction.service import get_predictions_stats
 from api.supervisor.service import accept_invitation
 from api.user.models import User
+from cache import get_caches_stats
 from config import FIREBASE_KEY, SENDGRID_CONFIG, TWILIO_NUMBER, WhatsappClient
 from database import Base, engine
 
 router = APIRouter(prefix="/dev", tags=["Developer_Tools"])
+# Internals of the API, which production only serves with the INTERNAL_TOKEN
+stats_router = APIRouter(
+    prefix="/dev",
+    tags=["Developer_Tools"],
+    dependencies=[Depends(authenticate_internal)],
+)
 
 
 class UserRequestModel(BaseModel):  # pragma: no cover
@@ -99,6 +109,16 @@ def register(user: UserRequestModel):  # pragma: no cover
         print(response.json())
 
 
+@stats_router.get("/cache-stats")
+def cache_stats():
+    return get_caches_stats()
+
+
+@stats_router.get("/prediction-stats")
+def prediction_stats():
+    return get_predictions_stats()
+
+
 @router.post("/reset-database")
 def reset_database():  # pragma: no cover
     Base.metadata.drop_all(bind=engine)
@@ -161,7 +181,7 @@ def send_notification(
 
 
 @router.post("/load-example-data")
-async def load_example_data(background_tasks: BackgroundTasks):  # pragma: no cover
+async def load_example_data():  # pragma: no cover
     def assure_user_exists(email):
         try:
             return auth.get_user_by_email(email).uid
@@ -234,13 +254,13 @@ async def load_example_data(background_tasks: BackgroundTasks):  # pragma: no co
     )
 
     # # Ignacio supervises Lorenzo and Sofía, Sofía supervises Lorenzo, Lorenzo supervises Ignacio
-    await accept_invitation(user_loren, user_igna.invitation, background_tasks)
+    await accept_invitation(user_loren, user_igna.invitation)
     user_igna = await db.fetch_one(query=select(User).where(User.id == user_igna.id))
-    await accept_invitation(user_loren, user_sofi.invitation, background_tasks)
+    await accept_invitation(user_loren, user_sofi.invitation)
     user_sofi = await db.fetch_one(query=select(User).where(User.id == user_sofi.id))
-    await accept_invitation(user_sofi, user_igna.invitation, background_tasks)
+    await accept_invitation(user_sofi, user_igna.invitation)
     user_igna = await db.fetch_one(query=select(User).where(User.id == user_igna.id))
-    await accept_invitation(user_igna, user_loren.invitation, background_tasks)
+    await accept_invitation(user_igna, user_loren.invitation)
     user_loren = await db.fetch_one(query=select(User).where(User.id == user_loren.id))
 
     test_medicines = [
@@ -301,6 +321,7 @@ async def load_example_data(background_tasks: BackgroundTasks):  # pragma: no co
             await db.execute(
                 query=insert(Medicine).values(**test_medicine, user_id=user.id)
             )
+    await fill_scheduled_doses()
 
     test_appointments = [
         {
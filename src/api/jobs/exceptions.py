@@ -0,0 +1,17 @@
+from fastapi import HTTPException
+from starlette import status
+
+from api.exceptions import GenericException
+
+# Jobs has the 9xx errors
+ERROR900 = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST,
+    detail={
+        "code": 900,
+        "description": "The job run does not exist.",
+    },
+)
+
+
+class JobRunDoesNotExist(GenericException):
+    http_exception = ERROR900
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Date, DateTime, Index, Integer, String, Text, text
+
+from models import CRUD
+
+
+class JobRun(CRUD):
+    __tablename__ = "job_run"
+    __table_args__ = (
+        # Only one run of a job (and timezone) can be running at a time
+        Index(
+            "ix_job_run_job_running",
+            "job",
+            text("coalesce(timezone, '')"),
+            unique=True,
+            postgresql_where=text("status = 'running'"),
+        ),
+    )
+
+    RUNNING = "running"
+    FINISHED = "finished"
+    FAILED = "failed"
+
+    job = Column(String(255), nullable=False, index=True)
+    # The timezone of the users of the run, or None for all the users
+    timezone = Column(String(64), nullable=True)
+    date = Column(Date, nullable=False, index=True)  # The day the run belongs to
+    status = Column(String(20), nullable=False)
+    last_id = Column(String(255), nullable=True)  # The last processed primary key
+    finished_at = Column(DateTime, nullable=True)
+
+    users_processed = Column(Integer, nullable=False, server_default="0")
+    notifications_queued = Column(Integer, nullable=False, server_default="0")
+    errors = Column(Integer, nullable=False, server_default="0")
+    error = Column(Text, nullable=True)  # Why the run failed, if it did
@@ -1,5 +1,8 @@
 from fastapi import APIRouter, BackgroundTasks
 
+from api.exceptions import GenericException
+from api.jobs.schemas import JobRunSchema
+from api.jobs.service import get_job_run as get_job_run_service
 from api.jobs.service import (
     send_today_user_appointments_notification as send_today_user_appointments_notification_service,
 )
@@ -9,44 +12,64 @@ from api.jobs.service import (
 from api.jobs.service import (
     send_yesterday_user_didnt_take_medicines_notification as send_yesterday_user_didnt_take_medicines_notification_service,
 )
+from api.jobs.service import trigger_job
+from api.medicine.service import fill_scheduled_doses as fill_scheduled_doses_service
+from api.notification.partitions import (
+    maintain_notification_partitions as maintain_notification_partitions_service,
+)
 
 router = APIRouter(prefix="/jobs", tags=["Jobs"])
 
 
-@router.get(
+@router.post(
     "/send_today_user_appointments_notification",
-    status_code=200,
+    status_code=202,
     summary="Send today user appointments notification",
+    response_model=list[JobRunSchema],
 )
 async def send_today_user_appointments_notification(background_tasks: BackgroundTasks):
     """
     # Send today's user appointments notification
 
     Sends notifications to users about their appointments scheduled for today.
+    The job runs in the background, once for every timezone of the users: the response is
+    the runs, whose progress can be followed in `/jobs/runs/{job_run_id}`. If the job is
+    already running in a timezone, or it already ran today there, the trigger is coalesced
+    with that run.
     """
 
-    await send_today_user_appointments_notification_service(background_tasks)
+    return await trigger_job(
+        send_today_user_appointments_notification_service, background_tasks
+    )
 
 
-@router.get(
+@router.post(
     "/send_today_user_medicines_notification",
-    status_code=200,
+    status_code=202,
     summary="Send today user medicines notification",
+    response_model=list[JobRunSchema],
 )
 async def send_today_user_medicines_notification(background_tasks: BackgroundTasks):
     """
     # Send today's user medicines notification
 
     Sends notifications to users about the medicines they need to take today.
+    The job runs in the background, once for every timezone of the users: the response is
+    the runs, whose progress can be followed in `/jobs/runs/{job_run_id}`. If the job is
+    already running in a timezone, or it already ran today there, the trigger is coalesced
+    with that run.
     """
 
-    await send_today_user_medicines_notification_service(background_tasks)
+    return await trigger_job(
+        send_today_user_medicines_notification_service, background_tasks
+    )
 
 
-@router.get(
+@router.post(
     "/send_yesterday_user_didnt_take_medicines_notification",
-    status_code=200,
+    status_code=202,
     summary="Send yesterday user didnt take medicines notification",
+    response_model=list[JobRunSchema],
 )
 async def send_yesterday_user_didnt_take_medicines_notification(
     background_tasks: BackgroundTasks,
@@ -55,8 +78,65 @@ async def send_yesterday_user_didnt_take_medicines_notification(
     # Send yesterday's user didn't take medicines notification
 
     Sends notifications to users who didn't take their prescribed medicines yesterday.
+    The job runs in the background, once for every timezone of the users: the response is
+    the runs, whose progress can be followed in `/jobs/runs/{job_run_id}`. If the job is
+    already running in a timezone, or it already ran today there, the trigger is coalesced
+    with that run.
     """
 
-    await send_yesterday_user_didnt_take_medicines_notification_service(
-        background_tasks
+    return await trigger_job(
+        send_yesterday_user_didnt_take_medicines_notification_service, background_tasks
     )
+
+
+@router.post(
+    "/fill_scheduled_doses",
+    status_code=200,
+    summary="Fill the scheduled doses of the medicines",
+)
+async def fill_scheduled_doses():
+    """
+    # Fill the scheduled doses of the medicines
+
+    Moves the rolling horizon of the scheduled doses to the current date.
+    It must run daily, before the medicines notifications.
+    """
+
+    await fill_scheduled_doses_service()
+
+
+@router.post(
+    "/maintain_notification_partitions",
+    status_code=200,
+    summary="Maintain the partitions of the notifications",
+)
+async def maintain_notification_partitions():
+    """
+    # Maintain the partitions of the notifications
+
+    Creates the monthly partitions of the next months, and archives and drops the ones
+    older than the retention.
+    It must run daily.
+    """
+
+    await maintain_notification_partitions_service()
+
+
+@router.get(
+    "/runs/{job_run_id}",
+    status_code=200,
+    summary="Get a job run",
+    response_model=JobRunSchema,
+)
+async def get_job_run(job_run_id: int):
+    """
+    # Get a job run
+
+    Returns the status of a run of a job and its progress: the users processed, the
+    notifications queued and the users that failed.
+    """
+
+    try:
+        return await get_job_run_service(job_run_id)
+    except GenericException as e:
+        raise e.http_exception
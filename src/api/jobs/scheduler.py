@@ -0,0 +1,190 @@
+import asyncio
+import contextvars
+import logging
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from croniter import croniter
+from sqlalchemy import func, select
+
+from api.jobs.service import (
+    execute_job_run,
+    get_interrupted_job_runs,
+    get_timezones,
+    send_today_user_appointments_notification,
+    send_today_user_medicines_notification,
+    send_yesterday_user_didnt_take_medicines_notification,
+    start_job_run,
+)
+from api.medicine.service import fill_scheduled_doses
+from api.notification.partitions import maintain_notification_partitions
+from config import DEFAULT_TIMEZONE, JOBS_CRON
+from database import database
+
+# Key of the Postgres advisory lock held by the replica that runs the scheduler
+SCHEDULER_LOCK_KEY = 5_034_781_209
+SCHEDULER_TICK_SECONDS = 30
+
+USERS_JOBS = {
+    job.__name__: job
+    for job in [
+        send_today_user_appointments_notification,
+        send_today_user_medicines_notification,
+        send_yesterday_user_didnt_take_medicines_notification,
+    ]
+}
+# The jobs that are not per user, they run once in DEFAULT_TIMEZONE
+MAINTENANCE_JOBS = {
+    job.__name__: job
+    for job in [fill_scheduled_doses, maintain_notification_partitions]
+}
+
+logger = logging.getLogger(__name__)
+
+
+def get_next_fire(cron: str, timezone_name: str, after: datetime) -> datetime:
+    """
+    Gets the next time a cron expression fires in a timezone.
+
+    Args:
+        cron (str): The cron expression, i.e. "0 7 * * *".
+        timezone_name (str): The IANA name of the timezone of the expression.
+        after (datetime): An aware datetime.
+
+    Returns:
+        datetime: The aware datetime of the next fire, strictly after `after`.
+    """
+
+    return croniter(cron, after.astimezone(ZoneInfo(timezone_name))).get_next(datetime)
+
+
+async def run_job(job: str, timezone_name: str):
+    """
+    Runs a job from the scheduler, with the users of a timezone.
+
+    The run is started like any trigger of the job, so it is coalesced with a run of the
+    same job and timezone that is already running.
+
+    Args:
+        job (str): The name of the job.
+        timezone_name (str): The IANA name of the timezone.
+    """
+
+    if job in MAINTENANCE_JOBS:
+        await MAINTENANCE_JOBS[job]()
+        return
+
+    job_run, started = await start_job_run(job, timezone_name)
+    if started:
+        await execute_job_run(USERS_JOBS[job], job_run)
+
+
+class Scheduler:
+    """
+    Runs the jobs in-process at the cron expressions of JOBS_CRON.
+
+    The jobs of the users are run once for every timezone of the users, at the time of the
+    cron expression in that timezone, which also spreads the notifications along the day
+    instead of sending them all at once. The rest of the jobs fire in DEFAULT_TIMEZONE.
+
+    Every replica of the app runs a scheduler, but only the one that holds a Postgres
+    advisory lock (the leader) fires the jobs. The lock is held by a connection of the
+    leader, so if the leader dies, another replica takes the lock on its next tick. A fire
+    that happens while there is no leader is skipped until the next one.
+
+    The leader resumes the runs of today that were interrupted: when it takes over, the ones
+    the previous leader failed (or cancelled when it stopped), and on every tick, the ones
+    whose process died without marking them.
+    """
+
+    def __init__(self, jobs_cron: dict[str, str] = JOBS_CRON):
+        self.jobs_cron = jobs_cron
+        self.next_fires: dict[tuple[str, str], datetime] = {}
+        self.tasks: set[asyncio.Task] = set()
+        # The jobs and timezones with a run in this process
+        self.running: set[tuple[str, str]] = set()
+        self.stopped = asyncio.Event()
+
+    def start(self):
+        self.create_task(self.run())
+
+    async def stop(self):
+        self.stopped.set()
+        tasks = list(self.tasks)
+        for task in tasks:
+            # The runs of the cancelled jobs are marked as failed, the next leader resumes them
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def create_task(self, coroutine) -> asyncio.Task:
+        # Every task has a fresh context, so it takes its own connection from the pool
+        task = contextvars.Context().run(asyncio.create_task, coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def run(self):
+        while not self.stopped.is_set():
+            try:
+                async with database.connection() as connection:
+                    lock_query = select(func.pg_try_advisory_lock(SCHEDULER_LOCK_KEY))
+                    if await connection.fetch_val(query=lock_query):
+                        try:
+                            await self.lead()
+                        finally:
+                            unlock_query = select(
+                                func.pg_advisory_unlock(SCHEDULER_LOCK_KEY)
+                            )
+                            await connection.execute(query=unlock_query)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("The scheduler failed")
+            self.next_fires = {}
+            await self.sleep()
+
+    async def lead(self):
+        # On takeover, the failed runs are resumed too
+        failed = True
+        while not self.stopped.is_set():
+            # The query also checks that the connection that holds the lock is alive
+            timezones = await get_timezones()
+            now = datetime.now(timezone.utc)
+            for job, cron in self.jobs_cron.items():
+                for timezone_name in (
+                    timezones if job in USERS_JOBS else [DEFAULT_TIMEZONE]
+                ):
+                    self.fire(job, timezone_name, cron, now)
+            await self.resume_job_runs(failed)
+            failed = False
+            await self.sleep()
+
+    def fire(self, job: str, timezone_name: str, cron: str, now: datetime):
+        key = (job, timezone_name)
+        if key in self.next_fires and self.next_fires[key] <= now:
+            self.create_task(self.run_job(job, timezone_name))
+        if key not in self.next_fires or self.next_fires[key] <= now:
+            self.next_fires[key] = get_next_fire(cron, timezone_name, now)
+
+    async def resume_job_runs(self, failed: bool = False):
+        for job_run in await get_interrupted_job_runs(failed):
+            key = (job_run.job, job_run.timezone)
+            if job_run.job in USERS_JOBS and key not in self.running:
+                logger.info("Resuming the job %s in %s", *key)
+                self.create_task(self.run_job(*key))
+
+    async def run_job(self, job: str, timezone_name: str):
+        key = (job, timezone_name)
+        self.running.add(key)
+        try:
+            await run_job(job, timezone_name)
+        except Exception:
+            logger.exception("The job %s failed in %s", job, timezone_name)
+        finally:
+            self.running.discard(key)
+
+    async def sleep(self):
+        try:
+            await asyncio.wait_for(self.stopped.wait(), SCHEDULER_TICK_SECONDS)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,36 @@
+import datetime
+
+from pydantic import BaseModel
+
+
+class JobRunSchema(BaseModel):
+    id: int
+    job: str
+    timezone: str | None
+    date: datetime.date
+    status: str
+    created_at: datetime.datetime
+    finished_at: datetime.datetime | None
+
+    users_processed: int
+    notifications_queued: int
+    errors: int
+    error: str | None
+
+    class Config:
+        orm_mode = True
+        schema_extra = {
+            "example": {
+                "id": 123456789,
+                "job": "send_today_user_medicines_notification",
+                "timezone": "America/Argentina/Cordoba",
+                "date": datetime.date.today(),
+                "status": "running",
+                "created_at": datetime.datetime.now(),
+                "finished_at": None,
+                "users_processed": 1500,
+                "notifications_queued": 1200,
+                "errors": 0,
+                "error": None,
+            }
+        }
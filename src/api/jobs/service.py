@@ -1,178 +1,616 @@
+import asyncio
+import contextvars
+import logging
+from collections import deque
 from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+from zoneinfo import ZoneInfo
 
 from fastapi import BackgroundTasks
-from sqlalchemy import select
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-from api.appointment.service import get_appointments
-from api.medicine.service import get_consumptions_on_date, get_medicine
+from api.appointment.service import get_users_appointments
+from api.jobs.exceptions import JobRunDoesNotExist
+from api.jobs.models import JobRun
+from api.medicine.models import Consumption, ScheduledConsumption
+from api.medicine.service import get_medicines_names, get_users_consumptions_on_date
 from api.notification.models.message import (
+    Message,
     TodayUserAppointments,
     TodayUserMedicines,
     YesterdarUserDidntTakeMedicine,
 )
-from api.notification.service import send_notification
-from api.supervisor.service import get_supervised
+from api.notification.service import send_notifications_bulk
+from api.supervisor.service import get_users_supervised
 from api.user.models import User
-from database import database
+from config import DEFAULT_TIMEZONE, JOB_RUN_TIMEOUT_MINUTES, JOBS_CONCURRENCY
+from database import database, iterate_in_chunks
 
+USERS_CHUNK_SIZE = 500
 
-async def send_today_user_appointments_notification(background_tasks: BackgroundTasks):
+logger = logging.getLogger(__name__)
+
+
+def get_now(timezone: str | None = None) -> datetime:
     """
-    Sends notifications to users about their appointments scheduled for today.
+    Gets the current date and time in a timezone, or in the server timezone if it's None.
+
+    Args:
+        timezone (str | None, optional): The IANA name of the timezone. Defaults to None.
+
+    Returns:
+        datetime: The naive current date and time.
     """
 
-    select_query = select(User)
-    users = await database.fetch_all(query=select_query)
-    for user in users:
-        user = User(**user)
-        appointments = await get_appointments(
-            user,
-            datetime.now().replace(hour=0, minute=0, second=0, microsecond=0),
-            datetime.now().replace(hour=23, minute=59, second=59, microsecond=0),
+    if timezone is None:
+        return datetime.now()
+    return datetime.now(ZoneInfo(timezone)).replace(tzinfo=None)
+
+
+def get_job_run_users(job_run: JobRun) -> list:
+    """
+    Gets the conditions of the users of a run: the users whose timezone is the one of the
+    run (the users without timezone are in DEFAULT_TIMEZONE), or every user if it has none.
+    """
+
+    if job_run.timezone is None:
+        return []
+    return [func.coalesce(User.timezone, DEFAULT_TIMEZONE) == job_run.timezone]
+
+
+async def start_job_run(job: str, timezone: str = None) -> tuple[JobRun, bool]:
+    """
+    Starts a run of a job, unless the job is already running or already ran today.
+
+    While a run makes progress, new triggers of the job are coalesced with it. If the run
+    did not save a checkpoint in JOB_RUN_TIMEOUT_MINUTES it is considered dead: a run of
+    today is taken over and resumed after its last processed user, and a run of an older
+    day is marked as failed and replaced by a new one. The triggers after a run of today
+    finished are coalesced with it, so the users are notified once a day, and if the last
+    run of today failed, the new run resumes after its last processed user.
+
+    Args:
+        job (str): The name of the job.
+        timezone (str, optional): Only run the job for the users of this timezone.
+                                  Defaults to None, i.e. for all the users.
+
+    Returns:
+        tuple[JobRun, bool]: The run of the job, and whether the caller has to execute it
+                             (False if the trigger was coalesced with a live or finished
+                             run).
+    """
+
+    today = get_now(timezone).date()
+    select_query = select(JobRun).where(
+        JobRun.job == job,
+        JobRun.timezone.is_not_distinct_from(timezone),
+        JobRun.status == JobRun.RUNNING,
+    )
+    job_run = await database.fetch_one(query=select_query)
+    if job_run:
+        job_run = JobRun(**job_run)
+        resume = job_run.date == today
+        # make_interval(years, months, weeks, days, hours, mins)
+        timeout = func.make_interval(0, 0, 0, 0, 0, JOB_RUN_TIMEOUT_MINUTES)
+        update_query = (
+            update(JobRun)
+            .where(
+                JobRun.id == job_run.id,
+                JobRun.status == JobRun.RUNNING,
+                JobRun.updated_at <= func.now() - timeout,
+            )
+            .values(
+                updated_at=func.now(),
+                status=JobRun.RUNNING if resume else JobRun.FAILED,
+            )
+            .returning(JobRun)
+        )
+        dead_job_run = await database.fetch_one(query=update_query)
+        if dead_job_run is None:
+            return job_run, False
+        if resume:
+            return JobRun(**dead_job_run), True
+
+    last_query = (
+        select(JobRun)
+        .where(
+            JobRun.job == job,
+            JobRun.timezone.is_not_distinct_from(timezone),
+            JobRun.date == today,
+        )
+        .order_by(JobRun.id.desc())
+        .limit(1)
+    )
+    last_job_run = await database.fetch_one(query=last_query)
+    if last_job_run and last_job_run.status == JobRun.FINISHED:
+        return JobRun(**last_job_run), False
+    last_id = None
+    if last_job_run and last_job_run.status == JobRun.FAILED:
+        last_id = last_job_run.last_id
+
+    insert_query = (
+        pg_insert(JobRun)
+        .values(
+            job=job,
+            timezone=timezone,
+            date=today,
+            status=JobRun.RUNNING,
+            last_id=last_id,
+        )
+        .on_conflict_do_nothing()
+        .returning(JobRun)
+    )
+    job_run = await database.fetch_one(query=insert_query)
+    if job_run is None:
+        # Another trigger started the job first
+        return JobRun(**await database.fetch_one(query=select_query)), False
+    return JobRun(**job_run), True
+
+
+async def update_job_run(
+    job_run: JobRun, users: list[User], notifications: int, errors: int
+):
+    """
+    Saves the progress of a run after processing a chunk of users.
+
+    The last user of the chunk is the checkpoint from which the run is resumed if it is
+    interrupted, and the counters are added to the ones of the run.
+
+    Args:
+        job_run (JobRun): The run of the job.
+        users (list[User]): The processed chunk of users.
+        notifications (int): The number of notifications queued for the chunk.
+        errors (int): The number of users of the chunk that failed.
+    """
+
+    update_query = (
+        update(JobRun)
+        .where(JobRun.id == job_run.id)
+        .values(
+            last_id=users[-1].id,
+            users_processed=JobRun.users_processed + len(users),
+            notifications_queued=JobRun.notifications_queued + notifications,
+            errors=JobRun.errors + errors,
         )
-        supervised_users = await get_supervised(user)
-        supervised_appointments = [
+    )
+    await database.execute(query=update_query)
+
+
+async def finish_job_run(job_run: JobRun):
+    """
+    Marks a run as finished.
+    """
+
+    update_query = (
+        update(JobRun)
+        .where(JobRun.id == job_run.id)
+        .values(status=JobRun.FINISHED, finished_at=func.now())
+    )
+    await database.execute(query=update_query)
+
+
+async def fail_job_run(job_run: JobRun, error: Exception):
+    """
+    Marks a run as failed, with its error.
+    """
+
+    update_query = (
+        update(JobRun)
+        .where(JobRun.id == job_run.id)
+        .values(
+            status=JobRun.FAILED,
+            finished_at=func.now(),
+            error=f"{type(error).__name__}: {error}",
+        )
+    )
+    await database.execute(query=update_query)
+
+
+async def execute_job_run(job, job_run: JobRun):
+    """
+    Executes a run of a job. If the job fails, or it is cancelled, the run is marked as
+    failed instead of staying running, which would coalesce the triggers of the job with it
+    until it times out.
+
+    Args:
+        job: The job, a function that receives the run.
+        job_run (JobRun): The run of the job.
+    """
+
+    try:
+        await job(job_run)
+    except Exception as error:
+        logger.exception("The run %s of the job %s failed", job_run.id, job_run.job)
+        await fail_job_run(job_run, error)
+    except asyncio.CancelledError as error:
+        logger.warning(
+            "The run %s of the job %s was cancelled", job_run.id, job_run.job
+        )
+        await fail_job_run(job_run, error)
+        raise
+
+
+async def get_job_run(job_run_id: int) -> JobRun:
+    """
+    Gets a run of a job, with its progress.
+
+    Args:
+        job_run_id (int): The ID of the run.
+
+    Returns:
+        JobRun: The run of the job.
+    """
+
+    select_query = select(JobRun).where(JobRun.id == job_run_id)
+    job_run = await database.fetch_one(query=select_query)
+    if not job_run:
+        raise JobRunDoesNotExist
+    return JobRun(**job_run)
+
+
+async def get_interrupted_job_runs(failed: bool = False) -> list[JobRun]:
+    """
+    Gets the runs of today that were interrupted before finishing, to resume them.
+
+    Only the last run of every job and timezone counts, and today is the date in the
+    timezone of the run. A run was interrupted if it is still running but did not save a
+    checkpoint in JOB_RUN_TIMEOUT_MINUTES, i.e. its process died.
+
+    Args:
+        failed (bool, optional): Whether the failed runs, i.e. the cancelled ones, were
+                                 interrupted too. Defaults to False.
+
+    Returns:
+        list[JobRun]: The interrupted runs.
+    """
+
+    last_query = (
+        select(JobRun)
+        .distinct(JobRun.job, JobRun.timezone)
+        .where(
+            JobRun.timezone.is_not(None),
+            JobRun.date == func.date(func.timezone(JobRun.timezone, func.now())),
+        )
+        .order_by(JobRun.job, JobRun.timezone, JobRun.id.desc())
+        .subquery()
+    )
+    # make_interval(years, months, weeks, days, hours, mins)
+    timeout = func.make_interval(0, 0, 0, 0, 0, JOB_RUN_TIMEOUT_MINUTES)
+    interrupted = [
+        and_(
+            last_query.c.status == JobRun.RUNNING,
+            last_query.c.updated_at <= func.now() - timeout,
+        )
+    ]
+    if failed:
+        interrupted.append(last_query.c.status == JobRun.FAILED)
+    select_query = select(last_query).where(or_(*interrupted))
+    return [JobRun(**row) for row in await database.fetch_all(query=select_query)]
+
+
+async def get_timezones() -> list[str]:
+    """
+    Gets the timezones of the users, where the users without timezone are in DEFAULT_TIMEZONE.
+    """
+
+    select_query = select(
+        func.coalesce(User.timezone, DEFAULT_TIMEZONE).label("timezone")
+    ).distinct()
+    return [row.timezone for row in await database.fetch_all(query=select_query)]
+
+
+async def trigger_job(job, background_tasks: BackgroundTasks) -> list[JobRun]:
+    """
+    Triggers a job to run in the background, after the response is sent.
+
+    The job runs once for every timezone of the users, like the scheduler runs it, so the
+    trigger of a timezone is coalesced with the run of the scheduler in it. If the job is
+    already running in a timezone, or it already ran today there, the trigger is coalesced
+    with that run, so the users are never notified twice.
+
+    Args:
+        job: The job, a function that receives the run.
+        background_tasks (BackgroundTasks): The background tasks object.
+
+    Returns:
+        list[JobRun]: The runs that execute the trigger, one for every timezone.
+    """
+
+    job_runs = []
+    for timezone in await get_timezones():
+        job_run, started = await start_job_run(job.__name__, timezone)
+        if started:
+            background_tasks.add_task(execute_job_run, job, job_run)
+        job_runs.append(job_run)
+    return job_runs
+
+
+def get_messages(
+    get_message: Callable[[User], Message | None], users: list[User]
+) -> tuple[list[tuple[Message, User]], int]:
+    """
+    Gets the message of every user that has to be notified.
+
+    If the message of a user fails, the error is logged and the rest of the users are
+    processed anyway.
+
+    Args:
+        get_message (Callable[[User], Message | None]): The function that gets the message
+                                                         of a user, or None if there is
+                                                         nothing to notify.
+        users (list[User]): The users.
+
+    Returns:
+        tuple[list[tuple[Message, User]], int]: The messages and their users, and the
+                                                number of users that failed.
+    """
+
+    messages = []
+    errors = 0
+    for user in users:
+        try:
+            message = get_message(user)
+        except Exception:
+            logger.exception("Job failed for user %s", user.id)
+            errors += 1
+            continue
+        if message is not None:
+            messages.append((message, user))
+    return messages, errors
+
+
+async def process_in_chunks(
+    job_run: JobRun,
+    process_chunk: Callable[[list[User]], Awaitable[tuple[int, int]]],
+    concurrency: int = JOBS_CONCURRENCY,
+):
+    """
+    Processes the users of a run in chunks of USERS_CHUNK_SIZE, with at most `concurrency`
+    chunks at once, so the queries of some chunks run while the others wait for Postgres.
+
+    Every chunk runs in a task with a fresh context, so it takes its own connection from the
+    pool instead of sharing (and waiting for) the connection of the caller. The progress is
+    saved in the order of the chunks: the checkpoint only moves past a chunk when it and all
+    the previous ones have finished, so if the run is interrupted, the chunks that finished
+    after one that did not are processed again when it is resumed.
+
+    Args:
+        job_run (JobRun): The run of the job.
+        process_chunk (Callable[[list[User]], Awaitable[tuple[int, int]]]): The function
+            that processes a chunk of users, which returns the number of notifications
+            queued and the number of users that failed.
+        concurrency (int, optional): The most chunks processed at once. Defaults to JOBS_CONCURRENCY.
+    """
+
+    semaphore = asyncio.Semaphore(concurrency)
+    pending: deque[tuple[list[User], asyncio.Task]] = deque()
+
+    async def process(users: list[User]) -> tuple[int, int]:
+        try:
+            return await process_chunk(users)
+        finally:
+            semaphore.release()
+
+    async def save_finished():
+        while pending and pending[0][1].done():
+            users, task = pending.popleft()
+            await update_job_run(job_run, users, *task.result())
+
+    try:
+        async for users in iterate_in_chunks(
+            User,
+            USERS_CHUNK_SIZE,
+            after=job_run.last_id,
+            where=get_job_run_users(job_run),
+        ):
+            await semaphore.acquire()
+            task = contextvars.Context().run(asyncio.create_task, process(users))
+            pending.append((users, task))
+            await save_finished()
+        while pending:
+            await asyncio.wait([pending[0][1]])
+            await save_finished()
+    except asyncio.CancelledError:
+        # The chunks that already finished are not processed again
+        await save_finished()
+        raise
+    finally:
+        for _, task in pending:
+            task.cancel()
+        await asyncio.gather(*[task for _, task in pending], return_exceptions=True)
+
+
+async def get_users_medicines_on_date(
+    users_ids: list[str], date: datetime, only_not_taken: bool = False
+) -> dict[str, dict]:
+    """
+    Gets the medicines that many users have to take (or did not take) on a date, with their hours.
+
+    Args:
+        users_ids (list[str]): The IDs of the users.
+        date (datetime): The date.
+        only_not_taken (bool, optional): Whether to only consider the consumptions that
+                                         were not taken. Defaults to False.
+
+    Returns:
+        dict[str, dict]: For each user ID, the medicines by ID, i.e.
+                         {"user_id": {1: {"name": "Ibuprofeno", "hours": ["08:00", "20:00"]}}}
+    """
+
+    consumptions = await get_users_consumptions_on_date(users_ids, date, only_not_taken)
+    medicines_names = await get_medicines_names(
+        list(
             {
-                "name": User(**supervised_user).get_fullname(),
-                "appointments": await get_appointments(
-                    supervised_user,
-                    datetime.now().replace(hour=0, minute=0, second=0, microsecond=0),
-                    datetime.now().replace(
-                        hour=23, minute=59, second=59, microsecond=0
-                    ),
-                ),
+                consumption.medicine_id
+                for user_consumptions in consumptions.values()
+                for consumption in user_consumptions
             }
+        )
+    )
+    return {
+        user_id: group_consumptions_by_medicine(user_consumptions, medicines_names)
+        for user_id, user_consumptions in consumptions.items()
+    }
+
+
+def get_users_ids(
+    users: list[User], users_supervised: dict[str, list[User]]
+) -> list[str]:
+    """
+    Gets the IDs of some users and of all their supervised users, without duplicates.
+    """
+
+    return list(
+        {user.id for user in users}
+        | {
+            supervised_user.id
+            for supervised_users in users_supervised.values()
             for supervised_user in supervised_users
-        ]
-        if appointments or supervised_appointments:
-            message = TodayUserAppointments(
-                user=user,
-                appointments=appointments,
-                supervised_appointments=supervised_appointments,
-            )
-            await send_notification(message, user, background_tasks)
+        }
+    )
 
 
-async def send_today_user_medicines_notification(background_tasks: BackgroundTasks):
+def group_consumptions_by_medicine(
+    consumptions: list[Consumption | ScheduledConsumption],
+    medicines_names: dict[int, str],
+) -> dict:
     """
-    Sends notifications to users about the medicines they need to take today.
+    Groups the hours of some consumptions by medicine, as the medicines messages expect them.
     """
 
-    select_query = select(User)
-    users = await database.fetch_all(query=select_query)
-    for user in users:
-        user = User(**user)
-        today_consumptions = await get_consumptions_on_date(
-            user=user,
-            date=datetime.now(),
+    medicines = {}
+    for consumption in consumptions:
+        if consumption.medicine_id not in medicines:
+            medicines[consumption.medicine_id] = {
+                "name": medicines_names[consumption.medicine_id],
+                "hours": [],
+            }
+        medicines[consumption.medicine_id]["hours"].append(
+            consumption.date.strftime("%H:%M")
+        )
+    return medicines
+
+
+async def send_today_user_appointments_notification(
+    job_run: JobRun,
+    concurrency: int = JOBS_CONCURRENCY,
+):
+    """
+    Sends notifications to users about their appointments scheduled for today.
+    """
+
+    now = get_now(job_run.timezone)
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    end = now.replace(hour=23, minute=59, second=59, microsecond=0)
+
+    async def process_chunk(users: list[User]) -> tuple[int, int]:
+        users_supervised = await get_users_supervised([user.id for user in users])
+        appointments = await get_users_appointments(
+            get_users_ids(users, users_supervised),
+            start,
+            end,
         )
-        today_medicines = {}
-        for consumption in today_consumptions:
-            if consumption.medicine_id not in today_medicines:
-                today_medicines[consumption.medicine_id] = {
-                    "name": (await get_medicine(user, consumption.medicine_id)).name,
-                    "hours": [],
+
+        def get_message(user: User) -> Message | None:
+            supervised_appointments = [
+                {
+                    "name": supervised_user.get_fullname(),
+                    "appointments": appointments.get(supervised_user.id, []),
                 }
-            today_medicines[consumption.medicine_id]["hours"].append(
-                consumption.date.strftime("%H:%M")
-            )
-        supervised_today_medicines = []
-        supervised_users = await get_supervised(user)
-        for supervised_user in supervised_users:
-            supervised_today_consumptions = await get_consumptions_on_date(
-                user=User(**supervised_user),
-                date=datetime.now(),
-            )
-            today_medicines_supervised = {
-                consumption.medicine_id: {
-                    "name": (
-                        await get_medicine(
-                            User(**supervised_user), consumption.medicine_id
-                        )
-                    ).name,
-                    "hours": [
-                        consumption.date.strftime("%H:%M")
-                        for consumption in supervised_today_consumptions
-                        if consumption.medicine_id == consumption.medicine_id
-                    ],
+                for supervised_user in users_supervised.get(user.id, [])
+            ]
+            if appointments.get(user.id) or supervised_appointments:
+                return TodayUserAppointments(
+                    user=user,
+                    appointments=appointments.get(user.id, []),
+                    supervised_appointments=supervised_appointments,
+                )
+
+        messages, errors = get_messages(get_message, users)
+        await send_notifications_bulk(messages)
+        return len(messages), errors
+
+    await process_in_chunks(job_run, process_chunk, concurrency)
+    await finish_job_run(job_run)
+
+
+async def send_today_user_medicines_notification(
+    job_run: JobRun,
+    concurrency: int = JOBS_CONCURRENCY,
+):
+    """
+    Sends notifications to users about the medicines they need to take today.
+    """
+
+    async def process_chunk(users: list[User]) -> tuple[int, int]:
+        users_supervised = await get_users_supervised([user.id for user in users])
+        medicines = await get_users_medicines_on_date(
+            get_users_ids(users, users_supervised),
+            get_now(job_run.timezone),
+        )
+
+        def get_message(user: User) -> Message | None:
+            today_medicines = medicines.get(user.id)
+            supervised_today_medicines = [
+                {
+                    "name": supervised_user.get_fullname(),
+                    "medicines": medicines[supervised_user.id],
                 }
-                for consumption in supervised_today_consumptions
-            }
-            if today_medicines_supervised:
-                supervised_today_medicines.append(
-                    {
-                        "name": User(**supervised_user).get_fullname(),
-                        "medicines": today_medicines_supervised,
-                    }
+                for supervised_user in users_supervised.get(user.id, [])
+                if medicines.get(supervised_user.id)
+            ]
+            if today_medicines:
+                return TodayUserMedicines(
+                    user=user,
+                    medicines=today_medicines,
+                    supervised_medicines=supervised_today_medicines,
                 )
 
-        if today_medicines:
-            message = TodayUserMedicines(
-                user=user,
-                medicines=today_medicines,
-                supervised_medicines=supervised_today_medicines,
-            )
-            await send_notification(message, user, background_tasks)
+        messages, errors = get_messages(get_message, users)
+        await send_notifications_bulk(messages)
+        return len(messages), errors
+
+    await process_in_chunks(job_run, process_chunk, concurrency)
+    await finish_job_run(job_run)
 
 
 async def send_yesterday_user_didnt_take_medicines_notification(
-    background_tasks: BackgroundTasks,
+    job_run: JobRun,
+    concurrency: int = JOBS_CONCURRENCY,
 ):
     """
     Sends notifications to users about the medicines they didn't take yesterday.
     """
 
-    select_query = select(User)
-    users = await database.fetch_all(query=select_query)
-    for user in users:
-        user = User(**user)
-        yesterday_consumptions = await get_consumptions_on_date(
-            user=user, date=datetime.now() - timedelta(days=1), only_not_taken=True
+    async def process_chunk(users: list[User]) -> tuple[int, int]:
+        users_supervised = await get_users_supervised([user.id for user in users])
+        medicines = await get_users_medicines_on_date(
+            get_users_ids(users, users_supervised),
+            get_now(job_run.timezone) - timedelta(days=1),
+            only_not_taken=True,
         )
-        yesterday_medicines = {}
-        for consumption in yesterday_consumptions:
-            if consumption.medicine_id not in yesterday_medicines:
-                yesterday_medicines[consumption.medicine_id] = {
-                    "name": (await get_medicine(user, consumption.medicine_id)).name,
-                    "hours": [],
-                }
-            yesterday_medicines[consumption.medicine_id]["hours"].append(
-                consumption.date.strftime("%H:%M")
-            )
-        supervised_today_medicines = []
-        supervised_users = await get_supervised(user)
-        for supervised_user in supervised_users:
-            supervised_today_consumptions = await get_consumptions_on_date(
-                user=User(**supervised_user),
-                date=datetime.now() - timedelta(days=1),
-                only_not_taken=True,
-            )
-            today_medicines = {
-                consumption.medicine_id: {
-                    "name": (
-                        await get_medicine(
-                            User(**supervised_user), consumption.medicine_id
-                        )
-                    ).name,
-                    "hours": [
-                        consumption.date.strftime("%H:%M")
-                        for consumption in supervised_today_consumptions
-                        if consumption.medicine_id == consumption.medicine_id
-                    ],
+
+        def get_message(user: User) -> Message | None:
+            yesterday_medicines = medicines.get(user.id, {})
+            supervised_yesterday_medicines = [
+                {
+                    "name": supervised_user.get_fullname(),
+                    "medicines": medicines[supervised_user.id],
                 }
-                for consumption in supervised_today_consumptions
-            }
-            if today_medicines:
-                supervised_today_medicines.append(
-                    {
-                        "name": User(**supervised_user).get_fullname(),
-                        "medicines": today_medicines,
-                    }
+                for supervised_user in users_supervised.get(user.id, [])
+                if medicines.get(supervised_user.id)
+            ]
+            if yesterday_medicines or supervised_yesterday_medicines:
+                return YesterdarUserDidntTakeMedicine(
+                    user=user,
+                    medicines=yesterday_medicines,
+                    supervised_medicines=supervised_yesterday_medicines,
                 )
-        if yesterday_medicines or supervised_today_medicines:
-            message = YesterdarUserDidntTakeMedicine(
-                user=user,
-                medicines=yesterday_medicines,
-                supervised_medicines=supervised_today_medicines,
-            )
-            await send_notification(message, user, background_tasks)
+
+        messages, errors = get_messages(get_message, users)
+        await send_notifications_bulk(messages)
+        return len(messages), errors
+
+    await process_in_chunks(job_run, process_chunk, concurrency)
+    await finish_job_run(job_run)
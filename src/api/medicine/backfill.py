@@ -0,0 +1,20 @@
+"""
+Backfills the scheduled doses of the existing medicines.
+
+Usage (from the src folder):
+    python -m api.medicine.backfill
+"""
+import asyncio
+
+from api.medicine.service import fill_scheduled_doses
+from database import database
+
+
+async def main():
+    await database.connect()
+    await fill_scheduled_doses()
+    await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
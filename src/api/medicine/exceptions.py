@@ -60,6 +60,13 @@ ERROR307 = HTTPException(
         "description": "This consumption does not exist.",
     },
 )
+ERROR308 = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST,
+    detail={
+        "code": 308,
+        "description": "Too many consumptions in a single request.",
+    },
+)
 
 
 class IntervalAndDays(GenericException):
@@ -92,3 +99,7 @@ class ConsumptionAlreadyExists(GenericException):
 
 class ConsumptionDoesNotExist(GenericException):
     http_exception = ERROR307
+
+
+class TooManyConsumptions(GenericException):
+    http_exception = ERROR308
@@ -1,7 +1,16 @@
 import datetime
 
 from dateutil.rrule import DAILY, WEEKLY, rrule
-from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, String
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+)
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import expression
@@ -43,6 +52,23 @@ class Consumption(CRUD):
             raise InvalidHour
 
 
+class ScheduledConsumption:
+    """
+    A scheduled consumption that has not been taken, so it does not exist on the database.
+
+    It exposes the same attributes as a Consumption returned by get_consumptions, but
+    without the SQLAlchemy instrumentation, since thousands of them can be built per request.
+    """
+
+    __slots__ = ("medicine_id", "date", "real_consumption_date", "consumed")
+
+    def __init__(self, medicine_id: int, date: datetime.datetime):
+        self.medicine_id = medicine_id
+        self.date = date
+        self.real_consumption_date = date
+        self.consumed = False
+
+
 class Medicine(CRUD):
     __tablename__ = "medicine"
 
@@ -53,6 +79,11 @@ class Medicine(CRUD):
 
     stock = Column(Integer, nullable=True)
     stock_warning = Column(Integer, nullable=True)
+    # Whether the low stock was notified, so it is not notified again on every consumption
+    # until the stock is above stock_warning again
+    low_stock_notified = Column(
+        Boolean, nullable=False, server_default=expression.false()
+    )
 
     presentation = Column(
         String(255), nullable=False
@@ -103,3 +134,24 @@ class Medicine(CRUD):
                 until=self.end_date.date() if self.end_date else None,
             )
         return frequency
+
+
+class ScheduledDose(CRUD):
+    """
+    A materialized dose of a medicine, within the rolling horizon of days around today.
+
+    It holds the same slots that get_consumptions reports for the medicine, so the pending
+    doses of a day can be found with an anti-join against the consumption table.
+    """
+
+    __tablename__ = "scheduled_dose"
+    __table_args__ = (Index("ix_scheduled_dose_user_id_due_at", "user_id", "due_at"),)
+
+    id = None  # Replace the id column with the medicine_id and due_at columns
+    medicine_id = Column(
+        Integer, ForeignKey("medicine.id", ondelete="CASCADE"), primary_key=True
+    )
+    due_at = Column(DateTime, primary_key=True)
+    user_id = Column(
+        String(255), ForeignKey("user.id", ondelete="CASCADE"), nullable=False
+    )
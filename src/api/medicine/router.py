@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends
-from starlette.background import BackgroundTasks
 
 from api.auth.dependencies import authenticate
 from api.medicine.exceptions import GenericException
 from api.medicine.schemas import (
+    ConsumptionResultSchema,
     ConsumptionSchema,
     CreateConsumptionSchema,
     CreateMedicineSchema,
@@ -11,6 +11,7 @@ from api.medicine.schemas import (
     MedicineSchema,
 )
 from api.medicine.service import create_consumption as create_consumption_service
+from api.medicine.service import create_consumptions as create_consumptions_service
 from api.medicine.service import create_medicine as create_medicine_service
 from api.medicine.service import delete_consumption as delete_consumption_service
 from api.medicine.service import delete_medicine as delete_medicine_service
@@ -98,7 +99,6 @@ async def delete_medicine(medicine_id: int, user: User = Depends(authenticate)):
     summary="Create a new consumption",
 )
 async def create_consumption(
-    background_tasks: BackgroundTasks,
     consumption: CreateConsumptionSchema,
     user: User = Depends(authenticate),
 ):
@@ -116,15 +116,46 @@ async def create_consumption(
     """
 
     try:
-        consumption = await create_consumption_service(
-            user, consumption, background_tasks
-        )
+        consumption = await create_consumption_service(user, consumption)
     except GenericException as e:
         raise e.http_exception
 
     return consumption
 
 
+@router.post(
+    "/consumptions",
+    response_model=list[ConsumptionResultSchema],
+    status_code=200,
+    summary="Create many consumptions",
+)
+async def create_consumptions(
+    consumptions: list[CreateConsumptionSchema],
+    user: User = Depends(authenticate),
+):
+    """
+    # Create many consumptions
+
+    This endpoint creates many consumptions at once for the authenticated user, i.e. the ones logged by the app while it was offline. The consumptions can be of different medicines.
+
+    A consumption that can not be created does not fail the others: every consumption has its own result, with the error that POST /medicine/consumption would return for it (i.e. 306 if it already exists).
+
+    Args:
+    - **consumptions** (List[CreateConsumptionSchema]): Data required to create every consumption (up to CONSUMPTIONS_BATCH_MAX).
+    - **user** (User): The authenticated user. This parameter is automatically obtained from the request.
+
+    Returns:
+    - **List[ConsumptionResultSchema]**: The result of every consumption, in the same order.
+    """
+
+    try:
+        results = await create_consumptions_service(user, consumptions)
+    except GenericException as e:
+        raise e.http_exception
+
+    return results
+
+
 @router.post("/consumption_delete", status_code=200, summary="Delete a consumption")
 async def delete_consumption(
     consumption: DeleteConsumptionSchema, user: User = Depends(authenticate)
@@ -0,0 +1,122 @@
+from datetime import datetime
+
+import numpy as np
+
+from api.medicine.models import Medicine
+
+ONE_DAY = np.timedelta64(1, "D")
+
+
+def parse_hours(hours: list[str]) -> np.ndarray:
+    """
+    Parses the hours of a medicine into offsets from midnight.
+
+    Args:
+        hours (list[str]): The hours of the medicine, in "%H:%M" format.
+
+    Returns:
+        np.ndarray: The offsets as timedelta64[m], without duplicates and in the same order.
+    """
+
+    offsets = []
+    for hour in dict.fromkeys(hours):
+        parsed = datetime.strptime(hour, "%H:%M")
+        offsets.append(parsed.hour * 60 + parsed.minute)
+    return np.array(offsets, dtype="timedelta64[m]")
+
+
+def get_medicine_days(medicine: Medicine, start: datetime, end: datetime) -> np.ndarray:
+    """
+    Gets the days in which a medicine has to be taken within a date range.
+
+    It returns the same days as `medicine.get_frequency().between(start, end)`, i.e. the
+    days whose midnight is strictly between `start` and `end`, but the interval and weekday
+    rules are solved with arithmetic over the whole range instead of iterating the rrule.
+
+    Args:
+        medicine (Medicine): The medicine.
+        start (datetime): The start date of the range.
+        end (datetime): The end date of the range.
+
+    Returns:
+        np.ndarray: The days as datetime64[D].
+    """
+
+    if not medicine.hours:
+        return np.array([], dtype="datetime64[D]")
+
+    start_day = np.datetime64(medicine.start_date.date(), "D")
+    first_day = max(np.datetime64(start, "D") + ONE_DAY, start_day)
+    last_day = (np.datetime64(end, "us") - np.timedelta64(1, "us")).astype(
+        "datetime64[D]"
+    )
+    if medicine.end_date:
+        last_day = min(last_day, np.datetime64(medicine.end_date.date(), "D"))
+    if first_day > last_day:
+        return np.array([], dtype="datetime64[D]")
+
+    if medicine.interval:
+        elapsed_days = int((first_day - start_day) // ONE_DAY)
+        first_step = -(-elapsed_days // medicine.interval)
+        first_day = start_day + first_step * medicine.interval * ONE_DAY
+        return np.arange(
+            first_day, last_day + ONE_DAY, np.timedelta64(medicine.interval, "D")
+        )
+
+    days = np.arange(first_day, last_day + ONE_DAY)
+    if not medicine.days:
+        return days
+    # 1970-01-01 was a Thursday, so (days + 3) % 7 is 0 on Mondays, like `day - 1`.
+    weekdays = (days.astype(np.int64) + 3) % 7
+    return days[np.isin(weekdays, [day - 1 for day in medicine.days])]
+
+
+def get_medicine_schedule(
+    medicine: Medicine, start: datetime, end: datetime
+) -> np.ndarray:
+    """
+    Gets every scheduled consumption date of a medicine within a date range.
+
+    Args:
+        medicine (Medicine): The medicine.
+        start (datetime): The start date of the range.
+        end (datetime): The end date of the range.
+
+    Returns:
+        np.ndarray: The consumption dates as datetime64[m], sorted by day and then
+                    in the order of `medicine.hours`.
+    """
+
+    range_start = max(start, medicine.start_date)
+    range_end = min(end, medicine.end_date or datetime.max)
+    days = get_medicine_days(medicine, range_start, range_end)
+    if not len(days):
+        return np.array([], dtype="datetime64[m]")
+    hours = parse_hours(medicine.hours)
+    return (days.astype("datetime64[m]")[:, None] + hours[None, :]).ravel()
+
+
+def get_schedule(
+    medicines: list[Medicine], start: datetime, end: datetime
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Gets every scheduled consumption of a list of medicines within a date range.
+
+    Args:
+        medicines (list[Medicine]): The medicines.
+        start (datetime): The start date of the range.
+        end (datetime): The end date of the range.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The medicine ids (int64) and the consumption
+                                       dates (datetime64[m]) of every scheduled slot.
+    """
+
+    schedules = [get_medicine_schedule(medicine, start, end) for medicine in medicines]
+    if not schedules:
+        return np.array([], dtype=np.int64), np.array([], dtype="datetime64[m]")
+    medicine_ids = np.repeat(
+        np.array([medicine.id for medicine in medicines], dtype=np.int64),
+        [len(schedule) for schedule in schedules],
+    )
+    return medicine_ids, np.concatenate(schedules)
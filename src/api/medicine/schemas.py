@@ -91,3 +91,20 @@ class ConsumptionSchema(CreateConsumptionSchema):
                 "consumed": True,
             }
         }
+
+
+class ConsumptionResultSchema(CreateConsumptionSchema):
+    created: bool
+    error: dict | None  # The code and the description, i.e. of ERROR306
+
+    class Config:
+        schema_extra = {
+            "example": {
+                **CreateConsumptionSchema.Config.schema_extra["example"],
+                "created": False,
+                "error": {
+                    "code": 306,
+                    "description": "This consumption already exists.",
+                },
+            }
+        }
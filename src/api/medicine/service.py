@@ -1,14 +1,37 @@
+from collections import Counter
 from datetime import datetime, timedelta
 
-from sqlalchemy import and_, delete, insert, or_, select, update
-from starlette.background import BackgroundTasks
+from sqlalchemy import (
+    Integer,
+    and_,
+    cast,
+    column,
+    delete,
+    false,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
+from api.exceptions import GenericException
 from api.medicine.exceptions import (
     ConsumptionAlreadyExists,
     ConsumptionDoesNotExist,
     MedicineNotFound,
+    TooManyConsumptions,
+)
+from api.medicine.models import (
+    Consumption,
+    Medicine,
+    ScheduledConsumption,
+    ScheduledDose,
 )
-from api.medicine.models import Consumption, Medicine
+from api.medicine.schedule import get_medicine_schedule, get_schedule
 from api.medicine.schemas import (
     CreateConsumptionSchema,
     CreateMedicineSchema,
@@ -18,10 +41,11 @@ from api.notification.models.message import (
     LowStockFromSupervisedUserMessage,
     LowStockMessage,
 )
-from api.notification.service import send_notification
+from api.notification.service import send_notifications_bulk
 from api.supervisor.service import get_supervised, get_supervisors
 from api.user.models import User
-from database import database
+from config import CONSUMPTIONS_BATCH_MAX, SCHEDULED_DOSES_HORIZON_DAYS
+from database import database, iterate_in_chunks
 
 
 async def get_medicines(user: User) -> list[Medicine]:
@@ -96,12 +120,16 @@ async def create_medicine(user: User, medicine: CreateMedicineSchema) -> Medicin
         insert(Medicine).values(user_id=user.id, **medicine.dict()).returning(Medicine)
     )
     medicine = await database.fetch_one(query=insert_query)
+
+    start, end = get_scheduled_doses_window()
+    await insert_scheduled_doses([Medicine(**medicine)], start, end)
+
     return medicine
 
 
 async def delete_medicine(user: User, medicine_id: int):
     """
-    Delete a medicine for a user.
+    Delete a medicine for a user. Its scheduled doses are deleted on cascade.
 
     Args:
         user (User): The user who owns the medicine.
@@ -121,7 +149,6 @@ async def delete_medicine(user: User, medicine_id: int):
 async def create_consumption(
     user: User,
     consumption: CreateConsumptionSchema,
-    background_tasks: BackgroundTasks,
 ) -> Consumption:
     """
     Create a new consumption for a user.
@@ -151,51 +178,252 @@ async def create_consumption(
     )
     consumption_obj.validate()
 
-    already_exists = bool(
-        await database.fetch_one(
-            select(Consumption).where(
-                Consumption.date == consumption.date,
-                Consumption.medicine_id == consumption.medicine_id,
-            )
+    consumption.date = consumption.date.replace(second=0, microsecond=0)
+    async with database.transaction():
+        insert_query = (
+            pg_insert(Consumption)
+            .values(**consumption.dict())
+            .on_conflict_do_nothing()
+            .returning(Consumption)
         )
-    )
-    if already_exists:
-        raise ConsumptionAlreadyExists
+        consumption = await database.fetch_one(query=insert_query)
+        if consumption is None:
+            raise ConsumptionAlreadyExists
+        consumption.consumed = True
 
-    consumption.date = consumption.date.replace(second=0, microsecond=0)
-    insert_query = (
-        insert(Consumption).values(**consumption.dict()).returning(Consumption)
-    )
-    consumption = await database.fetch_one(query=insert_query)
-    consumption.consumed = True
+        # The stock is decremented by the database, so concurrent consumptions (i.e. of
+        # the user and of a supervisor) do not overwrite each other
+        update_query = (
+            update(Medicine)
+            .where(Medicine.id == consumption.medicine_id, Medicine.stock > 0)
+            .values(**get_stock_decrement(1))
+            .returning(Medicine.id, Medicine.stock, Medicine.stock_warning)
+        )
+        updated = await database.fetch_all(query=update_query)
+        notify = await claim_low_stock_notifications(updated)
+
+    if notify:
+        await send_notifications_bulk(
+            get_low_stock_messages(user, [medicine], await get_supervisors(user))
+        )
 
-    if medicine.stock:
+    return consumption
+
+
+async def create_consumptions(
+    user: User,
+    consumptions: list[CreateConsumptionSchema],
+) -> list[dict]:
+    """
+    Create many consumptions for a user at once, i.e. the ones a client logged offline.
+
+    Unlike create_consumption, an invalid consumption does not fail the others: every
+    consumption gets its own result, with the error it would have raised alone. The
+    medicines are fetched once, the existing consumptions are skipped by the insert and
+    the stock of every medicine is decremented by a single update.
+
+    Args:
+        user (User): The user for whom to create the consumptions.
+        consumptions (list[CreateConsumptionSchema]): The data required to create every
+                                                      consumption.
+
+    Returns:
+        list[dict]: The result of every consumption, in the same order.
+    """
+
+    if len(consumptions) > CONSUMPTIONS_BATCH_MAX:
+        raise TooManyConsumptions
+
+    results = [
+        {**consumption.dict(), "created": False, "error": None}
+        for consumption in consumptions
+    ]
+    if not consumptions:
+        return results
+
+    medicine_ids = {consumption.medicine_id for consumption in consumptions}
+    rows = await database.fetch_all(
+        select(Medicine).where(Medicine.id.in_(medicine_ids))
+    )
+    medicines = {row.id: Medicine(**row) for row in rows}
+    if any(medicine.user_id != user.id for medicine in medicines.values()):
+        allowed = {user.id} | {
+            supervised.id for supervised in await get_supervised(user)
+        }
+        medicines = {
+            medicine_id: medicine
+            for medicine_id, medicine in medicines.items()
+            if medicine.user_id in allowed
+        }
+
+    # The index of the consumption to insert of every (date, medicine_id)
+    pending = {}
+    for i, consumption in enumerate(consumptions):
+        try:
+            medicine = medicines.get(consumption.medicine_id)
+            if medicine is None:
+                raise MedicineNotFound
+            Consumption(**consumption.dict(), medicine=medicine).validate()
+            date = consumption.date.replace(second=0, microsecond=0)
+            results[i]["date"] = date
+            if (date, consumption.medicine_id) in pending:
+                raise ConsumptionAlreadyExists
+            pending[(date, consumption.medicine_id)] = i
+        except GenericException as e:
+            results[i]["error"] = e.http_exception.detail
+
+    if not pending:
+        return results
+
+    async with database.transaction():
+        insert_query = (
+            pg_insert(Consumption)
+            .values(
+                [
+                    {
+                        "date": date,
+                        "real_consumption_date": consumptions[i].real_consumption_date,
+                        "medicine_id": medicine_id,
+                    }
+                    for (date, medicine_id), i in pending.items()
+                ]
+            )
+            .on_conflict_do_nothing()
+            .returning(Consumption.date, Consumption.medicine_id)
+        )
+        created = {
+            (row.date, row.medicine_id)
+            for row in await database.fetch_all(query=insert_query)
+        }
+        for key, i in pending.items():
+            if key in created:
+                results[i]["created"] = True
+            else:
+                results[i]["error"] = ConsumptionAlreadyExists.http_exception.detail
+        if not created:
+            return results
+
+        amounts = Counter(medicine_id for _, medicine_id in created)
+        # The parameters are cast, asyncpg takes the ones of a VALUES as text
+        consumed = values(
+            column("id", Integer), column("amount", Integer), name="consumed"
+        ).data(
+            [
+                (cast(literal(medicine_id), Integer), cast(literal(amount), Integer))
+                for medicine_id, amount in amounts.items()
+            ]
+        )
         update_query = (
             update(Medicine)
-            .where(Medicine.id == consumption.medicine_id)
-            .values(stock=max(medicine.stock - 1, 0))
+            .where(Medicine.id == consumed.c.id, Medicine.stock > 0)
+            .values(**get_stock_decrement(consumed.c.amount))
+            .returning(Medicine.id, Medicine.stock, Medicine.stock_warning)
         )
-        await database.execute(query=update_query)
-
-        if medicine.stock_warning and medicine.stock <= medicine.stock_warning:
-            await send_notification(
-                LowStockMessage(
-                    medicine=medicine,
-                ),
-                user=User(**user),
-                background_tasks=background_tasks,
+        updated = await database.fetch_all(query=update_query)
+        notify = await claim_low_stock_notifications(updated)
+
+    if notify:
+        await send_notifications_bulk(
+            get_low_stock_messages(
+                user,
+                [medicines[medicine_id] for medicine_id in notify],
+                await get_supervisors(user),
             )
-            for supervisor in await get_supervisors(user):
-                await send_notification(
+        )
+
+    return results
+
+
+def get_stock_decrement(amount) -> dict:
+    """
+    Gets the values of an update that decrements the stock of medicines by an amount of
+    consumptions, never below zero.
+
+    The low stock is marked as not notified when the stock is above the warning again. It
+    is compared as consuming them one at a time, with the stock before the last
+    consumption (the new stock + 1).
+
+    Args:
+        amount: The amount of consumptions, an int or a column.
+
+    Returns:
+        dict: The values of the update.
+    """
+
+    stock = func.greatest(Medicine.stock - amount, 0)
+    return {
+        "stock": stock,
+        "low_stock_notified": and_(
+            Medicine.low_stock_notified,
+            func.coalesce(
+                and_(Medicine.stock_warning > 0, stock < Medicine.stock_warning),
+                false(),
+            ),
+        ),
+    }
+
+
+async def claim_low_stock_notifications(medicines: list) -> list[int]:
+    """
+    Marks as notified the low stock of the medicines whose updated stock is under the
+    warning, and that were not notified yet.
+
+    It must run in the transaction that updated the stock, which holds the lock of the
+    rows, so only one consumption notifies the low stock of a medicine.
+
+    Args:
+        medicines (list): The id, stock and stock_warning of the updated medicines.
+
+    Returns:
+        list[int]: The IDs of the medicines whose low stock has to be notified.
+    """
+
+    low_stock = [
+        medicine.id
+        for medicine in medicines
+        if medicine.stock_warning and medicine.stock < medicine.stock_warning
+    ]
+    if not low_stock:
+        return []
+
+    update_query = (
+        update(Medicine)
+        .where(Medicine.id.in_(low_stock), Medicine.low_stock_notified == False)
+        .values(low_stock_notified=True)
+        .returning(Medicine.id)
+    )
+    return [row.id for row in await database.fetch_all(query=update_query)]
+
+
+def get_low_stock_messages(
+    user: User, medicines: list[Medicine], supervisors: list[User]
+) -> list[tuple]:
+    """
+    Gets the low-stock messages of medicines, for the user and for its supervisors.
+
+    Args:
+        user (User): The user who consumed the medicines.
+        medicines (list[Medicine]): The medicines with low stock.
+        supervisors (list[User]): The supervisors of the user.
+
+    Returns:
+        list[tuple]: The messages and their users, like send_notifications_bulk takes them.
+    """
+
+    messages = []
+    for medicine in medicines:
+        messages.append((LowStockMessage(medicine=medicine), User(**user)))
+        for supervisor in supervisors:
+            messages.append(
+                (
                     LowStockFromSupervisedUserMessage(
                         medicine=medicine,
                         supervised_user=User(**user),
                     ),
-                    user=User(**supervisor),
-                    background_tasks=background_tasks,
+                    User(**supervisor),
                 )
-
-    return consumption
+            )
+    return messages
 
 
 async def delete_consumption(user: User, consumption: DeleteConsumptionSchema):
@@ -233,7 +461,7 @@ async def delete_consumption(user: User, consumption: DeleteConsumptionSchema):
 
 async def get_consumptions(
     user: User, start: datetime, end: datetime
-) -> list[Medicine]:
+) -> list[Consumption | ScheduledConsumption]:
     """
     Retrieves consumptions of medicines for a specific user within a date range.
 
@@ -243,7 +471,8 @@ async def get_consumptions(
         end (datetime): The end date of the range.
 
     Returns:
-        list[Medicine]: A list of consumptions.
+        list[Consumption | ScheduledConsumption]: A list of consumptions. The ones that
+                                                  were not taken are ScheduledConsumption.
     """
 
     select_query = select(Medicine).where(
@@ -253,38 +482,41 @@ async def get_consumptions(
             or_(Medicine.end_date == None, Medicine.end_date >= start),
         ),
     )
-    medicines = await database.fetch_all(query=select_query)
-    consumptions = {}
+    medicines = [
+        Medicine(**medicine)
+        for medicine in await database.fetch_all(query=select_query)
+    ]
+    if not medicines:
+        return []
+
+    # All the taken consumptions of the range are fetched at once and grouped by
+    # medicine, instead of sending one query per medicine.
+    consumptions_taken = await database.fetch_all(
+        select(Consumption).where(
+            Consumption.medicine_id.in_([medicine.id for medicine in medicines]),
+            Consumption.date.between(start, end),
+        )
+    )
+    consumptions_taken_by_medicine = {}
+    for consumption_taken in consumptions_taken:
+        consumptions_taken_by_medicine.setdefault(
+            consumption_taken.medicine_id, []
+        ).append(consumption_taken)
 
+    consumptions = {}
     for medicine in medicines:
-        medicine = Medicine(**medicine)
         consumptions[medicine.id] = {}
         range_start = max(start, medicine.start_date)
         range_end = min(end, medicine.end_date or datetime.max)
 
-        if medicine.hours:
-            frequency_rule = medicine.get_frequency().between(range_start, range_end)
-            for date in frequency_rule:
-                consumptions[medicine.id][date.date()] = {}
-                for hour in medicine.hours:
-                    c_date = datetime.combine(
-                        date, datetime.strptime(hour, "%H:%M").time()
-                    )
-                    c = Consumption(
-                        date=c_date,
-                        real_consumption_date=c_date,
-                        medicine_id=medicine.id,
-                    )
-                    c.consumed = False
-                    consumptions[medicine.id][date.date()][hour] = c
-
-        consumptions_taken = await database.fetch_all(
-            select(Consumption).where(
-                Consumption.medicine_id == medicine.id,
-                Consumption.date.between(range_start, range_end),
-            )
-        )
-        for consumption_taken in consumptions_taken:
+        for c_date in get_medicine_schedule(medicine, start, end).tolist():
+            consumptions[medicine.id].setdefault(c_date.date(), {})[
+                c_date.strftime("%H:%M")
+            ] = ScheduledConsumption(medicine_id=medicine.id, date=c_date)
+
+        for consumption_taken in consumptions_taken_by_medicine.get(medicine.id, []):
+            if not range_start <= consumption_taken.date <= range_end:
+                continue
             consumption_taken = Consumption(**consumption_taken)
             consumption_taken.consumed = True
             if consumption_taken.date.date() not in consumptions[medicine.id]:
@@ -303,28 +535,194 @@ async def get_consumptions(
 
 async def get_consumptions_on_date(
     user: User, date: datetime, only_not_taken: bool = False
-) -> list[Consumption]:
+) -> list[Consumption | ScheduledConsumption]:
     """
     Retrieves consumptions of medicines for a specific user on a specific date.
 
+    The pending consumptions are read from the scheduled doses, so the date must be within
+    the rolling horizon of get_scheduled_doses_window.
+
     Args:
         user (User): The user for whom to retrieve the consumptions.
         date (datetime): The date for which to retrieve the consumptions.
+        only_not_taken (bool, optional): Whether to retrieve only the consumptions that
+                                         were not taken. Defaults to False.
+
+    Returns:
+        list[Consumption | ScheduledConsumption]: A list of consumptions.
+    """
+
+    consumptions = await get_users_consumptions_on_date([user.id], date, only_not_taken)
+    return consumptions.get(user.id, [])
+
+
+async def get_users_consumptions_on_date(
+    users_ids: list[str], date: datetime, only_not_taken: bool = False
+) -> dict[str, list[Consumption | ScheduledConsumption]]:
+    """
+    Retrieves consumptions of medicines for many users on a specific date, with at most two queries.
+
+    Args:
+        users_ids (list[str]): The IDs of the users for whom to retrieve the consumptions.
+        date (datetime): The date for which to retrieve the consumptions.
+        only_not_taken (bool, optional): Whether to retrieve only the consumptions that
+                                         were not taken. Defaults to False.
 
     Returns:
-        list[Consumption]: A list of consumptions.
+        dict[str, list[Consumption | ScheduledConsumption]]: The consumptions of each user,
+                                                             sorted by medicine and date.
     """
 
-    start = date.replace(hour=23, minute=59, second=59, microsecond=0) - timedelta(
-        days=1
+    day_start = date.replace(hour=0, minute=0, second=0, microsecond=0)
+    day_end = day_start + timedelta(days=1)
+    consumptions = {}
+
+    not_taken_query = (
+        select(ScheduledDose.user_id, ScheduledDose.medicine_id, ScheduledDose.due_at)
+        .outerjoin(
+            Consumption,
+            and_(
+                Consumption.medicine_id == ScheduledDose.medicine_id,
+                Consumption.date == ScheduledDose.due_at,
+            ),
+        )
+        .where(
+            ScheduledDose.user_id.in_(users_ids),
+            ScheduledDose.due_at >= day_start,
+            ScheduledDose.due_at < day_end,
+            Consumption.date == None,
+        )
     )
-    end = date.replace(hour=0, minute=0, second=1, microsecond=0) + timedelta(days=1)
-    return [
-        consumption
-        for consumption in await get_consumptions(user, start, end)
-        if consumption.date.date() == date.date()
-        and (not only_not_taken or not consumption.consumed)
+    for dose in await database.fetch_all(query=not_taken_query):
+        consumptions.setdefault(dose.user_id, []).append(
+            ScheduledConsumption(medicine_id=dose.medicine_id, date=dose.due_at)
+        )
+
+    if not only_not_taken:
+        taken_query = (
+            select(Consumption, Medicine.user_id)
+            .join(Medicine, Medicine.id == Consumption.medicine_id)
+            .where(
+                Medicine.user_id.in_(users_ids),
+                Consumption.date >= day_start,
+                Consumption.date < day_end,
+                Consumption.date >= Medicine.start_date,
+                or_(Medicine.end_date == None, Consumption.date <= Medicine.end_date),
+            )
+        )
+        for consumption_taken in await database.fetch_all(query=taken_query):
+            user_id = consumption_taken.user_id
+            consumption_taken = Consumption(
+                **{
+                    column.name: consumption_taken[column.name]
+                    for column in Consumption.__table__.columns
+                }
+            )
+            consumption_taken.consumed = True
+            consumptions.setdefault(user_id, []).append(consumption_taken)
+
+    for user_consumptions in consumptions.values():
+        user_consumptions.sort(
+            key=lambda consumption: (consumption.medicine_id, consumption.date)
+        )
+    return consumptions
+
+
+async def get_medicines_names(medicines_ids: list[int]) -> dict[int, str]:
+    """
+    Get the names of many medicines with a single query.
+
+    Args:
+        medicines_ids (list[int]): The IDs of the medicines.
+
+    Returns:
+        dict[int, str]: The name of each medicine, by ID.
+    """
+
+    if not medicines_ids:
+        return {}
+    select_query = select(Medicine.id, Medicine.name).where(
+        Medicine.id.in_(medicines_ids)
+    )
+    medicines = await database.fetch_all(query=select_query)
+    return {medicine.id: medicine.name for medicine in medicines}
+
+
+def get_scheduled_doses_window() -> tuple[datetime, datetime]:
+    """
+    Gets the rolling horizon in which the scheduled doses are materialized: from yesterday
+    (for the didn't take yesterday job) to SCHEDULED_DOSES_HORIZON_DAYS after today.
+
+    Returns:
+        tuple[datetime, datetime]: The start (inclusive) and end (exclusive) of the window.
+    """
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return (
+        today - timedelta(days=1),
+        today + timedelta(days=SCHEDULED_DOSES_HORIZON_DAYS + 1),
+    )
+
+
+async def insert_scheduled_doses(
+    medicines: list[Medicine], start: datetime, end: datetime
+):
+    """
+    Inserts the scheduled doses of some medicines within a date range, skipping the ones
+    that already exist.
+
+    Args:
+        medicines (list[Medicine]): The medicines.
+        start (datetime): The start date of the range (inclusive).
+        end (datetime): The end date of the range (exclusive).
+    """
+
+    # The schedule excludes its bounds, so the start is moved back to include it.
+    medicine_ids, dates = get_schedule(
+        medicines, start - timedelta(microseconds=1), end
+    )
+    users = {medicine.id: medicine.user_id for medicine in medicines}
+    values = [
+        {"medicine_id": medicine_id, "user_id": users[medicine_id], "due_at": due_at}
+        for medicine_id, due_at in zip(medicine_ids.tolist(), dates.tolist())
     ]
+    # asyncpg does not accept more than 32767 parameters in a query.
+    for i in range(0, len(values), 5000):
+        insert_query = (
+            pg_insert(ScheduledDose)
+            .values(values[i : i + 5000])
+            .on_conflict_do_nothing()
+        )
+        await database.execute(query=insert_query)
+
+
+async def fill_scheduled_doses(chunk_size: int = 500):
+    """
+    Moves the rolling horizon of the scheduled doses to the current date: inserts the
+    missing doses of every medicine and removes the ones that are older than the horizon.
+
+    It is idempotent, so it is run daily and also works as backfill for existing medicines.
+
+    Args:
+        chunk_size (int, optional): The number of medicines processed at once. Defaults to 500.
+    """
+
+    start, end = get_scheduled_doses_window()
+    await database.execute(
+        query=delete(ScheduledDose).where(ScheduledDose.due_at < start)
+    )
+
+    medicines_in_chunks = iterate_in_chunks(
+        Medicine,
+        chunk_size,
+        where=[
+            Medicine.hours != None,
+            Medicine.start_date < end,
+            or_(Medicine.end_date == None, Medicine.end_date >= start),
+        ],
+    )
+    async for medicines in medicines_in_chunks:
+        await insert_scheduled_doses(medicines, start, end)
 
 
 async def get_medicines_between_dates(
@@ -31,6 +31,13 @@ ERROR503 = HTTPException(
         "description": "You tried to delete a notification that does not exist or is not yours.",
     },
 )
+ERROR504 = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST,
+    detail={
+        "code": 504,
+        "description": "The cursor of the notifications is not valid.",
+    },
+)
 
 
 class YouAlreadyHaveThisNotificationPreference(GenericException):
@@ -47,3 +54,7 @@ class ThisNotificationPreferenceDoesNotExist(GenericException):
 
 class ThisNotificationDoesNotExist(GenericException):
     http_exception = ERROR503
+
+
+class InvalidNotificationCursor(GenericException):
+    http_exception = ERROR504
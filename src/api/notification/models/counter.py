@@ -0,0 +1,23 @@
+from sqlalchemy import Column, ForeignKey, Integer, String
+
+from models import CRUD
+
+
+class NotificationCounter(CRUD):
+    """
+    The number of unread notifications of a user, kept up to date by the writes of the
+    notifications so the badge of the app does not need to count them.
+
+    The counter of a user is created by counting the unread notifications of the user, the
+    first time it is read or written, and then the writes update it in their transaction.
+    """
+
+    __tablename__ = "notification_counter"
+
+    user_id = Column(
+        String(255),
+        ForeignKey("user.id", ondelete="CASCADE"),
+        unique=True,
+        nullable=False,
+    )
+    unread = Column(Integer, nullable=False, server_default="0")
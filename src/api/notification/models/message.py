@@ -1,9 +1,14 @@
 class Message:
     type: str
+    # The notifications sent together in digests, see NOTIFICATION_DIGEST_SECONDS. None
+    # for the ones of the type
+    digest_type: str | None = None
 
     def __init__(self, **kwargs):
         for key, value in kwargs.items():
             setattr(self, key, value)
+        # What every channel rendered, by channel (see api.notification.renderer)
+        self.rendered: dict[str, dict] = {}
 
     def whatsapp(self):
         """
@@ -214,6 +219,7 @@ class YesterdarUserDidntTakeMedicine(Message):
 
 class LowStockMessage(Message):
     type = "medicine"
+    digest_type = "low_stock"
 
     def whatsapp(self):
         return {
@@ -238,6 +244,7 @@ class LowStockMessage(Message):
 
 class LowStockFromSupervisedUserMessage(Message):
     type = "medicine"
+    digest_type = "low_stock"
 
     def whatsapp(self):
         return {
@@ -258,3 +265,35 @@ class LowStockFromSupervisedUserMessage(Message):
             "body": f"El medicamento {self.medicine.name} de {self.supervised_user.get_fullname()} está por agotarse. "
             f"Recuerda evitar que se agote para no interrumpir el tratamiento.",
         }
+
+
+class DigestMessage(Message):
+    """
+    The notifications of a user of the same type that are sent together, from the
+    messages of one channel of every notification (`payloads`).
+    """
+
+    type = "digest"
+
+    def get_title(self) -> str:
+        return f"Tienes {len(self.payloads)} notificaciones de Meddly"
+
+    def whatsapp(self):
+        m = f"{self.get_title()}:"
+        for payload in self.payloads:
+            m += f'\n\n{payload["message"]}'
+        return {"message": m}
+
+    def email(self):
+        return {
+            "subject": self.get_title(),
+            "message": "<br><br>".join(
+                f'<b>{payload["subject"]}</b><br>{payload["message"]}'
+                for payload in self.payloads
+            ),
+        }
+
+    def push(self):
+        # The titles of the notifications, without repeating them
+        titles = dict.fromkeys(payload["title"] for payload in self.payloads)
+        return {"title": self.get_title(), "body": ", ".join(titles)}
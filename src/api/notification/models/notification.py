@@ -1,4 +1,15 @@
-from sqlalchemy import Boolean, Column, ForeignKey, String
+from sqlalchemy import (
+    DDL,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    event,
+    func,
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import expression
 
@@ -6,11 +17,35 @@ from models import CRUD
 
 
 class Notification(CRUD):
+    """
+    A notification of the inbox of a user.
+
+    The table is partitioned by month of created_at (see api.notification.partitions), so
+    the primary key includes created_at, and the rows that do not belong to any monthly
+    partition are kept in the notification_default partition.
+    """
+
     __tablename__ = "notification"
+    __table_args__ = (
+        # The inbox of a user, paginated by (created_at, id)
+        Index("ix_notification_user_created_at_id", "user_id", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    user_id = Column(String(255), ForeignKey("user.id"), index=True, nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    created_at = Column(
+        DateTime, primary_key=True, server_default=func.now(), nullable=False
+    )
+    user_id = Column(String(255), ForeignKey("user.id"), nullable=False)
     user = relationship("User", backref="notifications_list", foreign_keys=[user_id])
     title = Column(String(255), nullable=False)
     body = Column(String(255), nullable=False)
     type = Column(String(255), nullable=False)
     is_read = Column(Boolean, server_default=expression.false(), nullable=False)
+
+
+event.listen(
+    Notification.__table__,
+    "after_create",
+    DDL("CREATE TABLE notification_default PARTITION OF notification DEFAULT"),
+)
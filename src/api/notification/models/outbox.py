@@ -0,0 +1,47 @@
+from sqlalchemy import JSON, Column, DateTime, Index, Integer, String, Text, func, text
+
+from models import CRUD
+
+
+class NotificationOutbox(CRUD):
+    """
+    A delivery of a notification through a channel, written in the same transaction as
+    the notification and sent by the notification worker (see api.notification.worker).
+    """
+
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        # The deliveries that the worker has to claim, in order
+        Index(
+            "ix_notification_outbox_pending",
+            "channel",
+            "next_attempt_at",
+            postgresql_where=text("status = 'pending'"),
+        ),
+        # The pending deliveries of a digest, that are sent together
+        Index(
+            "ix_notification_outbox_digest",
+            "channel",
+            "digest_key",
+            postgresql_where=text("status = 'pending' AND digest_key IS NOT NULL"),
+        ),
+    )
+
+    PENDING = "pending"
+    SENT = "sent"
+    DEAD = "dead"  # Failed OUTBOX_MAX_ATTEMPTS times, it will not be retried
+
+    # Not a foreign key, because the primary key of the partitioned notification table
+    # also has its created_at. The deliveries are deleted with their notifications.
+    notification_id = Column(Integer, index=True, nullable=False)
+    channel = Column(String(20), nullable=False)  # email, whatsapp or push
+    payload = Column(JSON, nullable=False)  # What the channel needs to send it
+    status = Column(String(20), nullable=False, server_default=PENDING)
+    attempts = Column(Integer, nullable=False, server_default="0")
+    next_attempt_at = Column(DateTime, nullable=False, server_default=func.now())
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    # "<user_id>:<digest type>" if the notification is sent in digests (see
+    # NOTIFICATION_DIGEST_SECONDS), the deliveries of a channel with the same key that are
+    # pending when one of them is due are sent together
+    digest_key = Column(String(255), nullable=True)
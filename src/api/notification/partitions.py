@@ -0,0 +1,337 @@
+"""
+Partitions of the notification table.
+
+The notifications are partitioned by month of created_at, so the inbox queries, which are
+bounded by the retention cutoff (and by the cursor), only scan the recent partitions, and
+the old notifications are removed by dropping whole partitions instead of deleting rows.
+
+Every month has a partition named notification_YYYY_MM, which `ensure_partitions` creates
+ahead of time. The rows that do not belong to any of them (i.e. the ones inserted before
+their partition existed) are kept in the default partition, and they are moved to their
+partition when it is created.
+
+Usage (from the src folder):
+    python -m api.notification.partitions            # Runs the daily maintenance
+    python -m api.notification.partitions migrate    # Partitions an existing table
+"""
+import asyncio
+import gzip
+import logging
+import os
+import re
+import sys
+from collections import Counter
+from datetime import date, datetime
+
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from api.notification.models.notification import Notification
+from api.notification.models.outbox import NotificationOutbox
+from api.notification.service import get_retention_cutoff, update_unread_counters
+from config import (
+    NOTIFICATION_ARCHIVE_FOLDER,
+    NOTIFICATION_PARTITIONS_AHEAD,
+    NOTIFICATION_RETENTION_DAYS,
+)
+from database import Base, database, engine
+
+DEFAULT_PARTITION = "notification_default"
+# Key of the Postgres advisory lock held while the partitions are created or dropped
+PARTITIONS_LOCK_KEY = 5_034_781_210
+PARTITION_NAME = re.compile(r"^notification_(\d{4})_(\d{2})$")
+
+logger = logging.getLogger(__name__)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def get_partition_name(month: date) -> str:
+    return f"notification_{month:%Y_%m}"
+
+
+async def is_partitioned() -> bool:
+    select_query = "SELECT relkind::text FROM pg_class WHERE relname = 'notification'"
+    return await database.fetch_val(query=select_query) == "p"
+
+
+async def get_partitions() -> list[date]:
+    """
+    Gets the months that have a partition, sorted.
+    """
+
+    select_query = """
+        SELECT child.relname AS name
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = 'notification'::regclass
+    """
+    months = []
+    for partition in await database.fetch_all(query=select_query):
+        match = PARTITION_NAME.match(partition["name"])
+        if match:
+            months.append(date(int(match[1]), int(match[2]), 1))
+    return sorted(months)
+
+
+async def lock_partitions():
+    """
+    Takes the lock of the partitions until the end of the current transaction, so the
+    replicas that change them at the same time (e.g. when they start) do it one by one.
+    """
+
+    await database.execute(select(func.pg_advisory_xact_lock(PARTITIONS_LOCK_KEY)))
+
+
+async def create_partition(month: date):
+    """
+    Creates the partition of a month, moving its rows from the default partition.
+    It must run with the lock of the partitions.
+
+    The writes of the notifications wait until the partition is attached, so the ones of
+    the month inserted meanwhile go to the new partition. Otherwise they would stay in the
+    default partition after its rows are moved, and the attach would fail. The parent table
+    is locked too (but not its other partitions), since an insert routes its rows when it
+    locks the parent: one that waited only for the default partition would still route
+    them to it.
+    """
+
+    name = get_partition_name(month)
+    bounds = {
+        "start": datetime.combine(month, datetime.min.time()),
+        "end": datetime.combine(add_months(month, 1), datetime.min.time()),
+    }
+    in_bounds = "created_at >= :start AND created_at < :end"
+    async with database.transaction():
+        await database.execute(
+            f"LOCK TABLE ONLY notification, {DEFAULT_PARTITION} IN EXCLUSIVE MODE"
+        )
+        await database.execute(f"CREATE TABLE {name} (LIKE notification INCLUDING ALL)")
+        await database.execute(
+            f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_bounds}",
+            bounds,
+        )
+        await database.execute(
+            f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_bounds}", bounds
+        )
+        await database.execute(
+            f"ALTER TABLE notification ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+        )
+
+
+async def ensure_partitions(months_ahead: int = NOTIFICATION_PARTITIONS_AHEAD):
+    """
+    Creates the missing partitions of the current month, of the next `months_ahead`
+    months, and of the months that have rows in the default partition.
+
+    The missing partitions are found and created with the lock of the partitions, so a
+    replica that waited for another one does not create them again.
+    """
+
+    if not await is_partitioned():
+        logger.warning(
+            "The notification table is not partitioned, "
+            "run `python -m api.notification.partitions migrate`"
+        )
+        return
+
+    current = date.today().replace(day=1)
+    months = {add_months(current, i) for i in range(months_ahead + 1)}
+    select_query = (
+        "SELECT DISTINCT date_trunc('month', created_at) AS month "
+        f"FROM {DEFAULT_PARTITION}"
+    )
+    async with database.transaction():
+        await lock_partitions()
+        for row in await database.fetch_all(query=select_query):
+            months.add(row["month"].date())
+        for month in sorted(months - set(await get_partitions())):
+            await create_partition(month)
+
+
+async def archive_partition(month: date, folder: str) -> str:
+    """
+    Writes the rows of the partition of a month to a gzipped CSV file in a folder. The
+    compression and the writes of the file block, so they run in a thread.
+
+    Returns:
+        str: The path of the file.
+    """
+
+    name = get_partition_name(month)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{name}.csv.gz")
+    file = await asyncio.to_thread(gzip.open, f"{path}.tmp", "wb")
+    try:
+
+        async def write(chunk: bytes):
+            await asyncio.to_thread(file.write, chunk)
+
+        async with database.connection() as connection:
+            await connection.raw_connection.copy_from_table(
+                name, output=write, format="csv", header=True
+            )
+    finally:
+        await asyncio.to_thread(file.close)
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+async def drop_partition(month: date, archive_folder: str | None):
+    """
+    Drops the partition of a month, with the outbox deliveries of its notifications, after
+    archiving it if there is an archive folder. The unread counters are updated.
+    """
+
+    name = get_partition_name(month)
+    if archive_folder:
+        await archive_partition(month, archive_folder)
+
+    async with database.transaction():
+        await lock_partitions()
+        if month not in await get_partitions():
+            return  # Dropped by another replica
+        await database.execute(f"ALTER TABLE notification DETACH PARTITION {name}")
+        unread = await database.fetch_all(
+            f"SELECT user_id, count(*) AS unread FROM {name} "
+            "WHERE NOT is_read GROUP BY user_id"
+        )
+        delete_query = delete(NotificationOutbox).where(
+            NotificationOutbox.notification_id.in_(text(f"SELECT id FROM {name}"))
+        )
+        await database.execute(query=delete_query)
+        await database.execute(f"DROP TABLE {name}")
+        await update_unread_counters({row["user_id"]: -row["unread"] for row in unread})
+
+
+async def expire_notifications(retention_days: int = NOTIFICATION_RETENTION_DAYS):
+    """
+    Marks as read the unread notifications older than the retention, which are no longer
+    listed, so they leave the unread counters before their partition is dropped.
+    """
+
+    update_query = (
+        update(Notification)
+        .where(
+            Notification.is_read.is_(False),
+            Notification.created_at < get_retention_cutoff(retention_days),
+        )
+        .values(is_read=True)
+        .returning(Notification.user_id)
+    )
+    async with database.transaction():
+        expired = Counter(row.user_id for row in await database.fetch_all(update_query))
+        await update_unread_counters({user_id: -n for user_id, n in expired.items()})
+
+
+async def drop_expired_partitions(
+    retention_days: int = NOTIFICATION_RETENTION_DAYS,
+    archive_folder: str | None = NOTIFICATION_ARCHIVE_FOLDER,
+) -> list[date]:
+    """
+    Drops the partitions whose notifications are all older than the retention.
+
+    Returns:
+        list[date]: The months of the dropped partitions.
+    """
+
+    cutoff = get_retention_cutoff(retention_days).date()
+    dropped = []
+    for month in await get_partitions():
+        if add_months(month, 1) <= cutoff:
+            await drop_partition(month, archive_folder)
+            dropped.append(month)
+    return dropped
+
+
+async def maintain_notification_partitions(
+    retention_days: int = NOTIFICATION_RETENTION_DAYS,
+    archive_folder: str | None = NOTIFICATION_ARCHIVE_FOLDER,
+):
+    """
+    Creates the partitions of the next months, moves the rows of the default partition to
+    their months, expires the unread notifications older than the retention and drops the
+    partitions older than it.
+    """
+
+    if not await is_partitioned():
+        await ensure_partitions()  # Only warns
+        return
+
+    await ensure_partitions()
+    await expire_notifications(retention_days)
+    dropped = await drop_expired_partitions(retention_days, archive_folder)
+    if dropped:
+        logger.info("Dropped the notifications of %s", dropped)
+
+
+async def partition_existing_table():
+    """
+    Replaces a notification table created before the partitioning with a partitioned
+    one, with the same rows and IDs.
+
+    The table is locked while its rows are copied, so it should run in a maintenance window.
+    """
+
+    if await is_partitioned():
+        return
+
+    old = "notification_unpartitioned"
+    columns = ", ".join(column.name for column in Notification.__table__.columns)
+    dialect = postgresql.dialect()
+    async with database.transaction():
+        await database.execute(f"ALTER TABLE notification RENAME TO {old}")
+        select_query = f"SELECT indexname FROM pg_indexes WHERE tablename = '{old}'"
+        for index in await database.fetch_all(select_query):
+            await database.execute(
+                f'ALTER INDEX "{index["indexname"]}" '
+                f'RENAME TO "{index["indexname"]}_unpartitioned"'
+            )
+        await database.execute(
+            f"ALTER SEQUENCE notification_id_seq RENAME TO {old}_seq"
+        )
+        await database.execute(
+            "ALTER TABLE notification_outbox "
+            "DROP CONSTRAINT IF EXISTS notification_outbox_notification_id_fkey"
+        )
+
+        await database.execute(
+            str(CreateTable(Notification.__table__).compile(dialect=dialect))
+        )
+        for index in Notification.__table__.indexes:
+            await database.execute(str(CreateIndex(index).compile(dialect=dialect)))
+        await database.execute(
+            f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF notification DEFAULT"
+        )
+        await database.execute(
+            f"INSERT INTO notification ({columns}) SELECT {columns} FROM {old}"
+        )
+        await database.execute(
+            "SELECT setval('notification_id_seq', "
+            "coalesce((SELECT max(id) FROM notification), 0) + 1, false)"
+        )
+        await database.execute(f"DROP TABLE {old}")
+
+    await maintain_notification_partitions()
+
+
+async def main(command: str | None = None):
+    logging.basicConfig(level=logging.INFO)
+    Base.metadata.create_all(bind=engine)
+    await database.connect()
+    try:
+        if command == "migrate":
+            await partition_existing_table()
+        else:
+            await maintain_notification_partitions()
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*sys.argv[1:2]))
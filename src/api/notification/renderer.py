@@ -0,0 +1,42 @@
+"""
+Renders the messages of the notifications.
+
+A message keeps what every channel rendered, so a notification and its deliveries render
+every channel of the message at most once (i.e. the push is both the notification and
+the push delivery), and `render_batch` renders a channel of many messages in one pass.
+"""
+
+
+def render(message, channel: str) -> dict:
+    """
+    Renders the message of a channel of a message, i.e. the subject and the message of
+    the email, or returns what it already rendered.
+
+    Args:
+        message (Message): The message.
+        channel (str): The channel, i.e. "email".
+
+    Returns:
+        dict: The message of the channel.
+    """
+
+    rendered = message.rendered.get(channel)
+    if rendered is None:
+        rendered = message.rendered[channel] = getattr(message, channel)()
+    return rendered
+
+
+def render_batch(messages: list, channel: str) -> list[dict]:
+    """
+    Renders the message of a channel of many messages, of any types, in one pass. The
+    messages that already rendered the channel are not rendered again.
+
+    Args:
+        messages (list[Message]): The messages.
+        channel (str): The channel, i.e. "email".
+
+    Returns:
+        list[dict]: The message of the channel of every message.
+    """
+
+    return [render(message, channel) for message in messages]
@@ -4,7 +4,11 @@ from fastapi import APIRouter, Depends, Query
 
 from api.auth.dependencies import authenticate
 from api.exceptions import GenericException
-from api.notification.schemas import NotificationSchema
+from api.notification.schemas import (
+    NotificationInboxSchema,
+    NotificationSchema,
+    UnreadNotificationsSchema,
+)
 from api.notification.service import (
     add_notification_preference as add_notification_preference_service,
 )
@@ -12,10 +16,15 @@ from api.notification.service import delete_notification as delete_notification_
 from api.notification.service import (
     delete_notification_preference as delete_notification_preference_service,
 )
+from api.notification.service import get_inbox as get_inbox_service
 from api.notification.service import (
     get_notification_preferences as get_notification_preferences_service,
 )
 from api.notification.service import get_notifications as get_notifications_service
+from api.notification.service import get_unread_count as get_unread_count_service
+from api.notification.service import (
+    mark_notifications_read as mark_notifications_read_service,
+)
 from api.user.models import User
 
 router = APIRouter(prefix="/notification", tags=["Notifications"])
@@ -113,6 +122,7 @@ async def delete_notification_preference(
     response_model=list[NotificationSchema],
     status_code=200,
     summary="Get notifications",
+    deprecated=True,
 )
 async def get_notifications(
     type: Annotated[list[str] | None, Query()] = None,
@@ -123,7 +133,8 @@ async def get_notifications(
     """
     # Get notifications
 
-    This endpoint retrieves the notifications for the authenticated user.
+    This endpoint retrieves the notifications for the authenticated user, and marks them as read.
+    Deprecated in favor of `/notification/inbox`, which does not get slower with the page number.
 
     Args:
     - **type** (list[str] | None): The notification types to retrieve. If not specified, all notification types will be retrieved.
@@ -141,6 +152,93 @@ async def get_notifications(
     return results
 
 
+@router.get(
+    "/inbox",
+    response_model=NotificationInboxSchema,
+    status_code=200,
+    summary="Get a page of the inbox",
+)
+async def get_inbox(
+    type: Annotated[list[str] | None, Query()] = None,
+    cursor: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    user: User = Depends(authenticate),
+):
+    """
+    # Get a page of the inbox
+
+    This endpoint retrieves the notifications for the authenticated user, from the newest to the oldest, a page at a time.
+    The notifications are not marked as read, see `/notification/read`.
+
+    Args:
+    - **type** (list[str] | None): The notification types to retrieve. If not specified, all notification types will be retrieved.
+    - **cursor** (str | None): The `next_cursor` of the previous page. If not specified, the first page is retrieved.
+    - **limit** (int): The number of notifications to retrieve. Defaults to 20.
+    - **user** (User): The authenticated user. This parameter is automatically obtained from the request.
+
+    Returns:
+    - **NotificationInboxSchema**: The notifications of the page with their cursors, the cursor of the next page (null on the last one) and the number of unread notifications.
+    """
+
+    try:
+        result = await get_inbox_service(user, cursor=cursor, limit=limit, type=type)
+    except GenericException as e:
+        raise e.http_exception
+    return result
+
+
+@router.get(
+    "/unread",
+    response_model=UnreadNotificationsSchema,
+    status_code=200,
+    summary="Get the number of unread notifications",
+)
+async def get_unread_count(user: User = Depends(authenticate)):
+    """
+    # Get the number of unread notifications
+
+    This endpoint retrieves the number of unread notifications for the authenticated user, i.e. for the badge of the app.
+
+    Args:
+    - **user** (User): The authenticated user. This parameter is automatically obtained from the request.
+
+    Returns:
+    - **UnreadNotificationsSchema**: The number of unread notifications.
+    """
+
+    return {"unread": await get_unread_count_service(user)}
+
+
+@router.post(
+    "/read",
+    response_model=UnreadNotificationsSchema,
+    status_code=200,
+    summary="Mark notifications as read",
+)
+async def mark_notifications_read(
+    cursor: str | None = None,
+    user: User = Depends(authenticate),
+):
+    """
+    # Mark notifications as read
+
+    This endpoint marks as read every notification of the authenticated user up to a cursor, i.e. the one of the newest notification the user has seen.
+
+    Args:
+    - **cursor** (str | None): The cursor of the newest notification to mark as read. If not specified, all the notifications are marked as read.
+    - **user** (User): The authenticated user. This parameter is automatically obtained from the request.
+
+    Returns:
+    - **UnreadNotificationsSchema**: The number of unread notifications left.
+    """
+
+    try:
+        unread = await mark_notifications_read_service(user, cursor=cursor)
+    except GenericException as e:
+        raise e.http_exception
+    return {"unread": unread}
+
+
 @router.delete(
     "",
     status_code=200,
@@ -23,3 +23,17 @@ class NotificationSchema(BaseModel):
                 "is_read": False,
             }
         }
+
+
+class InboxNotificationSchema(NotificationSchema):
+    cursor: str  # Position of the notification in the inbox
+
+
+class NotificationInboxSchema(BaseModel):
+    notifications: list[InboxNotificationSchema]
+    next_cursor: str | None  # None on the last page
+    unread: int
+
+
+class UnreadNotificationsSchema(BaseModel):
+    unread: int
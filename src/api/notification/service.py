@@ -1,29 +1,64 @@
+import base64
+from collections import Counter
+from datetime import date, datetime, timedelta
 from typing import List
 
-from fastapi import BackgroundTasks
 from firebase_admin import messaging
-from sendgrid import Mail, SendGridAPIClient
-from sqlalchemy import delete, insert, select, update
+from sqlalchemy import (
+    Integer,
+    cast,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from api.notification.exceptions import (
+    InvalidNotificationCursor,
     ThisNotificationDoesNotExist,
     YouAlreadyHaveThisNotificationPreference,
     YouDontHaveThisNotificationPreference,
 )
+from api.notification.models.counter import NotificationCounter
 from api.notification.models.message import Message
 from api.notification.models.notification import Notification
 from api.notification.models.notification_preference import NotificationPreference
-from api.user.models import Device, User
-from api.user.service import get_user_devices
-from config import SENDGRID_CONFIG, TWILIO_NUMBER, WhatsappClient
+from api.notification.models.outbox import NotificationOutbox
+from api.notification.renderer import render, render_batch
+from api.user.models import User
+from cache import TTLCache
+from config import NOTIFICATION_DIGEST_SECONDS, NOTIFICATION_RETENTION_DAYS
 from database import database
 
+FCM_BATCH_SIZE = 500  # The most messages FCM accepts in a call
+# Notifications inserted by every multi-row insert, far from the parameters limit
+NOTIFICATIONS_BULK_SIZE = 1000
+NOTIFICATION_ID_SEQUENCE = "notification_id_seq"
+
+preferences_cache = TTLCache("notification_preferences")
+
+
+def get_retention_cutoff(retention_days: int = NOTIFICATION_RETENTION_DAYS) -> datetime:
+    """
+    Gets the start of the oldest month of notifications that is kept. The older ones are
+    hidden from the inbox, and dropped by the maintenance of the partitions.
+
+    Bounding the queries by it lets Postgres skip the partitions of the older months.
+    """
+
+    day = date.today() - timedelta(days=retention_days)
+    return datetime(day.year, day.month, 1)
+
 
 async def get_notification_preferences(user: User) -> list[str]:
     """
     Get notification preferences.
 
-    This function retrieves the notification preferences for the authenticated user. It queries the database to fetch all notification preferences associated with the user and returns them as a list of strings.
+    This function retrieves the notification preferences for the authenticated user. It queries the database to fetch all notification preferences associated with the user and returns them as a list of strings. The preferences are cached by user.
 
 
     Args:
@@ -33,11 +68,42 @@ async def get_notification_preferences(user: User) -> list[str]:
         list[str]: A list of notification preferences.
     """
 
+    preferences = preferences_cache.get(user.id)
+    if preferences is TTLCache.MISSING:
+        select_query = select(NotificationPreference).where(
+            NotificationPreference.user_id == user.id
+        )
+        results = await database.fetch_all(query=select_query)
+        preferences = [result.notification_preference for result in results]
+        preferences_cache.set(user.id, preferences)
+    return list(preferences)
+
+
+async def prefetch_notification_preferences(users_ids: list[str]):
+    """
+    Loads the notification preferences of many users into the cache, in a single query.
+    The users that are already cached are skipped.
+
+    Args:
+        users_ids (list[str]): The IDs of the users.
+    """
+
+    missing_ids = [
+        user_id
+        for user_id in dict.fromkeys(users_ids)
+        if user_id not in preferences_cache
+    ]
+    if not missing_ids:
+        return
+
     select_query = select(NotificationPreference).where(
-        NotificationPreference.user_id == user.id
+        NotificationPreference.user_id.in_(missing_ids)
     )
-    results = await database.fetch_all(query=select_query)
-    return [result.notification_preference for result in results]
+    preferences = {user_id: [] for user_id in missing_ids}
+    for result in await database.fetch_all(query=select_query):
+        preferences[result.user_id].append(result.notification_preference)
+    for user_id, user_preferences in preferences.items():
+        preferences_cache.set(user_id, user_preferences)
 
 
 async def add_notification_preference(
@@ -71,6 +137,7 @@ async def add_notification_preference(
         .returning(NotificationPreference)
     )
     await database.execute(query=insert_query)
+    preferences_cache.invalidate(user.id)
     preferences = await get_notification_preferences(user)
     return preferences
 
@@ -108,81 +175,177 @@ async def delete_notification_preference(
         .returning(NotificationPreference)
     )
     await database.execute(query=delete_query)
+    preferences_cache.invalidate(user.id)
     preferences = await get_notification_preferences(user)
     return preferences
 
 
-async def send_notification(
-    message: Message, user: User, background_tasks: BackgroundTasks
-):
+def get_deliveries(message: Message, user: User, preferences: list[str]) -> list[dict]:
+    """
+    Gets what every channel of the notification preferences of a user needs to send a
+    message, so the deliveries can be sent later without the message or the user.
+
+    Args:
+        message (Message): The message to send.
+        user (User): The user to send the message to.
+        preferences (list[str]): The notification preferences of the user.
+
+    Returns:
+        list[dict]: The channel and the payload of every delivery.
+    """
+
+    deliveries = []
+    for notification_preference in preferences:
+        if notification_preference == "email":
+            message_data = render(message, "email")
+            payload = {
+                "to": user.email,
+                "hi_message": f"Hola {user.get_fullname()}!",
+                "message": message_data["message"],
+                "subject": message_data["subject"],
+            }
+        elif notification_preference == "whatsapp":
+            payload = {
+                "to": user.phone,
+                "message": render(message, "whatsapp")["message"],
+            }
+        elif notification_preference == "push":
+            # The devices are read when the notification is sent
+            payload = {"user_id": user.id, **render(message, "push")}
+        else:
+            continue
+        deliveries.append({"channel": notification_preference, "payload": payload})
+    return deliveries
+
+
+def get_digest(message: Message, user: User) -> dict:
+    """
+    Gets when the deliveries of a message are due and their digest key. The deliveries of
+    the digest types with a window are held for the window, and then sent together with
+    the deliveries of the same user and digest type that are pending (see
+    api.notification.worker).
+    """
+
+    digest_type = message.digest_type or message.type
+    window = NOTIFICATION_DIGEST_SECONDS.get(digest_type)
+    if not window:
+        return {"digest_key": None, "next_attempt_at": func.now()}
+    return {
+        "digest_key": f"{user.id}:{digest_type}",
+        "next_attempt_at": func.now() + func.make_interval(0, 0, 0, 0, 0, 0, window),
+    }
+
+
+def send_pushes(pushes: list[tuple[dict, str]]) -> list[Exception | None]:
+    """
+    Sends many push notifications with a single call to FCM.
+
+    Args:
+        pushes (list[tuple[dict, str]]): The payload and the device token of every push
+                                         notification, at most FCM_BATCH_SIZE.
+
+    Returns:
+        list[Exception | None]: The error of every push notification, or None if it was sent.
+    """
+
+    messages = [
+        messaging.Message(
+            notification=messaging.Notification(
+                title=payload["title"],
+                body=payload["body"],
+            ),
+            token=token,
+        )
+        for payload, token in pushes
+    ]
+    response = messaging.send_each(messages)
+    return [result.exception for result in response.responses]
+
+
+async def send_notification(message: Message, user: User):
     """
     Send a notification.
 
     This function sends a notification to the authenticated user.
     It inserts a new record in the database with the provided notification data and the user's ID.
-    It also sends the notification to the user's notification preferences (email, WhatsApp, push notification).
+    In the same transaction, it adds a delivery to the outbox for every notification preference of the user (email, WhatsApp, push notification), which the notification worker sends.
 
     Args:
         message (Message): The message to send.
         user (User): The authenticated user.
-        background_tasks (BackgroundTasks): The background tasks object.
     """
 
-    def send_email(message: Message, user: User):
-        message_constructor = Mail(
-            from_email=SENDGRID_CONFIG["email"],
-            to_emails=user.email,
-        )
-        message_constructor.template_id = "d-5e634cd5cd6548b4b440f188c1d2a40a"
-        message_data = message.email()
-        message_constructor.dynamic_template_data = {
-            "hi_message": f"Hola {user.get_fullname()}!",
-            "message": message_data["message"],
-            "subject": message_data["subject"],
-        }
-        client = SendGridAPIClient(SENDGRID_CONFIG["api_key"])
-        client.send(message_constructor)
-
-    def send_whatsapp(message: Message, user: User):
-        WhatsappClient.messages.create(
-            from_=f"whatsapp:{TWILIO_NUMBER}",
-            body=message.whatsapp()["message"],
-            to=f"whatsapp:{user.phone}",
-        )
+    await send_notifications_bulk([(message, user)])
 
-    async def send_push(message: Message, user: User):
-        devices = await get_user_devices(user)
-        message_data = message.push()
-
-        for device in devices:
-            device: Device
-            message_constructor = messaging.Message(
-                notification=messaging.Notification(
-                    title=message_data["title"],
-                    body=message_data["body"],
-                ),
-                token=device.token,
-            )
-            messaging.send(message_constructor)
-
-    notification_preferences = await get_notification_preferences(user)
-
-    message_data = message.push()
-    insert_query = insert(Notification).values(
-        user_id=user.id,
-        title=message_data["title"],
-        body=message_data["body"],
-        type=message.type,
-    )
-    await database.execute(query=insert_query)
 
-    for notification_preference in notification_preferences:
-        if notification_preference == "email":
-            background_tasks.add_task(send_email, message, user)
-        if notification_preference == "whatsapp":
-            background_tasks.add_task(send_whatsapp, message, user)
-        if notification_preference == "push":
-            background_tasks.add_task(send_push, message, user)
+async def send_notifications_bulk(messages: list[tuple[Message, User]]):
+    """
+    Send many notifications at once.
+
+    It works like `send_notification` for every message, but the notification preferences
+    of all the users are loaded in a single query, and all the notifications and all their
+    deliveries are inserted with one multi-row insert each (every NOTIFICATIONS_BULK_SIZE
+    notifications), in a single transaction. The messages are rendered in batches, once
+    for every channel.
+
+    Args:
+        messages (list[tuple[Message, User]]): The messages to send and their users.
+    """
+
+    if not messages:
+        return
+
+    await prefetch_notification_preferences([user.id for _, user in messages])
+    preferences = {
+        user.id: await get_notification_preferences(user) for _, user in messages
+    }
+
+    async with database.transaction():
+        for i in range(0, len(messages), NOTIFICATIONS_BULK_SIZE):
+            chunk = messages[i : i + NOTIFICATIONS_BULK_SIZE]
+            # Every channel is rendered once, then the deliveries reuse it
+            for channel in ["email", "whatsapp"]:
+                render_batch(
+                    [m for m, user in chunk if channel in preferences[user.id]], channel
+                )
+            pushes = render_batch([message for message, _ in chunk], "push")
+            # The IDs are taken from the sequence before the insert, since the rows
+            # returned by a multi-row insert are not in the order of its values
+            select_query = select(
+                func.nextval(NOTIFICATION_ID_SEQUENCE).label("id")
+            ).select_from(func.generate_series(1, cast(literal(len(chunk)), Integer)))
+            notifications_ids = [
+                row.id for row in await database.fetch_all(query=select_query)
+            ]
+            notifications = [
+                {
+                    "id": notification_id,
+                    "user_id": user.id,
+                    "title": push["title"],
+                    "body": push["body"],
+                    "type": message.type,
+                }
+                for notification_id, (message, user), push in zip(
+                    notifications_ids, chunk, pushes
+                )
+            ]
+            insert_query = insert(Notification).values(notifications)
+            await database.execute(query=insert_query)
+
+            deliveries = [
+                {
+                    "notification_id": notification_id,
+                    **delivery,
+                    **get_digest(message, user),
+                }
+                for notification_id, (message, user) in zip(notifications_ids, chunk)
+                for delivery in get_deliveries(message, user, preferences[user.id])
+            ]
+            if deliveries:
+                insert_query = insert(NotificationOutbox).values(deliveries)
+                await database.execute(query=insert_query)
+
+            await update_unread_counters(Counter(user.id for _, user in chunk))
 
 
 async def get_notifications(
@@ -196,7 +359,8 @@ async def get_notifications(
 
     This function retrieves a list of notifications for the authenticated user.
     It retrieves the notifications from the database based on the provided page and per_page parameters.
-    It also updates the is_read field of the retrieved notifications to True.
+    It also marks the retrieved notifications as read, with a range update from the oldest
+    to the newest of them.
 
     Args:
         user (User): The authenticated user.
@@ -210,21 +374,251 @@ async def get_notifications(
 
     select_query = (
         select(Notification)
-        .where(Notification.user_id == user.id)
-        .order_by(Notification.created_at.desc())
+        .where(
+            Notification.user_id == user.id,
+            Notification.created_at >= get_retention_cutoff(),
+        )
+        .order_by(Notification.created_at.desc(), Notification.id.desc())
         .offset((page - 1) * per_page)
         .limit(per_page)
     )
     if type:
         select_query = select_query.where(Notification.type.in_(type))
     notifications = await database.fetch_all(query=select_query)
+    if notifications:
+        await mark_notifications_read(
+            user,
+            cursor=encode_cursor(notifications[0]),
+            since=encode_cursor(notifications[-1]),
+            type=type,
+        )
+    return notifications
+
+
+def encode_cursor(notification: Notification) -> str:
+    """
+    Encodes the position of a notification in the inbox, (created_at, id), as an opaque
+    string.
+    """
+
+    position = f"{notification.created_at.isoformat()}|{notification.id}"
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Decodes a cursor of `encode_cursor` into (created_at, id).
+
+    Raises:
+        InvalidNotificationCursor: If the cursor is not valid.
+    """
+
+    try:
+        created_at, notification_id = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        )
+        return datetime.fromisoformat(created_at), int(notification_id)
+    except ValueError:
+        raise InvalidNotificationCursor
+
+
+async def get_inbox(
+    user: User,
+    cursor: str | None = None,
+    limit: int = 20,
+    type: List[str] = None,
+) -> dict:
+    """
+    Get a page of the inbox.
+
+    This function retrieves the notifications of the authenticated user from the newest to
+    the oldest, starting after the cursor of the last notification of the previous page.
+    The position of a page is found with the (user_id, created_at, id) index, so every
+    page costs the same instead of getting slower the deeper it is, and only the partitions
+    between the retention cutoff and the cursor are scanned.
+
+    Args:
+        user (User): The authenticated user.
+        cursor (str, optional): The `next_cursor` of the previous page. Defaults to the first page.
+        limit (int, optional): The number of notifications of the page. Defaults to 20.
+        type (List[str], optional): The notification types to retrieve. Defaults to None.
+
+    Returns:
+        dict: The notifications of the page with their cursors, the cursor of the next page
+              (None if it is the last one) and the number of unread notifications.
+
+    Raises:
+        InvalidNotificationCursor: If the cursor is not valid.
+    """
+
+    select_query = (
+        select(Notification)
+        .where(
+            Notification.user_id == user.id,
+            Notification.created_at >= get_retention_cutoff(),
+        )
+        .order_by(Notification.created_at.desc(), Notification.id.desc())
+        .limit(limit + 1)
+    )
+    if type:
+        select_query = select_query.where(Notification.type.in_(type))
+    if cursor:
+        created_at, notification_id = decode_cursor(cursor)
+        select_query = select_query.where(
+            # The partitions are only pruned by a plain bound of created_at
+            Notification.created_at <= created_at,
+            tuple_(Notification.created_at, Notification.id)
+            < tuple_(created_at, notification_id),
+        )
+    results = await database.fetch_all(query=select_query)
+
+    notifications = [
+        {**result, "cursor": encode_cursor(result)} for result in results[:limit]
+    ]
+    return {
+        "notifications": notifications,
+        "next_cursor": notifications[-1]["cursor"] if len(results) > limit else None,
+        "unread": await get_unread_count(user),
+    }
+
+
+async def get_unread_count(user: User) -> int:
+    """
+    Get the number of unread notifications of a user, from the counter of the user.
+
+    The first time, the counter is created by counting the unread notifications. The
+    notifications older than the retention are marked as read by the daily maintenance
+    (see `expire_notifications`), so they leave the counter too.
+
+    Args:
+        user (User): The authenticated user.
+
+    Returns:
+        int: The number of unread notifications.
+    """
+
+    select_query = select(NotificationCounter.unread).where(
+        NotificationCounter.user_id == user.id
+    )
+    unread = await database.fetch_val(query=select_query)
+    if unread is None:
+        await create_unread_counters([user.id])
+        unread = await database.fetch_val(query=select_query)
+    return unread
+
+
+async def create_unread_counters(users_ids: list[str], change: int = 0):
+    """
+    Creates the unread counters of some users by counting their unread notifications,
+    with the changes of the current transaction. If another transaction creates a counter
+    first, this one waits for it and adds the change to it instead, so the changes of
+    both transactions are counted once.
+
+    Args:
+        users_ids (list[str]): The IDs of the users.
+        change (int, optional): What the current transaction added to the counters. Defaults to 0.
+    """
+
+    unread = (
+        select(func.count())
+        .where(Notification.user_id == User.id, Notification.is_read.is_(False))
+        .scalar_subquery()
+    )
+    insert_query = (
+        pg_insert(NotificationCounter)
+        .from_select(
+            ["user_id", "unread"],
+            select(User.id, unread).where(User.id.in_(sorted(users_ids))),
+        )
+        .on_conflict_do_update(
+            index_elements=[NotificationCounter.user_id],
+            set_={"unread": func.greatest(NotificationCounter.unread + change, 0)},
+        )
+    )
+    await database.execute(query=insert_query)
+
+
+async def update_unread_counters(changes: dict[str, int]):
+    """
+    Adds to the unread counters of some users, with a query for every distinct change.
+    It must run in the transaction of the writes of the notifications: the users without a
+    counter get one counting their notifications, which already includes the writes.
+
+    Args:
+        changes (dict[str, int]): What to add to the counter of every user (negative to
+                                  subtract), by user ID.
+    """
+
+    users_by_change = {}
+    for user_id, change in changes.items():
+        if change:
+            users_by_change.setdefault(change, []).append(user_id)
+    for change, users_ids in users_by_change.items():
+        update_query = (
+            update(NotificationCounter)
+            # Sorted, so concurrent updates lock the counters in the same order
+            .where(NotificationCounter.user_id.in_(sorted(users_ids)))
+            .values(unread=func.greatest(NotificationCounter.unread + change, 0))
+            .returning(NotificationCounter.user_id)
+        )
+        updated = {row.user_id for row in await database.fetch_all(query=update_query)}
+        missing = [user_id for user_id in users_ids if user_id not in updated]
+        if missing:
+            await create_unread_counters(missing, change)
+
+
+async def mark_notifications_read(
+    user: User,
+    cursor: str | None = None,
+    since: str | None = None,
+    type: List[str] = None,
+) -> int:
+    """
+    Mark notifications as read.
+
+    This function marks as read every notification of the authenticated user up to a
+    cursor, i.e. the one of the newest notification the user has seen, with a single
+    range update.
+
+    Args:
+        user (User): The authenticated user.
+        cursor (str, optional): The cursor of the newest notification to mark. Defaults to all of them.
+        since (str, optional): The cursor of the oldest notification to mark. Defaults to all of them.
+        type (List[str], optional): The notification types to mark. Defaults to None.
+
+    Returns:
+        int: The number of unread notifications left.
+
+    Raises:
+        InvalidNotificationCursor: If the cursor is not valid.
+    """
+
     update_query = (
         update(Notification)
-        .where(Notification.id.in_([notification.id for notification in notifications]))
+        .where(Notification.user_id == user.id, Notification.is_read.is_(False))
         .values(is_read=True)
+        .returning(Notification.id)
     )
-    await database.execute(query=update_query)
-    return notifications
+    if cursor:
+        created_at, notification_id = decode_cursor(cursor)
+        update_query = update_query.where(
+            Notification.created_at <= created_at,
+            tuple_(Notification.created_at, Notification.id)
+            <= tuple_(created_at, notification_id),
+        )
+    if since:
+        created_at, notification_id = decode_cursor(since)
+        update_query = update_query.where(
+            Notification.created_at >= created_at,
+            tuple_(Notification.created_at, Notification.id)
+            >= tuple_(created_at, notification_id),
+        )
+    if type:
+        update_query = update_query.where(Notification.type.in_(type))
+    async with database.transaction():
+        read = await database.fetch_all(query=update_query)
+        await update_unread_counters({user.id: -len(read)})
+    return await get_unread_count(user)
 
 
 async def delete_notification(notification_id: int, user: User):
@@ -243,7 +637,14 @@ async def delete_notification(notification_id: int, user: User):
         .where(Notification.id == notification_id, Notification.user_id == user.id)
         .returning(Notification)
     )
-    result = await database.execute(query=delete_query)
-    if not result:
-        raise ThisNotificationDoesNotExist
+    async with database.transaction():
+        result = await database.fetch_one(query=delete_query)
+        if not result:
+            raise ThisNotificationDoesNotExist
+        delete_query = delete(NotificationOutbox).where(
+            NotificationOutbox.notification_id == notification_id
+        )
+        await database.execute(query=delete_query)
+        if not result.is_read:
+            await update_unread_counters({user.id: -1})
     return result
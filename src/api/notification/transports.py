@@ -0,0 +1,175 @@
+"""
+Transports of the notification providers.
+
+A transport holds a long-lived HTTP client of a provider, so the connections (and their TLS
+handshakes) are reused by every message instead of opening one per message, and it sends
+the messages without blocking the event loop. It also limits the requests per second sent
+to the provider, to stay within its rate limits instead of being throttled by it.
+
+The base URL and the HTTP transport of the client can be replaced, to point a transport to
+a local stand-in of the provider.
+"""
+import asyncio
+import time
+from abc import ABC, abstractmethod
+
+import httpx
+
+from config import (
+    NOTIFICATION_RATE_LIMITS,
+    OUTBOX_CONCURRENCY,
+    SENDGRID_CONFIG,
+    TWILIO_ACCOUNT_SID,
+    TWILIO_AUTH_TOKEN,
+    TWILIO_HOST,
+    TWILIO_NUMBER,
+)
+
+EMAIL_TEMPLATE_ID = "d-5e634cd5cd6548b4b440f188c1d2a40a"
+
+
+class RateLimiter:
+    """
+    Token bucket that allows `rate` requests per second, with bursts of up to `burst`.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Waits until a request can be sent.
+        """
+
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Transport(ABC):
+    """
+    Long-lived HTTP client of a notification provider.
+
+    Args:
+        base_url (str): The base URL of the API of the provider.
+        rate (float): The requests per second allowed by the provider.
+        connections (int): The connections kept open with the provider.
+        transport (httpx.AsyncBaseTransport, optional): Replaces the HTTP transport of
+                                                        the client, i.e. in tests.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        rate: float,
+        connections: int,
+        transport: httpx.AsyncBaseTransport | None = None,
+        **client_options,
+    ):
+        self.limiter = RateLimiter(rate, burst=connections)
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(
+                max_connections=connections, max_keepalive_connections=connections
+            ),
+            timeout=httpx.Timeout(10),
+            transport=transport,
+            **client_options,
+        )
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        """
+        Sends a request to the provider, once the rate limiter allows it.
+
+        Raises:
+            httpx.HTTPError: If the request fails or the provider rejects it.
+        """
+
+        await self.limiter.acquire()
+        response = await self.client.post(url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    @abstractmethod
+    async def send(self, payload: dict):
+        """
+        Sends a message, built by the worker, through the provider.
+        """
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class SendGridTransport(Transport):
+    def __init__(
+        self,
+        base_url: str | None = None,
+        rate: float = NOTIFICATION_RATE_LIMITS["sendgrid"],
+        connections: int = OUTBOX_CONCURRENCY["email"],
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        super().__init__(
+            base_url or SENDGRID_CONFIG["host"],
+            rate,
+            connections,
+            transport,
+            headers={"Authorization": f"Bearer {SENDGRID_CONFIG['api_key']}"},
+        )
+
+    async def send(self, payload: dict):
+        await self.post(
+            "/v3/mail/send",
+            json={
+                "from": {"email": SENDGRID_CONFIG["email"]},
+                "personalizations": [
+                    {
+                        "to": [{"email": payload["to"]}],
+                        "dynamic_template_data": {
+                            "hi_message": payload["hi_message"],
+                            "message": payload["message"],
+                            "subject": payload["subject"],
+                        },
+                    }
+                ],
+                "template_id": EMAIL_TEMPLATE_ID,
+            },
+        )
+
+
+class TwilioTransport(Transport):
+    def __init__(
+        self,
+        base_url: str | None = None,
+        rate: float = NOTIFICATION_RATE_LIMITS["twilio"],
+        connections: int = OUTBOX_CONCURRENCY["whatsapp"],
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        super().__init__(
+            base_url or TWILIO_HOST,
+            rate,
+            connections,
+            transport,
+            auth=(TWILIO_ACCOUNT_SID or "", TWILIO_AUTH_TOKEN or ""),
+        )
+
+    async def send(self, payload: dict):
+        await self.post(
+            f"/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json",
+            data={
+                "From": f"whatsapp:{TWILIO_NUMBER}",
+                "To": f"whatsapp:{payload['to']}",
+                "Body": payload["message"],
+            },
+        )
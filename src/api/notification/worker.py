@@ -0,0 +1,380 @@
+"""
+Sends the deliveries of the notification outbox.
+
+Every channel is drained by its own loop, which claims a batch of due deliveries and sends
+them with at most OUTBOX_CONCURRENCY[channel] at once. The push notifications are sent in
+batches instead, grouping the tokens of all the claimed deliveries in calls of up to
+FCM_BATCH_SIZE messages, and the devices whose tokens are no longer registered are deleted.
+
+The deliveries of a digest (see NOTIFICATION_DIGEST_SECONDS) are held until the first one
+is due, and then all the pending deliveries of the digest are claimed and sent together,
+as a single message.
+
+A claimed delivery is hidden from the other workers for OUTBOX_LEASE_SECONDS, so if a
+worker dies while sending it, another one retries it after the lease. A failed delivery is
+retried with exponential backoff, up to OUTBOX_MAX_ATTEMPTS times, and then it is marked
+as dead.
+
+Usage (from the src folder):
+    python -m api.notification.worker
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from firebase_admin.messaging import UnregisteredError
+from sqlalchemy import func, select, update
+
+from api.notification.models.message import DigestMessage
+from api.notification.models.outbox import NotificationOutbox
+from api.notification.renderer import render_batch
+from api.notification.service import FCM_BATCH_SIZE, send_pushes
+from api.notification.transports import SendGridTransport, TwilioTransport
+from api.user.service import delete_devices, get_users_devices
+from config import (
+    OUTBOX_BACKOFF_SECONDS,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_CONCURRENCY,
+    OUTBOX_LEASE_SECONDS,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_POLL_SECONDS,
+)
+from database import Base, database, engine
+
+logger = logging.getLogger(__name__)
+
+
+async def claim_deliveries(channel: str, limit: int) -> list[NotificationOutbox]:
+    """
+    Claims the oldest due deliveries of a channel, skipping the ones that other workers
+    are claiming at the same time.
+
+    Args:
+        channel (str): The channel.
+        limit (int): The maximum number of deliveries to claim.
+
+    Returns:
+        list[NotificationOutbox]: The claimed deliveries.
+    """
+
+    due_deliveries = (
+        select(NotificationOutbox.id)
+        .where(
+            NotificationOutbox.status == NotificationOutbox.PENDING,
+            NotificationOutbox.channel == channel,
+            NotificationOutbox.next_attempt_at <= func.now(),
+        )
+        .order_by(NotificationOutbox.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    update_query = (
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id.in_(due_deliveries))
+        .values(
+            attempts=NotificationOutbox.attempts + 1,
+            next_attempt_at=func.now()
+            + func.make_interval(0, 0, 0, 0, 0, 0, OUTBOX_LEASE_SECONDS),
+        )
+        .returning(NotificationOutbox)
+    )
+    deliveries = [
+        NotificationOutbox(**delivery)
+        for delivery in await database.fetch_all(query=update_query)
+    ]
+
+    digest_keys = {
+        delivery.digest_key for delivery in deliveries if delivery.digest_key
+    }
+    if digest_keys:
+        deliveries += await claim_digests(channel, sorted(digest_keys))
+    return deliveries
+
+
+async def claim_digests(
+    channel: str, digest_keys: list[str]
+) -> list[NotificationOutbox]:
+    """
+    Claims the pending deliveries of some digests of a channel that are not due yet, so
+    they are sent with the due ones.
+
+    Only the deliveries that were never attempted are claimed, the rest are either claimed
+    by another worker or waiting for a retry.
+
+    Args:
+        channel (str): The channel.
+        digest_keys (list[str]): The keys of the digests.
+
+    Returns:
+        list[NotificationOutbox]: The claimed deliveries.
+    """
+
+    pending_deliveries = (
+        select(NotificationOutbox.id)
+        .where(
+            NotificationOutbox.status == NotificationOutbox.PENDING,
+            NotificationOutbox.channel == channel,
+            NotificationOutbox.digest_key.in_(digest_keys),
+            NotificationOutbox.attempts == 0,
+        )
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    update_query = (
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id.in_(pending_deliveries))
+        .values(
+            attempts=NotificationOutbox.attempts + 1,
+            next_attempt_at=func.now()
+            + func.make_interval(0, 0, 0, 0, 0, 0, OUTBOX_LEASE_SECONDS),
+        )
+        .returning(NotificationOutbox)
+    )
+    deliveries = await database.fetch_all(query=update_query)
+    return [NotificationOutbox(**delivery) for delivery in deliveries]
+
+
+def coalesce_deliveries(
+    deliveries: list[NotificationOutbox],
+) -> list[tuple[list[NotificationOutbox], dict]]:
+    """
+    Groups the deliveries of every digest, with the payload of the digest message. The
+    deliveries without a digest are sent alone, with their payload.
+
+    Returns:
+        list[tuple[list[NotificationOutbox], dict]]: The deliveries that are sent together
+                                                     and their payload.
+    """
+
+    groups = []
+    digests = {}
+    for delivery in deliveries:
+        if delivery.digest_key is None:
+            groups.append(([delivery], delivery.payload))
+        else:
+            digests.setdefault(delivery.digest_key, []).append(delivery)
+    for digest in digests.values():
+        digest.sort(key=lambda delivery: delivery.id)
+        groups.append((digest, get_digest_payload(digest)))
+    return groups
+
+
+def get_digest_payload(deliveries: list[NotificationOutbox]) -> dict:
+    """
+    Gets the payload of the message that sends many deliveries of a channel together, with
+    the recipient of the first one.
+    """
+
+    payloads = [delivery.payload for delivery in deliveries]
+    if len(payloads) == 1:
+        return payloads[0]
+    digest = DigestMessage(payloads=payloads)
+    return {**payloads[0], **render_batch([digest], deliveries[0].channel)[0]}
+
+
+async def mark_sent(deliveries_ids: list[int]):
+    update_query = (
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id.in_(deliveries_ids))
+        .values(status=NotificationOutbox.SENT, sent_at=func.now())
+    )
+    await database.execute(query=update_query)
+
+
+async def mark_failed(delivery: NotificationOutbox, error: Exception):
+    """
+    Schedules the retry of a failed delivery, or marks it as dead if it has no attempts left.
+    """
+
+    if delivery.attempts >= OUTBOX_MAX_ATTEMPTS:
+        values = {"status": NotificationOutbox.DEAD}
+    else:
+        backoff = OUTBOX_BACKOFF_SECONDS * 2 ** (delivery.attempts - 1)
+        values = {
+            "next_attempt_at": func.now()
+            + func.make_interval(0, 0, 0, 0, 0, 0, backoff)
+        }
+    update_query = (
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id == delivery.id)
+        .values(last_error=repr(error)[:1000], **values)
+    )
+    await database.execute(query=update_query)
+
+
+class Worker:
+    """
+    Drains the notification outbox, with a loop and a concurrency limit for every channel.
+
+    The emails and the WhatsApp messages are sent by the transports of SendGrid and Twilio,
+    which the worker keeps open while it runs. The push notifications are sent with the SDK
+    of Firebase, which is blocking, so they run in a thread pool. A sender can be any
+    function or coroutine function that takes the payload of a delivery.
+    """
+
+    def __init__(
+        self,
+        senders: dict[str, Callable] | None = None,
+        concurrency: dict[str, int] = OUTBOX_CONCURRENCY,
+    ):
+        self.transports = []
+        if senders is None:
+            email = SendGridTransport(connections=concurrency["email"])
+            whatsapp = TwilioTransport(connections=concurrency["whatsapp"])
+            self.transports = [email, whatsapp]
+            senders = {
+                "email": email.send,
+                "whatsapp": whatsapp.send,
+                "push": send_pushes,
+            }
+        self.senders = senders
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=sum(concurrency.values()))
+        self.stopped = asyncio.Event()
+
+    async def run(self):
+        try:
+            await asyncio.gather(
+                *[self.run_channel(channel) for channel in self.senders]
+            )
+        finally:
+            for transport in self.transports:
+                await transport.close()
+
+    def stop(self):
+        self.stopped.set()
+
+    async def run_channel(self, channel: str):
+        while not self.stopped.is_set():
+            try:
+                sent = await self.drain(channel)
+            except Exception:
+                logger.exception("The worker of the %s channel failed", channel)
+                sent = 0
+            if not sent:
+                try:
+                    await asyncio.wait_for(self.stopped.wait(), OUTBOX_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def drain(self, channel: str) -> int:
+        """
+        Claims a batch of deliveries of a channel and sends them.
+
+        Returns:
+            int: The number of claimed deliveries.
+        """
+
+        semaphore = asyncio.Semaphore(self.concurrency[channel])
+        if channel == "push":
+            deliveries = await claim_deliveries(channel, FCM_BATCH_SIZE)
+        else:
+            deliveries = await claim_deliveries(channel, OUTBOX_BATCH_SIZE)
+        groups = coalesce_deliveries(deliveries)
+        payloads = [payload for _, payload in groups]
+        if channel == "push":
+            errors = await self.send_pushes(payloads, semaphore)
+        else:
+            errors = await asyncio.gather(
+                *[self.send(channel, payload, semaphore) for payload in payloads]
+            )
+
+        sent = []
+        for (group, _), error in zip(groups, errors):
+            for delivery in group:
+                if error:
+                    await mark_failed(delivery, error)
+                else:
+                    sent.append(delivery.id)
+        if sent:
+            await mark_sent(sent)
+        return len(deliveries)
+
+    async def run_sender(self, channel: str, *args):
+        sender = self.senders[channel]
+        if asyncio.iscoroutinefunction(sender):
+            return await sender(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, sender, *args)
+
+    async def send(
+        self, channel: str, payload: dict, semaphore: asyncio.Semaphore
+    ) -> Exception | None:
+        async with semaphore:
+            try:
+                await self.run_sender(channel, payload)
+            except Exception as e:
+                return e
+
+    async def send_pushes(
+        self, payloads: list[dict], semaphore: asyncio.Semaphore
+    ) -> list[Exception | None]:
+        """
+        Sends many push notifications to all the devices of their users, in calls of up to
+        FCM_BATCH_SIZE messages.
+
+        A push notification is sent if it reached a device, or if all the devices of its
+        user are unregistered (or there are none). Otherwise it fails with the error of one
+        of the devices.
+
+        Returns:
+            list[Exception | None]: The error of every push notification, or None if it
+                                    was sent.
+        """
+
+        if not payloads:
+            return []
+        devices = await get_users_devices(
+            list({payload["user_id"] for payload in payloads})
+        )
+        pushes = [
+            (i, device.token)
+            for i, payload in enumerate(payloads)
+            for device in devices.get(payload["user_id"], [])
+        ]
+        chunks = [
+            pushes[i : i + FCM_BATCH_SIZE]
+            for i in range(0, len(pushes), FCM_BATCH_SIZE)
+        ]
+
+        async def send_chunk(chunk: list[tuple[int, str]]) -> list[Exception | None]:
+            async with semaphore:
+                try:
+                    return await self.run_sender(
+                        "push", [(payloads[i], token) for i, token in chunk]
+                    )
+                except Exception as e:
+                    return [e] * len(chunk)
+
+        results = await asyncio.gather(*[send_chunk(chunk) for chunk in chunks])
+
+        errors: list[Exception | None] = [None] * len(payloads)
+        reached = set()
+        unregistered = []
+        for chunk, chunk_errors in zip(chunks, results):
+            for (i, token), error in zip(chunk, chunk_errors):
+                if error is None:
+                    reached.add(i)
+                elif isinstance(error, UnregisteredError):
+                    unregistered.append(token)
+                else:
+                    errors[i] = error
+        if unregistered:
+            await delete_devices(unregistered)
+        return [None if i in reached else error for i, error in enumerate(errors)]
+
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    Base.metadata.create_all(bind=engine)
+    await database.connect()
+    try:
+        await Worker().run()
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,196 @@
+"""
+Pool of processes that run the predictions of the model by image.
+
+A prediction of the model takes the CPU for tens of ms, which would block the event loop
+(and every other request) if it ran in it. Every process of the pool loads the model
+once, when it starts, and the images are sent to them already preprocessed, as tensors
+in shared memory instead of pickled.
+
+The processes are started on the first prediction (or by `start`). They are spawned, not
+forked: a fork of the API would copy the locks of its threads (the ones of the database,
+of TensorFlow...) in whatever state they are, held or not.
+
+The images of concurrent requests are predicted together by `batcher`, since most of the
+time of a prediction is the overhead of the call to the model, not the images.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from api.prediction.registry import get_model
+from config import (
+    PREDICTION_IMAGE_BATCH_SIZE,
+    PREDICTION_IMAGE_BATCH_WAIT_MS,
+    PREDICTION_IMAGE_WORKERS,
+)
+
+executor: ProcessPoolExecutor | None = None
+
+
+def load_model():
+    """
+    Loads the model in a process of the pool, when it starts.
+    """
+
+    get_model("by_image")
+
+
+def predict_shared(name: str, shape: tuple, dtype: str) -> np.ndarray:
+    """
+    Predicts the tensor of a shared memory block, in a process of the pool.
+    """
+
+    block = shared_memory.SharedMemory(name=name)
+    tensor = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    try:
+        return np.asarray(get_model("by_image").predict(tensor))
+    finally:
+        # The block can not be closed while an array uses its buffer
+        del tensor
+        block.close()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global executor
+    if executor is None:
+        # The processes have to share the resource tracker of the API, which tracks the
+        # shared memory blocks, so it runs before they are spawned
+        resource_tracker.ensure_running()
+        executor = ProcessPoolExecutor(
+            max_workers=PREDICTION_IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=load_model,
+        )
+    return executor
+
+
+async def start():
+    """
+    Starts the processes of the pool, which load the model, before the first prediction.
+    """
+
+    # A spawned pool only starts a process for a call when none is idle, so there is a
+    # concurrent call for every process
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    await asyncio.gather(
+        *[
+            loop.run_in_executor(executor, load_model)
+            for _ in range(PREDICTION_IMAGE_WORKERS)
+        ]
+    )
+
+
+def shutdown():
+    """
+    Stops the processes of the pool, waiting for the predictions they are running. It
+    blocks, so the event loop runs it in a thread.
+    """
+
+    global executor
+    if executor is not None:
+        executor.shutdown(cancel_futures=True)
+        executor = None
+
+
+async def predict(tensor: np.ndarray) -> np.ndarray:
+    """
+    Predicts a batch of preprocessed images with the model by image, in the pool.
+
+    Args:
+        tensor (np.ndarray): The images, with shape (images, 32, 32, 3).
+
+    Returns:
+        np.ndarray: The probabilities of every class for every image.
+    """
+
+    block = shared_memory.SharedMemory(create=True, size=tensor.nbytes)
+    try:
+        np.ndarray(tensor.shape, dtype=tensor.dtype, buffer=block.buf)[:] = tensor
+        return await asyncio.get_running_loop().run_in_executor(
+            get_executor(), predict_shared, block.name, tensor.shape, tensor.dtype.str
+        )
+    finally:
+        block.close()
+        block.unlink()
+
+
+class MicroBatcher:
+    """
+    Collects the images of concurrent predictions, for up to `max_wait_ms` or until there
+    are `max_size` images, and predicts them with a single call to the model.
+
+    Args:
+        predict (Callable): The function that predicts a batch of images, like `predict`.
+        max_size (int): The most images of a batch, 1 disables the batching.
+        max_wait_ms (float): The most that the first image of a batch waits for others.
+    """
+
+    def __init__(self, predict, max_size: int, max_wait_ms: float):
+        self.predict_batch = predict
+        self.max_size = max_size
+        self.max_wait_ms = max_wait_ms
+        self.pending: list[tuple[np.ndarray, asyncio.Future]] = []
+        self.timer: asyncio.TimerHandle | None = None
+        self.tasks: set[asyncio.Task] = set()
+
+    async def predict(self, tensor: np.ndarray) -> np.ndarray:
+        """
+        Predicts images in the next batch.
+
+        Args:
+            tensor (np.ndarray): The images, with shape (images, 32, 32, 3).
+
+        Returns:
+            np.ndarray: The probabilities of every class for every image.
+        """
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((tensor, future))
+        if sum(len(tensor) for tensor, _ in self.pending) >= self.max_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_wait_ms / 1000, self.flush)
+        return await future
+
+    def flush(self):
+        """
+        Predicts the pending images, in a task, without waiting for more.
+        """
+
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            # The task is kept until it ends, the loop only keeps a weak reference
+            task = asyncio.create_task(self.run(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def run(self, batch: list[tuple[np.ndarray, asyncio.Future]]):
+        try:
+            probabilities = await self.predict_batch(
+                np.concatenate([tensor for tensor, _ in batch])
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Every request gets the rows of its images
+        start = 0
+        for tensor, future in batch:
+            if not future.done():
+                future.set_result(probabilities[start : start + len(tensor)])
+            start += len(tensor)
+
+
+batcher = MicroBatcher(
+    predict, PREDICTION_IMAGE_BATCH_SIZE, PREDICTION_IMAGE_BATCH_WAIT_MS
+)
@@ -1,7 +1,5 @@
-from sklearn.preprocessing import LabelEncoder
 from sqlalchemy import Column, ForeignKey, String
 from sqlalchemy.orm import relationship
-from tensorflow.keras.models import load_model
 
 from api.prediction.models.prediction import Prediction
 from models import CRUD
@@ -15,11 +13,6 @@ classes = [
     "Melanocytic nevi",
     "Vascular lesions",
 ]
-le = LabelEncoder()
-le.fit(classes)
-le.inverse_transform([2])
-
-model_trained = load_model("api/prediction/trained/by_image.trained")
 
 
 class DiseaseImage(CRUD):
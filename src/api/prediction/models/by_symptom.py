@@ -1,5 +1,3 @@
-from joblib import load
-from sklearn.tree import DecisionTreeClassifier
 from sqlalchemy import Column, ForeignKey, String
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
@@ -7,14 +5,6 @@ from sqlalchemy.orm import relationship
 from api.prediction.models.prediction import Prediction
 from models import CRUD
 
-model_trained: DecisionTreeClassifier = load(
-    "api/prediction/trained/by_symptom.trained"
-)
-
-symptoms = model_trained.feature_names_in_
-symptoms_template = {symptom: 0 for symptom in symptoms}
-diseases = model_trained.classes_
-
 
 class DiseaseSymptoms(CRUD):
     __tablename__ = "verified_disease_symptoms"
@@ -0,0 +1,118 @@
+"""
+Registry of the trained models of the predictions, loaded on demand.
+
+TensorFlow and scikit-learn take seconds and hundreds of MB to import, and the models
+take as much to load, so neither is done when the app is imported: a model is loaded
+(with its library) the first time it is used, and the processes that never predict (i.e.
+the jobs, the notification worker and most of the tests) never pay for them.
+
+The API can load them ahead with `warm_up`, on startup (see PREDICTION_WARM_UP).
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable
+
+from config import PREDICTION_MODELS_FOLDER
+
+logger = logging.getLogger(__name__)
+
+
+def load_by_image(path: str) -> Any:
+    from tensorflow.keras.models import load_model
+
+    return load_model(path)
+
+
+def load_by_symptom(path: str) -> Any:
+    from joblib import load
+
+    return load(path)
+
+
+# The loader and the file (in PREDICTION_MODELS_FOLDER) of every model
+MODELS: dict[str, tuple[Callable[[str], Any], str]] = {
+    "by_image": (load_by_image, "by_image.trained"),
+    "by_symptom": (load_by_symptom, "by_symptom.trained"),
+}
+
+# The version and the model of every loaded model
+models: dict[str, tuple[str | None, Any]] = {}
+lock = threading.Lock()
+
+
+def get_model_file_version(name: str) -> str | None:
+    """
+    Gets the version of the file of a model, which changes when the file is replaced, or
+    None if there is no file (its loader raises the error, if any).
+    """
+
+    try:
+        stat = os.stat(f"{PREDICTION_MODELS_FOLDER}/{MODELS[name][1]}")
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def get_versioned_model(name: str) -> tuple[str | None, Any]:
+    """
+    Gets a trained model and its version, loading it the first time, and again when its
+    file changes (i.e. it is retrained).
+
+    Args:
+        name (str): The name of the model, i.e. "by_image".
+
+    Returns:
+        tuple[str | None, Any]: The version and the model.
+    """
+
+    version = get_model_file_version(name)
+    loaded = models.get(name)
+    if loaded is None or loaded[0] != version:
+        # Only one thread loads a model, the others wait for it
+        with lock:
+            loaded = models.get(name)
+            if loaded is None or loaded[0] != version:
+                loader, file_name = MODELS[name]
+                start = time.perf_counter()
+                model = loader(f"{PREDICTION_MODELS_FOLDER}/{file_name}")
+                logger.info(
+                    "Loaded the %s model (version %s) in %.2f s",
+                    name,
+                    version,
+                    time.perf_counter() - start,
+                )
+                loaded = models[name] = (version, model)
+    return loaded
+
+
+def get_model(name: str) -> Any:
+    """
+    Gets a trained model, loading it the first time, and again when its file changes.
+
+    Args:
+        name (str): The name of the model, i.e. "by_image".
+
+    Returns:
+        Any: The model.
+    """
+
+    return get_versioned_model(name)[1]
+
+
+def warm_up(names: list[str]):
+    """
+    Loads models ahead, so the first prediction does not wait for them.
+
+    A model that fails to load is logged and left to load on its first prediction.
+
+    Args:
+        names (list[str]): The names of the models.
+    """
+
+    for name in names:
+        try:
+            get_model(name)
+        except Exception:
+            logger.exception("Could not warm up the %s model", name)
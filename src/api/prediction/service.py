@@ -1,24 +1,30 @@
+import asyncio
 import json
+import statistics
+import time
+import warnings
+from collections import deque
 from datetime import datetime
+from functools import lru_cache
 
 import numpy as np
-import pandas as pd
 from fastapi import UploadFile
 from PIL import Image
 from sqlalchemy import insert, select, update
 
 from api.image.service import anonymous_copy_image, save_image
+from api.prediction import inference
 from api.prediction.exceptions import (
     NotValidSymptoms,
     PredictionAlreadyVerified,
     PredictionDoesNotExist,
 )
 from api.prediction.models.by_image import DiseaseImage, PredictionByImage
-from api.prediction.models.by_image import model_trained as model_trained_by_image
 from api.prediction.models.by_symptom import DiseaseSymptoms, PredictionBySymptom
-from api.prediction.models.by_symptom import model_trained as model_trained_by_symptom
-from api.prediction.models.by_symptom import symptoms, symptoms_template
+from api.prediction.registry import get_model, get_versioned_model
 from api.user.models import User
+from cache import TTLCache
+from config import PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL_SECONDS
 from database import database
 
 file = "api/search/indexes/codes_translated.json"
@@ -26,6 +32,104 @@ with open(file, "r", encoding="utf-8") as f:
     codes = json.load(f)
 
 
+# The predictions by symptoms, by version of the model and set of symptoms
+predictions_cache = TTLCache(
+    "symptoms_predictions",
+    maxsize=PREDICTION_CACHE_SIZE,
+    ttl=PREDICTION_CACHE_TTL_SECONDS,
+)
+# The ms of the last predictions by symptoms, whether they were cached or not
+predictions_latencies = {"hit": deque(maxlen=1000), "miss": deque(maxlen=1000)}
+
+
+@lru_cache(maxsize=1)
+def get_symptoms_columns(model) -> dict[str, int]:
+    """
+    Gets the column of every symptom in the features of the model by symptom.
+    """
+
+    return {symptom: column for column, symptom in enumerate(model.feature_names_in_)}
+
+
+def predict_symptoms(symptoms_typed: list[str], n: int = 5) -> list[dict]:
+    """
+    Predicts the most probable diseases of symptoms with the model by symptom.
+
+    The features are built as a NumPy row, with the columns of the symptoms set, instead
+    of a DataFrame with every symptom.
+
+    Args:
+        symptoms_typed (list[str]): The codes of the symptoms.
+        n (int, optional): The amount of diseases. Defaults to 5.
+
+    Returns:
+        list[dict]: The code and the probability of the diseases, the most probable first.
+    """
+
+    model = get_model("by_symptom")
+    columns = get_symptoms_columns(model)
+    features = np.zeros((1, len(columns)), dtype=np.float32)
+    for symptom in symptoms_typed:
+        column = columns.get(symptom)
+        if column is None:
+            raise NotValidSymptoms
+        features[0, column] = 1
+
+    with warnings.catch_warnings():
+        # The model was fitted with the names of the symptoms, the row has none
+        warnings.filterwarnings("ignore", "X does not have valid feature names")
+        probabilities = model.predict_proba(features)[0]
+
+    predictions = np.argsort(probabilities)[-n:][::-1]
+    return [
+        {"disease": model.classes_[i], "probability": probabilities[i]}
+        for i in predictions
+    ]
+
+
+def predict_symptoms_cached(symptoms_typed: list[str]) -> list[dict]:
+    """
+    Predicts the most probable diseases of symptoms like `predict_symptoms`, cached by
+    version of the model and set of symptoms, so the order and the repeated symptoms do
+    not matter and a retrained model is not answered with the predictions of the former.
+
+    Args:
+        symptoms_typed (list[str]): The codes of the symptoms.
+
+    Returns:
+        list[dict]: The code and the probability of the diseases, the most probable first.
+    """
+
+    start = time.perf_counter()
+    version = get_versioned_model("by_symptom")[0]
+    key = (version, tuple(sorted(set(symptoms_typed))))
+    results = predictions_cache.get(key)
+    outcome = "hit"
+    if results is TTLCache.MISSING:
+        results = predict_symptoms(symptoms_typed)
+        predictions_cache.set(key, results)
+        outcome = "miss"
+    predictions_latencies[outcome].append((time.perf_counter() - start) * 1000)
+    # The results are modified by the callers, the cached ones are not
+    return [dict(result) for result in results]
+
+
+def get_predictions_stats() -> dict:
+    """
+    Gets the size, hits, misses and hit ratio of the cache of the predictions by
+    symptoms, and the median and 99th percentile of their latency in ms, by outcome.
+    """
+
+    stats = predictions_cache.stats()
+    for outcome, latencies in predictions_latencies.items():
+        latencies = sorted(latencies)
+        stats[f"{outcome}_median_ms"] = statistics.median(latencies or [0])
+        stats[f"{outcome}_p99_ms"] = (
+            latencies[int(len(latencies) * 0.99)] if latencies else 0
+        )
+    return stats
+
+
 async def predict_by_symptoms(symptoms_typed: list[str], user: User) -> list[dict]:
     """
     Predicts diseases based on typed symptoms.
@@ -38,26 +142,9 @@ async def predict_by_symptoms(symptoms_typed: list[str], user: User) -> list[dic
         list[dict]: A list of dictionaries containing disease predictions and their probabilities.
     """
 
-    for symptom in symptoms_typed:
-        if symptom not in symptoms:
-            raise NotValidSymptoms
-
-    symptoms_df = pd.DataFrame(
-        [{**symptoms_template, **{symptom: 1 for symptom in symptoms_typed}}]
-    )
-    symptoms_df = symptoms_df.reindex(columns=symptoms)
-    probabilities = model_trained_by_symptom.predict_proba(symptoms_df)
-
-    n = 5
-    predictions = np.argsort(probabilities[0])[-n:][::-1]
-    results = [
-        {
-            "disease": model_trained_by_symptom.classes_[predictions][i],
-            "probability": probabilities[0][predictions[i]],
-        }
-        for i in range(len(predictions))
-    ]
+    results = predict_symptoms_cached(symptoms_typed)
 
+    # Every prediction is saved, even the cached ones
     insert_query = insert(PredictionBySymptom).values(
         user_id=user.id,
         symptoms=symptoms_typed,
@@ -167,16 +254,10 @@ async def predict_by_image(file: UploadFile, user: User) -> list[dict]:
         list[dict]: A list of dictionaries containing disease predictions and their probabilities.
     """
 
-    def _predict():
+    def get_tensor() -> np.ndarray:
         img = np.asarray(Image.open(file.file).resize((32, 32)))
         img = img / 255.0  # Scale pixel values
-        img = np.expand_dims(img, axis=0)  # Get it tready as input to the network
-
-        prediction = model_trained_by_image.predict(img)
-        return [
-            {"disease": classes[i], "probability": round(float(prediction[0][i]), 2)}
-            for i in np.argsort(prediction[0])[::-1]
-        ]
+        return np.expand_dims(img, axis=0)  # Get it tready as input to the network
 
     classes = [
         "Queratosis actínica",
@@ -189,7 +270,14 @@ async def predict_by_image(file: UploadFile, user: User) -> list[dict]:
     ]
 
     file_name = await save_image(file.file, user=user, tag="prediction_by_image")
-    prediction = _predict()
+    # The model runs in the inference pool, so it does not block the event loop, with
+    # the images of the concurrent requests
+    tensor = await asyncio.to_thread(get_tensor)
+    probabilities = (await inference.batcher.predict(tensor))[0]
+    prediction = [
+        {"disease": classes[i], "probability": round(float(probabilities[i]), 2)}
+        for i in np.argsort(probabilities)[::-1]
+    ]
 
     insert_query = insert(PredictionByImage).values(
         image_name=file_name,
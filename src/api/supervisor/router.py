@@ -1,5 +1,4 @@
 from fastapi import APIRouter, Depends
-from starlette.background import BackgroundTasks
 
 from api.auth.dependencies import authenticate
 from api.exceptions import GenericException
@@ -17,7 +16,6 @@ router = APIRouter(prefix="/supervisors", tags=["Supervisors"])
 @router.post("/invitation", status_code=200, summary="Accept invitation")
 async def accept_invitation(
     code: str,
-    background_tasks: BackgroundTasks,
     user: User = Depends(authenticate),
 ):
     """
@@ -31,7 +29,7 @@ async def accept_invitation(
     """
 
     try:
-        await accept_invitation_service(user, code, background_tasks)
+        await accept_invitation_service(user, code)
     except GenericException as e:
         raise e.http_exception
 
@@ -1,8 +1,7 @@
 from sqlalchemy import delete, insert, select, update
-from starlette.background import BackgroundTasks
 
 from api.notification.models.message import NewSupervisedMessage, NewSupervisorMessage
-from api.notification.service import send_notification
+from api.notification.service import send_notifications_bulk
 from api.supervisor.exceptions import (
     InvalidInvitationCode,
     SupervisedNotFound,
@@ -15,14 +14,13 @@ from api.user.utils import generate_code
 from database import database
 
 
-async def accept_invitation(user: User, code: str, background_tasks: BackgroundTasks):
+async def accept_invitation(user: User, code: str):
     """
     Accepts an invitation from a supervisor.
 
     Args:
         user (User): The user accepting the invitation.
         code (str): The invitation code.
-        background_tasks (BackgroundTasks): Background tasks to be executed.
     """
 
     select_query = select(User).where(User.invitation == code)
@@ -52,19 +50,11 @@ async def accept_invitation(user: User, code: str, background_tasks: BackgroundT
     await database.execute(insert_query)
     await database.execute(update_query)
 
-    await send_notification(
-        NewSupervisorMessage(
-            supervisor=User(**supervisor),
-        ),
-        user=User(**user),
-        background_tasks=background_tasks,
-    )
-    await send_notification(
-        NewSupervisedMessage(
-            supervised=User(**user),
-        ),
-        user=User(**supervisor),
-        background_tasks=background_tasks,
+    await send_notifications_bulk(
+        [
+            (NewSupervisorMessage(supervisor=User(**supervisor)), User(**user)),
+            (NewSupervisedMessage(supervised=User(**user)), User(**supervisor)),
+        ]
     )
 
 
@@ -104,6 +94,28 @@ async def get_supervised(user: User) -> list[User]:
     return supervised
 
 
+async def get_users_supervised(users_ids: list[str]) -> dict[str, list[User]]:
+    """
+    Gets the supervised users of many supervisors, with a single query.
+
+    Args:
+        users_ids (list[str]): The IDs of the users (supervisors).
+
+    Returns:
+        dict[str, list[User]]: The supervised users of each supervisor, by supervisor ID.
+    """
+
+    query = select(Supervised.supervisor_id, User).where(
+        Supervised.supervisor_id.in_(users_ids), User.id == Supervised.supervised_id
+    )
+    supervised = {}
+    for row in await database.fetch_all(query):
+        supervised.setdefault(row.supervisor_id, []).append(
+            User(**{column.name: row[column.name] for column in User.__table__.columns})
+        )
+    return supervised
+
+
 async def delete_supervisor(supervisor_id: str, user: User) -> bool:
     """
     Deletes a supervisor from the supervised list.
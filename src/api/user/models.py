@@ -38,6 +38,7 @@ class User(CRUD):
     sex = Column(Boolean, nullable=True)
     birth = Column(DateTime, nullable=True)
     phone = Column(String(20), nullable=True)
+    timezone = Column(String(64), nullable=True, index=True)  # IANA name
 
     def get_age(self):
         today = datetime.date.today()
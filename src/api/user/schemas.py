@@ -1,6 +1,7 @@
 import datetime
+import zoneinfo
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, validator
 
 
 class UserUpdateSchema(BaseModel):
@@ -11,6 +12,13 @@ class UserUpdateSchema(BaseModel):
     sex: bool | None
     birth: datetime.datetime | None
     phone: str | None
+    timezone: str | None
+
+    @validator("timezone")
+    def validate_timezone(cls, timezone):
+        if timezone is not None and timezone not in zoneinfo.available_timezones():
+            raise ValueError("Unknown timezone")
+        return timezone
 
 
 class UserSchema(UserUpdateSchema):
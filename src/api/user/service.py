@@ -5,8 +5,11 @@ from sqlalchemy import delete, insert, select, update
 from api.user.models import Device, User
 from api.user.schemas import UserUpdateSchema
 from api.user.utils import generate_code
+from cache import TTLCache
 from database import database
 
+devices_cache = TTLCache("devices")
+
 
 async def get_or_create_user(user_id: str, email: str) -> User:
     """
@@ -58,6 +61,7 @@ async def assert_device(user: User, device_token: str) -> bool:
             insert(Device).values(user_id=user.id, token=device_token).returning(Device)
         )
         device = await database.fetch_one(query=insert_query)
+        devices_cache.invalidate(user.id)
     else:
         update_query = (
             update(Device)
@@ -70,7 +74,7 @@ async def assert_device(user: User, device_token: str) -> bool:
     return device
 
 
-async def get_user_devices(user: User) -> list[User]:
+async def get_user_devices(user: User) -> list[Device]:
     """
     Retrieves a user's devices from the database.
 
@@ -78,14 +82,60 @@ async def get_user_devices(user: User) -> list[User]:
         user (User): The user object to retrieve devices for.
 
     Returns:
-        list[User]: The list of devices associated with the user.
+        list[Device]: The list of devices associated with the user.
+    """
+
+    devices = await get_users_devices([user.id])
+    return devices[user.id]
+
+
+async def get_users_devices(users_ids: list[str]) -> dict[str, list[Device]]:
+    """
+    Retrieves the devices of many users. The devices are cached by user, and the users
+    that are not cached are loaded from the database in a single query.
+
+    Args:
+        users_ids (list[str]): The IDs of the users.
+
+    Returns:
+        dict[str, list[Device]]: The devices of every user, by user ID.
     """
 
-    select_query = select(Device).where(Device.user_id == user.id)
-    devices = await database.fetch_all(query=select_query)
+    devices = {}
+    for user_id in dict.fromkeys(users_ids):
+        user_devices = devices_cache.get(user_id)
+        if user_devices is not TTLCache.MISSING:
+            devices[user_id] = list(user_devices)
+
+    missing_ids = [
+        user_id for user_id in dict.fromkeys(users_ids) if user_id not in devices
+    ]
+    if missing_ids:
+        select_query = select(Device).where(Device.user_id.in_(missing_ids))
+        loaded = {user_id: [] for user_id in missing_ids}
+        for device in await database.fetch_all(query=select_query):
+            loaded[device.user_id].append(Device(**device))
+        for user_id, user_devices in loaded.items():
+            devices_cache.set(user_id, user_devices)
+            devices[user_id] = list(user_devices)
     return devices
 
 
+async def delete_devices(tokens: list[str]):
+    """
+    Deletes the devices with some tokens, i.e. the ones that are no longer registered.
+
+    Args:
+        tokens (list[str]): The tokens of the devices.
+    """
+
+    delete_query = (
+        delete(Device).where(Device.token.in_(tokens)).returning(Device.user_id)
+    )
+    deleted = await database.fetch_all(query=delete_query)
+    devices_cache.invalidate(*[device.user_id for device in deleted])
+
+
 def get_user(user_id: str) -> User:
     """
     Retrieves a user from the database based on the given user ID.
@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
@@ -7,12 +8,17 @@ import config
 from api.appointment.router import router as appointment_router
 from api.calendar.router import router as calendar_router
 from api.dev_tools.router import router as dev_tools_router
+from api.dev_tools.router import stats_router as dev_tools_stats_router
 from api.export.router import router as export_router
 from api.image.router import router as image_router
 from api.jobs.router import router as jobs_router
+from api.jobs.scheduler import Scheduler
 from api.measurement.router import router as measurement_router
 from api.medicine.router import router as medicine_router
+from api.notification.partitions import ensure_partitions
 from api.notification.router import router as notification_router
+from api.prediction import inference
+from api.prediction.registry import warm_up
 from api.prediction.router import router as prediction_router
 from api.search.router import router as search_router
 from api.supervisor.router import router as supervisor_router
@@ -23,8 +29,21 @@ from database import Base, database, engine
 @asynccontextmanager
 async def lifespan(_application: FastAPI) -> AsyncGenerator:
     await database.connect()
+    await ensure_partitions()
+    if "by_image" in config.PREDICTION_WARM_UP:
+        # The model by image is loaded by the processes of the inference pool
+        await inference.start()
+    in_process = [name for name in config.PREDICTION_WARM_UP if name != "by_image"]
+    if in_process:
+        # In a thread, loading the models blocks for seconds
+        await asyncio.to_thread(warm_up, in_process)
+    scheduler = Scheduler()
+    if config.SCHEDULER_ENABLED:
+        scheduler.start()
     yield
     # shutdown
+    await scheduler.stop()
+    await asyncio.to_thread(inference.shutdown)
     await database.disconnect()
 
 
@@ -49,6 +68,7 @@ routers = [
     notification_router,
     prediction_router,
     jobs_router,
+    dev_tools_stats_router,
 ]
 
 for router in routers:
@@ -0,0 +1,90 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+import config
+
+caches: dict[str, "TTLCache"] = {}
+
+
+class TTLCache:
+    """
+    In-memory LRU cache whose entries expire `ttl` seconds after they are set.
+
+    The cache lives in the process, so an entry that is invalidated in another process
+    (i.e. the API and the notification worker) is only refreshed when it expires.
+
+    Args:
+        name (str): The name of the cache in `get_caches_stats`.
+        maxsize (int): The most entries kept, the least recently used are evicted.
+        ttl (float): The seconds an entry is valid.
+    """
+
+    MISSING = object()
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = config.CACHE_SIZE,
+        ttl: float = config.CACHE_TTL_SECONDS,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        caches[name] = self
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self.entries.get(key)
+        return entry is not None and entry[0] >= time.monotonic()
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Gets the value of a key, or TTLCache.MISSING if it is not cached or it expired.
+        """
+
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return self.MISSING
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, *keys: Hashable):
+        for key in keys:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / max(self.hits + self.misses, 1),
+        }
+
+
+def get_caches_stats() -> dict[str, dict]:
+    """
+    Gets the size, hits, misses and hit ratio of every cache, by name.
+    """
+
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+def clear_caches():
+    for cache in caches.values():
+        cache.clear()
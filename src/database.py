@@ -1,5 +1,7 @@
+from typing import AsyncIterator
+
 from databases import Database
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, select
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -15,6 +17,7 @@ Base = declarative_base()
 database = Database(
     DB_URL,
     force_rollback=config.ENVIRONMENT == "TESTING",
+    max_size=config.DB_POOL_SIZE,
 )
 
 
@@ -24,3 +27,34 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def iterate_in_chunks(
+    model, chunk_size: int = 500, after=None, where: list = None
+) -> AsyncIterator[list]:
+    """
+    Iterates over the rows of a model in chunks ordered by primary key, using keyset
+    pagination so that only one chunk is held in memory at a time.
+
+    Args:
+        model: The model to iterate. It must have a single column primary key.
+        chunk_size (int, optional): The number of rows of each chunk. Defaults to 500.
+        after (optional): Only the rows with a greater primary key are returned. Defaults to None.
+        where (list, optional): Extra conditions for the rows. Defaults to None.
+
+    Yields:
+        list: A chunk of model instances.
+    """
+
+    (primary_key,) = inspect(model).primary_key
+    while True:
+        select_query = (
+            select(model).where(*(where or [])).order_by(primary_key).limit(chunk_size)
+        )
+        if after is not None:
+            select_query = select_query.where(primary_key > after)
+        rows = await database.fetch_all(query=select_query)
+        if not rows:
+            return
+        yield [model(**row) for row in rows]
+        after = rows[-1][primary_key.name]
@@ -0,0 +1,52 @@
+"""
+Changes of the schema of the tables of a deployed database.
+
+`Base.metadata.create_all` creates the missing tables, but it does not change the ones
+that already exist, so the columns added to them are added here. Every statement can run
+again without changing anything, so the command runs on every deploy, before the API.
+
+Usage (from the src folder):
+    python -m migrations
+"""
+import asyncio
+import logging
+
+from database import Base, database, engine
+
+MIGRATIONS = [
+    # The timezone of the users, to notify them in their morning
+    'ALTER TABLE "user" ADD COLUMN IF NOT EXISTS timezone VARCHAR(64)',
+    'CREATE INDEX IF NOT EXISTS ix_user_timezone ON "user" (timezone)',
+    # Whether the low stock of a medicine was notified, so it is only notified once
+    "ALTER TABLE medicine "
+    "ADD COLUMN IF NOT EXISTS low_stock_notified BOOLEAN NOT NULL DEFAULT false",
+    # Why a run of a job failed
+    "ALTER TABLE job_run ADD COLUMN IF NOT EXISTS error TEXT",
+]
+
+logger = logging.getLogger(__name__)
+
+
+async def migrate():
+    """
+    Applies the migrations to the tables that already exist.
+    """
+
+    async with database.transaction():
+        for statement in MIGRATIONS:
+            await database.execute(statement)
+    logger.info("Applied %s migrations", len(MIGRATIONS))
+
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    Base.metadata.create_all(bind=engine)
+    await database.connect()
+    try:
+        await migrate()
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,9 +1,15 @@
+import asyncio
+
 import pytest
+from databases import Database
 from fastapi.testclient import TestClient
 
 from api.auth.dependencies import authenticate
+from api.notification import partitions
 from api.user.service import assert_device, get_or_create_user
 from app import app
+from cache import clear_caches
+from config import DB_URL
 
 
 async def override_auth():
@@ -15,7 +21,22 @@ async def override_auth():
 app.dependency_overrides[authenticate] = override_auth
 
 
+@pytest.fixture(scope="session", autouse=True)
+def notification_partitions():
+    # The partitions are created (and committed) once. Otherwise the rolled back
+    # connection of every module creates them, which locks the user table until the end
+    async def create_partitions():
+        async with Database(DB_URL) as committed:
+            with pytest.MonkeyPatch.context() as monkeypatch:
+                monkeypatch.setattr(partitions, "database", committed)
+                await partitions.ensure_partitions()
+
+    asyncio.run(create_partitions())
+
+
 @pytest.fixture(scope="module")
 def client():
+    # The database is rolled back after every module, so are the cached rows
+    clear_caches()
     with TestClient(app) as client:
         yield client
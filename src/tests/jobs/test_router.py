@@ -0,0 +1,316 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, func, insert, select, update
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_201_CREATED,
+    HTTP_202_ACCEPTED,
+    HTTP_400_BAD_REQUEST,
+)
+from starlette.testclient import TestClient
+
+from api.jobs import service
+from api.jobs.models import JobRun
+from api.jobs.service import (
+    get_now,
+    send_today_user_medicines_notification,
+    start_job_run,
+)
+from api.medicine.models import ScheduledDose
+from api.medicine.schemas import CreateMedicineSchema
+from api.medicine.service import create_medicine
+from api.notification.models.message import TodayUserMedicines
+from api.notification.models.notification import Notification
+from api.user.models import User
+from api.user.service import get_or_create_user
+from config import DEFAULT_TIMEZONE, SCHEDULED_DOSES_HORIZON_DAYS
+from database import database
+
+base_body = {
+    "name": "Ibuprofeno",
+    "start_date": (datetime.now() - timedelta(days=3)).isoformat(),
+    "stock": 18,
+    "stock_warning": 5,
+    "presentation": "Pastilla",
+    "dosis_unit": "mg",
+    "dosis": 1.5,
+    "interval": 1,
+    "hours": ["08:00", "20:00"],
+}
+
+
+def take(client: TestClient, medicine_id: int, date: datetime):
+    body = {
+        "medicine_id": medicine_id,
+        "date": date.isoformat(),
+        "real_consumption_date": date.isoformat(),
+    }
+    response = client.post("/medicine/consumption", json=body)
+    assert response.status_code == HTTP_201_CREATED
+
+
+@pytest.fixture(autouse=True)
+def new_day(client: TestClient):
+    # Every test triggers the jobs as if they had not run today
+    client.portal.call(database.execute, delete(JobRun))
+
+
+def test_yesterday_user_didnt_take_medicines_notification(client: TestClient):
+    yesterday = (datetime.now() - timedelta(days=1)).replace(
+        hour=8, minute=0, second=0, microsecond=0
+    )
+
+    response = client.post("/medicine/medicine", json=base_body)
+    assert response.status_code == HTTP_201_CREATED
+    medicine = response.json()
+
+    # Every dose taken: there is nothing to notify
+    take(client, medicine["id"], yesterday)
+    take(client, medicine["id"], yesterday.replace(hour=20))
+    response = client.post(
+        "/jobs/send_yesterday_user_didnt_take_medicines_notification"
+    )
+    assert response.status_code == HTTP_202_ACCEPTED
+    response = client.get("/notification")
+    assert response.status_code == HTTP_200_OK
+    assert len(response.json()) == 0
+
+    # A dose of a second medicine not taken, on a new day
+    client.portal.call(database.execute, delete(JobRun))
+    response = client.post("/medicine/medicine", json=base_body)
+    assert response.status_code == HTTP_201_CREATED
+    medicine = response.json()
+    take(client, medicine["id"], yesterday)
+    response = client.post(
+        "/jobs/send_yesterday_user_didnt_take_medicines_notification"
+    )
+    assert response.status_code == HTTP_202_ACCEPTED
+    response = client.get("/notification")
+    assert response.status_code == HTTP_200_OK
+    notifications = response.json()
+    assert len(notifications) == 1
+    assert notifications[0]["type"] == "medicine"
+
+
+def test_fill_scheduled_doses(client: TestClient):
+    response = client.post("/medicine/medicine", json=base_body)
+    assert response.status_code == HTTP_201_CREATED
+    medicine = response.json()
+    # The doses of a medicine created before the scheduled_dose table, and an old dose
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    doses = select(ScheduledDose).where(ScheduledDose.medicine_id == medicine["id"])
+    client.portal.call(
+        database.execute,
+        delete(ScheduledDose).where(ScheduledDose.medicine_id == medicine["id"]),
+    )
+    insert_query = insert(ScheduledDose).values(
+        medicine_id=medicine["id"],
+        user_id="test_user",
+        due_at=today - timedelta(days=3, hours=-8),
+    )
+    client.portal.call(database.execute, insert_query)
+
+    response = client.post("/jobs/fill_scheduled_doses")
+    assert response.status_code == HTTP_200_OK
+    due_at = [dose.due_at for dose in client.portal.call(database.fetch_all, doses)]
+    # Two doses a day, from yesterday to SCHEDULED_DOSES_HORIZON_DAYS after today
+    assert len(due_at) == 2 * (SCHEDULED_DOSES_HORIZON_DAYS + 2)
+    assert min(due_at) == today - timedelta(days=1, hours=-8)
+    assert max(due_at) == today + timedelta(days=SCHEDULED_DOSES_HORIZON_DAYS, hours=20)
+
+    # It is idempotent
+    response = client.post("/jobs/fill_scheduled_doses")
+    assert response.status_code == HTTP_200_OK
+    assert len(client.portal.call(database.fetch_all, doses)) == len(due_at)
+
+    response = client.post(
+        "/jobs/send_yesterday_user_didnt_take_medicines_notification"
+    )
+    assert response.status_code == HTTP_202_ACCEPTED
+
+
+def test_interrupted_job_resumes(client: TestClient):
+    job = "send_yesterday_user_didnt_take_medicines_notification"
+    response = client.get("/notification")
+    assert response.status_code == HTTP_200_OK
+    notifications = len(response.json())
+
+    # A run that died after processing the user: it's resumed, and the user is not
+    # notified again
+    insert_query = insert(JobRun).values(
+        job=job,
+        timezone=DEFAULT_TIMEZONE,
+        date=get_now(DEFAULT_TIMEZONE).date(),
+        status=JobRun.RUNNING,
+        last_id="test_user",
+        updated_at=datetime.now() - timedelta(hours=1),
+    )
+    job_run_id = client.portal.call(database.execute, insert_query)
+    response = client.post(f"/jobs/{job}")
+    assert response.status_code == HTTP_202_ACCEPTED
+    assert response.json()[0]["id"] == job_run_id
+    response = client.get("/notification")
+    assert response.status_code == HTTP_200_OK
+    assert len(response.json()) == notifications
+
+    # The run of today has finished, so the next trigger is coalesced with it
+    response = client.post(f"/jobs/{job}")
+    assert response.status_code == HTTP_202_ACCEPTED
+    assert response.json()[0]["id"] == job_run_id
+    assert response.json()[0]["status"] == "finished"
+    response = client.get("/notification")
+    assert response.status_code == HTTP_200_OK
+    assert len(response.json()) == notifications
+
+
+def test_job_run_status(client: TestClient):
+    response = client.post("/jobs/send_today_user_medicines_notification")
+    assert response.status_code == HTTP_202_ACCEPTED
+    # The users have no timezone, so there is a run of DEFAULT_TIMEZONE
+    (job_run,) = response.json()
+    assert job_run["timezone"] == DEFAULT_TIMEZONE
+
+    response = client.get(f"/jobs/runs/{job_run['id']}")
+    assert response.status_code == HTTP_200_OK
+    job_run = response.json()
+    assert job_run["status"] == "finished"
+    assert job_run["users_processed"] == 1
+    assert job_run["notifications_queued"] == 1
+    assert job_run["errors"] == 0
+
+    response = client.get("/jobs/runs/0")
+    assert response.status_code == HTTP_400_BAD_REQUEST
+
+
+def test_overlapping_triggers_are_coalesced(client: TestClient):
+    job = "send_today_user_medicines_notification"
+    response = client.get("/notification")
+    assert response.status_code == HTTP_200_OK
+    notifications = len(response.json())
+
+    # A live run of the job, like the one of the scheduler in the timezone of the users:
+    # the trigger returns it instead of running the job again
+    insert_query = insert(JobRun).values(
+        job=job,
+        timezone=DEFAULT_TIMEZONE,
+        date=get_now(DEFAULT_TIMEZONE).date(),
+        status=JobRun.RUNNING,
+    )
+    job_run_id = client.portal.call(database.execute, insert_query)
+    response = client.post(f"/jobs/{job}")
+    assert response.status_code == HTTP_202_ACCEPTED
+    assert response.json()[0]["id"] == job_run_id
+    assert response.json()[0]["status"] == "running"
+    response = client.get("/notification")
+    assert response.status_code == HTTP_200_OK
+    assert len(response.json()) == notifications
+
+    update_query = (
+        update(JobRun).where(JobRun.id == job_run_id).values(status=JobRun.FINISHED)
+    )
+    client.portal.call(database.execute, update_query)
+
+
+def test_job_run_of_a_timezone(client: TestClient):
+    # The user has no timezone, so it is in DEFAULT_TIMEZONE
+    for timezone, users_processed in [
+        ("Asia/Tokyo", 0),
+        ("America/Argentina/Cordoba", 1),
+    ]:
+        job_run, started = client.portal.call(
+            start_job_run, "send_today_user_medicines_notification", timezone
+        )
+        assert started
+        client.portal.call(send_today_user_medicines_notification, job_run)
+        response = client.get(f"/jobs/runs/{job_run.id}")
+        assert response.status_code == HTTP_200_OK
+        assert response.json()["timezone"] == timezone
+        assert response.json()["users_processed"] == users_processed
+
+
+def test_job_isolates_the_errors_of_a_user(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+):
+    other = User(
+        **client.portal.call(get_or_create_user, "jobs_other", "jobs_other@test.com")
+    )
+    client.portal.call(create_medicine, other, CreateMedicineSchema(**base_body))
+
+    def get_message(**kwargs) -> TodayUserMedicines:
+        if kwargs["user"].id == "test_user":
+            raise ValueError("A broken row")
+        return TodayUserMedicines(**kwargs)
+
+    monkeypatch.setattr(service, "TodayUserMedicines", get_message)
+    response = client.post("/jobs/send_today_user_medicines_notification")
+    assert response.status_code == HTTP_202_ACCEPTED
+
+    response = client.get(f"/jobs/runs/{response.json()[0]['id']}")
+    job_run = response.json()
+    assert job_run["status"] == "finished"
+    assert job_run["users_processed"] == 2
+    assert job_run["notifications_queued"] == 1
+    assert job_run["errors"] == 1
+    # The users after the one that failed are notified anyway
+    select_query = select(Notification).where(Notification.user_id == other.id)
+    assert len(client.portal.call(database.fetch_all, select_query)) == 1
+
+
+def test_failed_job_run(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    job = "send_today_user_medicines_notification"
+
+    async def send_notifications_bulk(messages):
+        raise ConnectionError("The database is gone")
+
+    monkeypatch.setattr(service, "send_notifications_bulk", send_notifications_bulk)
+    response = client.post(f"/jobs/{job}")
+    assert response.status_code == HTTP_202_ACCEPTED
+    job_run_id = response.json()[0]["id"]
+
+    response = client.get(f"/jobs/runs/{job_run_id}")
+    assert response.status_code == HTTP_200_OK
+    assert response.json()["status"] == "failed"
+    assert response.json()["finished_at"] is not None
+    assert response.json()["error"] == "ConnectionError: The database is gone"
+
+    # The failed run does not block the next trigger
+    monkeypatch.undo()
+    response = client.post(f"/jobs/{job}")
+    assert response.status_code == HTTP_202_ACCEPTED
+    assert response.json()[0]["id"] != job_run_id
+    response = client.get(f"/jobs/runs/{response.json()[0]['id']}")
+    assert response.json()["status"] == "finished"
+    assert response.json()["error"] is None
+
+
+def test_chunks_are_processed_concurrently(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+):
+    for i in range(3):
+        client.portal.call(get_or_create_user, f"jobs_chunk_{i}", f"{i}@test.com")
+    monkeypatch.setattr(service, "USERS_CHUNK_SIZE", 1)
+    running = []
+    concurrency = []
+
+    async def process_chunk(users: list[User]) -> tuple[int, int]:
+        running.append(users[0].id)
+        concurrency.append(len(running))
+        # The first chunks finish last
+        await asyncio.sleep(0.05 / len(concurrency))
+        running.remove(users[0].id)
+        return 1, 0
+
+    async def process() -> JobRun:
+        job_run, _ = await start_job_run("test_chunks")
+        await service.process_in_chunks(job_run, process_chunk, concurrency=3)
+        return await service.get_job_run(job_run.id)
+
+    job_run = client.portal.call(process)
+    select_query = select(func.count().label("users"), func.max(User.id).label("last"))
+    users = client.portal.call(database.fetch_one, select_query)
+    assert max(concurrency) == 3
+    # The progress of every chunk is saved, even if they finished out of order
+    assert job_run.users_processed == job_run.notifications_queued == users.users
+    assert job_run.last_id == users.last
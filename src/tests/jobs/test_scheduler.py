@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from starlette.testclient import TestClient
+
+from api.jobs import service
+from api.jobs.models import JobRun
+from api.jobs.scheduler import Scheduler, get_next_fire
+from api.jobs.service import get_interrupted_job_runs
+from api.medicine.schemas import CreateMedicineSchema
+from api.medicine.service import create_medicine
+from api.user.models import User
+from api.user.service import get_or_create_user
+from config import DEFAULT_TIMEZONE
+
+base_body = {
+    "name": "Ibuprofeno",
+    "start_date": (datetime.now() - timedelta(days=3)).isoformat(),
+    "stock": 18,
+    "stock_warning": 5,
+    "presentation": "Pastilla",
+    "dosis_unit": "mg",
+    "dosis": 1.5,
+    "interval": 1,
+    "hours": ["08:00", "20:00"],
+}
+
+
+def test_next_fire_in_the_timezone_of_the_cron():
+    after = datetime(2023, 6, 1, 12, 0, tzinfo=timezone.utc)
+    next_fire = get_next_fire("0 7 * * *", "America/Argentina/Cordoba", after)
+    assert next_fire == datetime(2023, 6, 2, 10, 0, tzinfo=timezone.utc)
+    next_fire = get_next_fire("0 7 * * *", "Asia/Tokyo", after)
+    assert next_fire == datetime(2023, 6, 1, 22, 0, tzinfo=timezone.utc)
+
+
+def test_stopped_run_is_resumed_by_the_next_leader(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+):
+    job = "send_today_user_medicines_notification"
+    for user_id in ["test_user", "zz_scheduler"]:
+        user = User(
+            **client.portal.call(get_or_create_user, user_id, f"{user_id}@test.com")
+        )
+        client.portal.call(create_medicine, user, CreateMedicineSchema(**base_body))
+    monkeypatch.setattr(service, "USERS_CHUNK_SIZE", 1)
+    notified = []
+    block = True
+
+    async def send_notifications_bulk(messages):
+        users = [user.id for _, user in messages]
+        if block and users == ["zz_scheduler"]:
+            # The leader stops while the last user is being notified
+            await asyncio.Event().wait()
+        notified.extend(users)
+
+    monkeypatch.setattr(service, "send_notifications_bulk", send_notifications_bulk)
+
+    async def stop() -> JobRun:
+        scheduler = Scheduler()
+        scheduler.create_task(scheduler.run_job(job, DEFAULT_TIMEZONE))
+        while notified != ["test_user"]:
+            await asyncio.sleep(0.01)
+        await scheduler.stop()
+        (job_run,) = await get_interrupted_job_runs(failed=True)
+        return job_run
+
+    job_run = client.portal.call(stop)
+    assert job_run.status == JobRun.FAILED
+    assert job_run.last_id == "test_user"
+    assert job_run.error.startswith("CancelledError")
+    # The runs that were cancelled are not resumed until a leader takes over
+    assert client.portal.call(get_interrupted_job_runs) == []
+
+    async def take_over():
+        scheduler = Scheduler()
+        await scheduler.resume_job_runs(failed=True)
+        await asyncio.gather(*scheduler.tasks)
+
+    block = False
+    client.portal.call(take_over)
+    # The rest of the users are notified, and the ones before the checkpoint not again
+    assert notified == ["test_user", "zz_scheduler"]
+    assert client.portal.call(get_interrupted_job_runs, True) == []
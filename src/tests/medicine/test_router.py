@@ -1,8 +1,23 @@
+import asyncio
+import contextvars
 from datetime import datetime, timedelta
 
+import pytest
+from databases import Database
+from sqlalchemy import delete, func, insert, select
 from starlette.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_400_BAD_REQUEST
 from starlette.testclient import TestClient
 
+from api.medicine import service as medicine_service
+from api.medicine.models import Medicine
+from api.medicine.schemas import CreateConsumptionSchema, CreateMedicineSchema
+from api.medicine.service import create_consumption, create_medicine
+from api.notification.models.notification import Notification
+from api.supervisor import service as supervisor_service
+from api.user.models import User
+from config import DB_URL
+from database import database
+
 """
 Checkear: 
     - medicamento fuera de fecha
@@ -158,6 +173,180 @@ def test_create_delete_consumption(client: TestClient):
     assert response.status_code == HTTP_200_OK
 
 
+def test_low_stock_is_notified_once(client: TestClient):
+    body = {
+        **base_body,
+        "name": "Amoxicilina",
+        "stock": 6,
+        "interval": 1,
+        "hours": ["08:00"],
+    }
+    response = client.post("/medicine/medicine", json=body)
+    assert response.status_code == HTTP_201_CREATED
+    medicine = response.json()
+
+    start_date = datetime.fromisoformat(medicine["start_date"])
+    for day in range(4):
+        date = (start_date + timedelta(days=day)).replace(
+            hour=8, minute=0, second=0, microsecond=0
+        )
+        body = {
+            "medicine_id": medicine["id"],
+            "date": date.isoformat(),
+            "real_consumption_date": date.isoformat(),
+        }
+        response = client.post("/medicine/consumption", json=body)
+        assert response.status_code == HTTP_201_CREATED
+
+    # The stock reached the warning on the second consumption, and it is not notified again
+    select_query = select(func.count()).where(Notification.body.like("%Amoxicilina%"))
+    assert client.portal.call(database.fetch_val, select_query) == 1
+
+
+def test_parallel_consumptions_decrement_the_stock(monkeypatch: pytest.MonkeyPatch):
+    # The consumptions need a connection each, so they run in a database of their own
+    # instead of the rolled back connection of the tests, with a user of their own that
+    # is deleted at the end
+    notified = []
+
+    async def send_notifications_bulk(messages: list):
+        notified.append(messages)
+
+    monkeypatch.setattr(
+        medicine_service, "send_notifications_bulk", send_notifications_bulk
+    )
+    user_id = "test_parallel_consumptions"
+    start_date = (datetime.now() - timedelta(days=99)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+    async def consume_in_parallel() -> int:
+        async with Database(DB_URL) as committed:
+            for module in [medicine_service, supervisor_service]:
+                monkeypatch.setattr(module, "database", committed)
+            insert_query = (
+                insert(User)
+                .values(id=user_id, email=f"{user_id}@test.com", invitation=user_id)
+                .returning(User)
+            )
+            user = await committed.fetch_one(query=insert_query)
+            try:
+                medicine = await create_medicine(
+                    user,
+                    CreateMedicineSchema(
+                        **{
+                            **base_body,
+                            "start_date": start_date,
+                            "stock": 150,
+                            "stock_warning": 60,
+                            "interval": 1,
+                            "hours": ["08:00"],
+                        }
+                    ),
+                )
+                consumptions = []
+                for day in range(100):
+                    date = start_date + timedelta(days=day, hours=8)
+                    consumption = CreateConsumptionSchema(
+                        medicine_id=medicine.id, date=date, real_consumption_date=date
+                    )
+                    # A new context, so every consumption gets its own connection from
+                    # the database, like the requests
+                    consumptions.append(
+                        contextvars.Context().run(
+                            asyncio.create_task, create_consumption(user, consumption)
+                        )
+                    )
+                await asyncio.gather(*consumptions)
+                select_query = select(Medicine.stock).where(Medicine.id == medicine.id)
+                return await committed.fetch_val(query=select_query)
+            finally:
+                delete_query = delete(Medicine).where(Medicine.user_id == user_id)
+                await committed.execute(query=delete_query)
+                await committed.execute(delete(User).where(User.id == user_id))
+
+    # No decrement is lost, and the low stock is notified once
+    assert asyncio.run(consume_in_parallel()) == 50
+    assert len(notified) == 1
+
+
+def test_create_consumptions(client: TestClient):
+    body = {
+        **base_body,
+        "name": "Claritromicina",
+        "stock": 6,
+        "interval": 1,
+        "hours": ["08:00"],
+    }
+    response = client.post("/medicine/medicine", json=body)
+    assert response.status_code == HTTP_201_CREATED
+    medicine = response.json()
+    response = client.post("/medicine/medicine", json={**base_body, "stock": None})
+    assert response.status_code == HTTP_201_CREATED
+    other_medicine = response.json()
+
+    start_date = datetime.fromisoformat(medicine["start_date"])
+
+    def consumption(medicine_id: int, day: int, hour: int = 8, minute: int = 0):
+        date = (start_date + timedelta(days=day)).replace(
+            hour=hour, minute=minute, second=0, microsecond=0
+        )
+        return {
+            "medicine_id": medicine_id,
+            "date": date.isoformat(),
+            "real_consumption_date": date.isoformat(),
+        }
+
+    response = client.post("/medicine/consumption", json=consumption(medicine["id"], 3))
+    assert response.status_code == HTTP_201_CREATED
+
+    body = [
+        consumption(medicine["id"], 0),
+        consumption(medicine["id"], 1),
+        consumption(medicine["id"], 0),  # Twice in the same request
+        consumption(medicine["id"], 2),
+        consumption(medicine["id"], 3),  # Already created
+        consumption(medicine["id"], 4, hour=11, minute=35),
+        consumption(123456789, 0),
+        consumption(other_medicine["id"], 0),
+    ]
+    response = client.post("/medicine/consumptions", json=body)
+    assert response.status_code == HTTP_200_OK
+    results = response.json()
+    assert [result["created"] for result in results] == [
+        True,
+        True,
+        False,
+        True,
+        False,
+        False,
+        False,
+        True,
+    ]
+    assert [result["error"] and result["error"]["code"] for result in results] == [
+        None,
+        None,
+        306,
+        None,
+        306,
+        303,
+        305,
+        None,
+    ]
+
+    # The stock is decremented once by every created consumption
+    response = client.get("/medicine/medicine")
+    stocks = {m["id"]: m["stock"] for m in response.json()}
+    assert stocks[medicine["id"]] == 2
+    assert stocks[other_medicine["id"]] is None
+
+    # The stock went under the warning, and it is notified once
+    select_query = select(func.count()).where(
+        Notification.body.like("%Claritromicina%")
+    )
+    assert client.portal.call(database.fetch_val, select_query) == 1
+
+
 def test_error_create_consumption_with_non_existent_medicine(client: TestClient):
     body = {
         "medicine_id": "123456789",
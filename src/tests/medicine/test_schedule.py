@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+from api.medicine.models import Medicine
+from api.medicine.schedule import get_medicine_schedule, get_schedule
+
+dates = st.datetimes(min_value=datetime(2020, 1, 1), max_value=datetime(2026, 1, 1))
+hours = st.lists(
+    st.builds(
+        lambda hour, minute: f"{hour:02d}:{minute:02d}",
+        st.integers(0, 23),
+        st.integers(0, 59),
+    ),
+    min_size=1,
+    max_size=5,
+)
+
+
+@st.composite
+def medicines(draw, medicine_id=st.integers(1, 10_000)):
+    start_date = draw(dates).replace(hour=0, minute=0, second=0, microsecond=0)
+    days = draw(st.none() | st.integers(0, 800))
+    end_date = start_date + timedelta(days=days) if days is not None else None
+    rule = draw(
+        st.one_of(
+            st.fixed_dictionaries({"interval": st.integers(1, 15)}),
+            st.fixed_dictionaries(
+                {"days": st.lists(st.integers(1, 7), min_size=1, max_size=7)}
+            ),
+        )
+    )
+    return Medicine(
+        id=draw(medicine_id),
+        start_date=start_date,
+        end_date=end_date,
+        hours=draw(hours),
+        **rule,
+    )
+
+
+def rrule_schedule(medicine: Medicine, start: datetime, end: datetime):
+    range_start = max(start, medicine.start_date)
+    range_end = min(end, medicine.end_date or datetime.max)
+    return [
+        datetime.combine(date, datetime.strptime(hour, "%H:%M").time())
+        for date in medicine.get_frequency().between(range_start, range_end)
+        for hour in dict.fromkeys(medicine.hours)
+    ]
+
+
+@settings(max_examples=300, deadline=None)
+@given(medicine=medicines(), start=dates, length=st.integers(0, 400))
+def test_schedule_matches_rrule(medicine: Medicine, start: datetime, length: int):
+    end = start + timedelta(days=length, hours=length % 24)
+    assert get_medicine_schedule(medicine, start, end).tolist() == rrule_schedule(
+        medicine, start, end
+    )
+
+
+@settings(max_examples=50, deadline=None)
+@given(medicines=st.lists(medicines(), max_size=5), start=dates)
+def test_schedule_of_many_medicines(medicines: list[Medicine], start: datetime):
+    end = start + timedelta(days=90)
+    medicine_ids, consumption_dates = get_schedule(medicines, start, end)
+    assert list(zip(medicine_ids.tolist(), consumption_dates.tolist())) == [
+        (medicine.id, date)
+        for medicine in medicines
+        for date in rrule_schedule(medicine, start, end)
+    ]
+
+
+def test_schedule_without_hours():
+    medicine = Medicine(id=1, start_date=datetime(2023, 1, 1), interval=1, hours=None)
+    assert len(get_medicine_schedule(medicine, datetime(2023, 1, 1), datetime.max)) == 0
@@ -0,0 +1,111 @@
+import os
+import subprocess
+import sys
+import time
+
+from starlette.status import HTTP_200_OK, HTTP_201_CREATED
+from starlette.testclient import TestClient
+
+from api.notification.service import (
+    get_notification_preferences,
+    preferences_cache,
+    prefetch_notification_preferences,
+)
+from api.user.models import User
+from api.user.service import (
+    assert_device,
+    delete_devices,
+    devices_cache,
+    get_user_devices,
+)
+from cache import TTLCache
+
+
+def test_ttl_cache_expiration_and_eviction():
+    cache = TTLCache("test", maxsize=2, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    # "b" is the least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is TTLCache.MISSING
+    assert cache.stats() == {
+        "size": 2,
+        "hits": 1,
+        "misses": 1,
+        "hit_ratio": 0.5,
+    }
+
+    time.sleep(0.06)
+    assert "a" not in cache
+    assert cache.get("a") is TTLCache.MISSING
+
+
+def test_preferences_cache_invalidation(client: TestClient):
+    response = client.get("/notification/preference")
+    assert response.status_code == HTTP_200_OK
+    assert response.json() == []
+    hits = preferences_cache.hits
+    response = client.get("/notification/preference")
+    assert response.json() == []
+    assert preferences_cache.hits == hits + 1
+
+    response = client.post(
+        "/notification/preference", params={"notification_preference": "email"}
+    )
+    assert response.status_code == HTTP_201_CREATED
+    assert response.json() == ["email"]
+    assert client.get("/notification/preference").json() == ["email"]
+
+    response = client.delete(
+        "/notification/preference", params={"notification_preference": "email"}
+    )
+    assert response.status_code == HTTP_200_OK
+    assert client.get("/notification/preference").json() == []
+
+
+def test_prefetch_notification_preferences(client: TestClient):
+    preferences_cache.clear()
+    client.portal.call(prefetch_notification_preferences, ["test_user", "other_user"])
+    misses = preferences_cache.misses
+    user = User(id="other_user")
+    assert client.portal.call(get_notification_preferences, user) == []
+    assert preferences_cache.misses == misses
+
+
+def test_devices_cache_invalidation(client: TestClient):
+    user = User(id="test_user")
+    tokens = [device.token for device in client.portal.call(get_user_devices, user)]
+    assert "test_user" in devices_cache
+
+    client.portal.call(assert_device, user, "new_token")
+    devices = client.portal.call(get_user_devices, user)
+    assert sorted(device.token for device in devices) == sorted(tokens + ["new_token"])
+
+    client.portal.call(delete_devices, ["new_token"])
+    assert "test_user" not in devices_cache
+    devices = client.portal.call(get_user_devices, user)
+    assert sorted(device.token for device in devices) == sorted(tokens)
+
+
+def test_cache_stats(client: TestClient):
+    response = client.get("/dev/cache-stats")
+    assert response.status_code == HTTP_200_OK
+    assert set(response.json()) >= {"notification_preferences", "devices"}
+
+
+def test_cache_stats_need_the_internal_token_in_production():
+    code = (
+        "from fastapi.testclient import TestClient; import app;"
+        "client = TestClient(app.app);"
+        "print(client.get('/dev/cache-stats').status_code);"
+        "print(client.get('/dev/cache-stats', headers={'Authorization': 'Bearer internal'}).status_code)"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        env={**os.environ, "ENVIRONMENT": "PROD", "INTERNAL_TOKEN": "internal"},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert output.split() == ["401", "200"]
@@ -0,0 +1,168 @@
+import asyncio
+import gzip
+from datetime import date, datetime, time
+
+import pytest
+from databases import Database
+from sqlalchemy import delete, func, insert, select
+from starlette.testclient import TestClient
+
+from api.notification import partitions
+from api.notification.models.notification import Notification
+from api.notification.models.outbox import NotificationOutbox
+from api.notification.partitions import (
+    DEFAULT_PARTITION,
+    add_months,
+    ensure_partitions,
+    get_partition_name,
+    get_partitions,
+    maintain_notification_partitions,
+)
+from api.notification.service import get_unread_count, update_unread_counters
+from api.user.models import User
+from api.user.service import get_or_create_user
+from config import DB_URL, NOTIFICATION_PARTITIONS_AHEAD
+from database import database
+
+
+def test_concurrent_replicas_create_the_partitions_once(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    months_ahead = NOTIFICATION_PARTITIONS_AHEAD + 1
+    month = add_months(date.today().replace(day=1), months_ahead)
+
+    async def start_replicas() -> list[date]:
+        # Every task of the database has its own connection, like the replicas
+        async with Database(DB_URL) as committed:
+            monkeypatch.setattr(partitions, "database", committed)
+            try:
+                await asyncio.gather(
+                    ensure_partitions(months_ahead), ensure_partitions(months_ahead)
+                )
+                return await get_partitions()
+            finally:
+                await committed.execute(
+                    f"DROP TABLE IF EXISTS {get_partition_name(month)}"
+                )
+
+    assert month in asyncio.run(start_replicas())
+
+
+def test_notifications_inserted_while_a_partition_is_created(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    month = add_months(date.today().replace(day=1), NOTIFICATION_PARTITIONS_AHEAD + 2)
+    name = get_partition_name(month)
+    created_at = datetime.combine(month.replace(day=15), time(12))
+    insert_user = insert(User).values(
+        id="partition_user", email="partition@test.com", invitation="partition"
+    )
+    insert_notification = insert(Notification).values(
+        user_id="partition_user", title="New", body="Notification", type="other"
+    )
+
+    async def create_partition() -> list[str]:
+        # The notifications are inserted by another replica, with its own connection
+        async with Database(DB_URL) as committed, Database(DB_URL) as replica:
+            monkeypatch.setattr(partitions, "database", committed)
+            execute = committed.execute
+            inserts = []
+
+            async def execute_and_insert(query, values=None):
+                result = await execute(query, values)
+                if str(query).startswith(f"DELETE FROM {DEFAULT_PARTITION}"):
+                    # A notification of the month arrives after its rows were moved
+                    inserts.append(
+                        asyncio.create_task(
+                            replica.execute(
+                                insert_notification.values(created_at=created_at)
+                            )
+                        )
+                    )
+                    await asyncio.sleep(0.2)
+                return result
+
+            monkeypatch.setattr(committed, "execute", execute_and_insert)
+            await replica.execute(insert_user)
+            try:
+                await replica.execute(insert_notification.values(created_at=created_at))
+                await partitions.create_partition(month)
+                await asyncio.gather(*inserts)
+                rows = await replica.fetch_all(
+                    f"SELECT tableoid::regclass::text AS partition FROM notification "
+                    "WHERE user_id = 'partition_user'"
+                )
+                return [row["partition"] for row in rows]
+            finally:
+                await replica.execute(f"DROP TABLE IF EXISTS {name}")
+                await replica.execute(
+                    delete(Notification).where(Notification.user_id == "partition_user")
+                )
+                await replica.execute(delete(User).where(User.id == "partition_user"))
+
+    # The one inserted meanwhile waits for the attach, and goes to the new partition too
+    assert asyncio.run(create_partition()) == [name, name]
+
+
+def test_partitions_are_created_ahead(client: TestClient):
+    months = client.portal.call(get_partitions)
+    current = date.today().replace(day=1)
+    for i in range(NOTIFICATION_PARTITIONS_AHEAD + 1):
+        assert add_months(current, i) in months
+
+
+def test_expired_partitions_are_archived_and_dropped(client: TestClient, tmp_path):
+    old_month = add_months(date.today().replace(day=1), -24)
+    created_at = datetime.combine(old_month.replace(day=15), time(12))
+
+    async def insert_old_notification() -> tuple[int, int]:
+        user = await get_or_create_user("test_user", "test_user@test.com")
+        unread = await get_unread_count(user)
+        insert_query = insert(Notification).values(
+            user_id=user.id,
+            title="Old notification",
+            body="Expired",
+            type="other",
+            created_at=created_at,
+        )
+        notification_id = await database.execute(query=insert_query)
+        await update_unread_counters({user.id: 1})
+        insert_query = insert(NotificationOutbox).values(
+            notification_id=notification_id,
+            channel="email",
+            payload={},
+            created_at=created_at,
+        )
+        await database.execute(query=insert_query)
+        return notification_id, unread
+
+    notification_id, unread = client.portal.call(insert_old_notification)
+    # Its month has no partition yet
+    in_default = client.portal.call(
+        database.fetch_val,
+        f"SELECT count(*) FROM {DEFAULT_PARTITION} WHERE id = {notification_id}",
+    )
+    assert in_default == 1
+
+    client.portal.call(maintain_notification_partitions, 180, str(tmp_path))
+
+    months = client.portal.call(get_partitions)
+    assert old_month not in months
+    assert date.today().replace(day=1) in months
+    select_query = select(func.count()).where(Notification.id == notification_id)
+    assert client.portal.call(database.fetch_val, select_query) == 0
+    select_query = select(func.count()).where(
+        NotificationOutbox.notification_id == notification_id
+    )
+    assert client.portal.call(database.fetch_val, select_query) == 0
+
+    user = client.portal.call(get_or_create_user, "test_user", "test_user@test.com")
+    assert client.portal.call(get_unread_count, user) == unread
+
+    archive = tmp_path / f"{get_partition_name(old_month)}.csv.gz"
+    with gzip.open(archive, "rt") as file:
+        rows = file.read().splitlines()
+    assert rows[0].split(",") == [
+        column.name for column in Notification.__table__.columns
+    ]
+    assert any("Expired" in row for row in rows[1:])
@@ -0,0 +1,87 @@
+from api.medicine.models import Medicine
+from api.notification.models.message import (
+    DigestMessage,
+    LowStockFromSupervisedUserMessage,
+    LowStockMessage,
+    TodayUserMedicines,
+)
+from api.notification.renderer import render, render_batch
+from api.user.models import User
+
+
+def test_render_medicines_message():
+    message = TodayUserMedicines(
+        user=User(first_name="Juan", last_name="Pérez"),
+        medicines={1: {"name": "Ibuprofeno", "hours": ["08:00", "20:00"]}},
+        supervised_medicines=[
+            {
+                "name": "Ana",
+                "medicines": {2: {"name": "Paracetamol", "hours": ["09:00"]}},
+            }
+        ],
+    )
+
+    assert message.whatsapp()["message"] == (
+        "Buenos días Juan Pérez!\n"
+        "\nRecuerda que tienes que tomar los siguientes medicamentos hoy:\n"
+        "- Ibuprofeno a las 08:00, 20:00\n"
+        "\nTus supervisados tienen que tomar los siguientes medicamentos hoy:\n"
+        "\nAna:\n"
+        "- Paracetamol a las 09:00\n"
+        "\nPuedes ver información más detallada sobre sus medicamentos de hoy desde la app."
+    )
+    assert message.email() == {
+        "subject": "Recordatorio de medicamentos",
+        "message": "Recuerda que tienes que tomar los siguientes medicamentos hoy:<br><br>"
+        "- <em>Ibuprofeno</em> a las 08:00, 20:00<br>"
+        "<br><br>Tus supervisados tienen que tomar los siguientes medicamentos hoy:<br>"
+        "<br><b>Ana:</b><br>"
+        "- <em>Paracetamol</em> a las 09:00<br>"
+        "<br>Puedes ver información más detallada sobre sus medicamentos de hoy desde la app.",
+    }
+
+
+def test_render_batch_renders_every_channel_once():
+    medicine = Medicine(name="Ibuprofeno")
+    messages = [
+        LowStockMessage(medicine=medicine),
+        LowStockFromSupervisedUserMessage(
+            medicine=medicine, supervised_user=User(first_name="Ana", last_name="López")
+        ),
+    ]
+
+    pushes = render_batch(messages, "push")
+    assert [push["body"] for push in pushes] == [
+        "El medicamento Ibuprofeno está por agotarse. "
+        "Recuerda evitar que se agote para no interrumpir el tratamiento.",
+        "El medicamento Ibuprofeno de Ana López está por agotarse. "
+        "Recuerda evitar que se agote para no interrumpir el tratamiento.",
+    ]
+    # The message keeps what it rendered, even if its attributes change
+    medicine.name = "Paracetamol"
+    assert render(messages[0], "push") is pushes[0]
+    assert "Paracetamol" in render(messages[0], "whatsapp")["message"]
+
+
+def test_render_digest_message():
+    message = DigestMessage(
+        payloads=[
+            {"subject": "Medicamento por agotarse", "message": "Ibuprofeno"},
+            {"subject": "Medicamento por agotarse", "message": "Paracetamol"},
+        ]
+    )
+    assert message.whatsapp() == {
+        "message": "Tienes 2 notificaciones de Meddly:\n\nIbuprofeno\n\nParacetamol"
+    }
+    assert message.email() == {
+        "subject": "Tienes 2 notificaciones de Meddly",
+        "message": "<b>Medicamento por agotarse</b><br>Ibuprofeno<br><br>"
+        "<b>Medicamento por agotarse</b><br>Paracetamol",
+    }
+    pushes = DigestMessage(
+        payloads=[{"title": "Medicamento por agotarse", "body": ""}] * 2
+    ).push()
+    assert pushes == {
+        "title": "Tienes 2 notificaciones de Meddly",
+        "body": "Medicamento por agotarse",
+    }
@@ -1,6 +1,34 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from databases import Database
+from sqlalchemy import delete, insert
 from starlette.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_400_BAD_REQUEST
 from starlette.testclient import TestClient
 
+from api.medicine.models import Medicine
+from api.notification import service
+from api.notification.models.counter import NotificationCounter
+from api.notification.models.message import LowStockMessage
+from api.notification.models.notification import Notification
+from api.notification.partitions import expire_notifications
+from api.notification.service import (
+    get_retention_cutoff,
+    get_unread_count,
+    send_notifications_bulk,
+    update_unread_counters,
+)
+from api.user.models import User
+from config import DB_URL
+from database import database
+
+
+def send_notifications(client: TestClient, count: int):
+    message = LowStockMessage(medicine=Medicine(name="Ibuprofeno"))
+    user = User(id="test_user", email="test_user@test.com")
+    client.portal.call(send_notifications_bulk, [(message, user)] * count)
+
 
 def test_create_get_delete_notification_preference(client: TestClient):
     response = client.post(
@@ -85,3 +113,137 @@ def test_delete_non_existing_notification_preference(client: TestClient):
         "/notification/preference", params={"notification_preference": "whatsapp"}
     )
     assert response.status_code == HTTP_400_BAD_REQUEST
+
+
+def test_inbox_pagination_and_unread_counter(client: TestClient):
+    response = client.get("/notification/unread")
+    assert response.status_code == HTTP_200_OK
+    unread = response.json()["unread"]
+    send_notifications(client, 5)
+    assert client.get("/notification/unread").json() == {"unread": unread + 5}
+
+    notifications = []
+    cursor = None
+    while True:
+        params = {"limit": 2} | ({"cursor": cursor} if cursor else {})
+        response = client.get("/notification/inbox", params=params)
+        assert response.status_code == HTTP_200_OK
+        page = response.json()
+        assert len(page["notifications"]) <= 2
+        assert page["unread"] == unread + 5
+        notifications += page["notifications"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    ids = [notification["id"] for notification in notifications]
+    # The notifications of the test share created_at, so they are sorted by id
+    assert ids[:5] == sorted(ids[:5], reverse=True)
+    assert len(ids) == len(set(ids)) >= 5
+
+    # Read up to the third newest, so the two newest are still unread
+    response = client.post(
+        "/notification/read", params={"cursor": notifications[2]["cursor"]}
+    )
+    assert response.status_code == HTTP_200_OK
+    assert response.json() == {"unread": 2}
+    page = client.get("/notification/inbox", params={"limit": 5}).json()
+    assert [notification["is_read"] for notification in page["notifications"]] == [
+        False,
+        False,
+        True,
+        True,
+        True,
+    ]
+
+    # Deleting an unread notification updates the counter too
+    response = client.delete(
+        "/notification", params={"notification_id": notifications[0]["id"]}
+    )
+    assert response.status_code == HTTP_200_OK
+    assert client.get("/notification/unread").json() == {"unread": 1}
+
+    response = client.post("/notification/read")
+    assert response.json() == {"unread": 0}
+
+
+def test_inbox_invalid_cursor(client: TestClient):
+    response = client.get("/notification/inbox", params={"cursor": "not a cursor"})
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    assert response.json()["detail"]["code"] == 504
+
+
+def test_expired_notifications_leave_the_unread_counter(client: TestClient):
+    unread = client.get("/notification/unread").json()["unread"]
+
+    # Older than the retention, but its partition is not dropped yet
+    async def insert_expired_notification():
+        async with database.transaction():
+            insert_query = insert(Notification).values(
+                user_id="test_user",
+                title="Expired notification",
+                body="Expired",
+                type="other",
+                created_at=get_retention_cutoff() - timedelta(days=1),
+            )
+            await database.execute(query=insert_query)
+            await update_unread_counters({"test_user": 1})
+
+    client.portal.call(insert_expired_notification)
+    assert client.get("/notification/unread").json() == {"unread": unread + 1}
+
+    client.portal.call(expire_notifications)
+    assert client.get("/notification/unread").json() == {"unread": unread}
+    page = client.get("/notification/inbox").json()
+    assert page["unread"] == unread
+
+
+def test_get_notifications_marks_the_page_read(client: TestClient):
+    client.post("/notification/read")
+    send_notifications(client, 3)
+
+    response = client.get("/notification", params={"page": 1, "per_page": 2})
+    assert response.status_code == HTTP_200_OK
+    assert len(response.json()) == 2
+    # Only the notifications of the page
+    assert client.get("/notification/unread").json() == {"unread": 1}
+    page = client.get("/notification/inbox", params={"limit": 3}).json()
+    assert [notification["is_read"] for notification in page["notifications"]] == [
+        True,
+        True,
+        False,
+    ]
+
+
+def test_unread_counter_created_during_a_write(monkeypatch: pytest.MonkeyPatch):
+    user = User(id="unread_counter_user", email="unread_counter_user@test.com")
+
+    async def read_during_a_write() -> int:
+        async with Database(DB_URL) as writer, Database(DB_URL) as reader:
+            insert_query = insert(User).values(
+                id=user.id, email=user.email, invitation=user.id
+            )
+            await writer.execute(query=insert_query)
+            try:
+                # A notification is written, and the counter is read before the write
+                # commits, from another connection
+                monkeypatch.setattr(service, "database", writer)
+                transaction = await writer.transaction()
+                insert_query = insert(Notification).values(
+                    user_id=user.id, title="Title", body="Body", type="other"
+                )
+                await writer.execute(query=insert_query)
+                await update_unread_counters({user.id: 1})
+
+                monkeypatch.setattr(service, "database", reader)
+                read = asyncio.create_task(get_unread_count(user))
+                await asyncio.sleep(0.2)
+                await transaction.commit()
+                await read
+                return await get_unread_count(user)
+            finally:
+                for table in [NotificationCounter, Notification]:
+                    delete_query = delete(table).where(table.user_id == user.id)
+                    await writer.execute(query=delete_query)
+                await writer.execute(delete(User).where(User.id == user.id))
+
+    assert asyncio.run(read_during_a_write()) == 1
@@ -0,0 +1,68 @@
+import json
+import time
+
+import httpx
+import pytest
+from starlette.testclient import TestClient
+
+from api.notification.transports import RateLimiter, SendGridTransport, TwilioTransport
+
+
+def stub(requests: list[httpx.Request], status_code: int = 202) -> httpx.MockTransport:
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(status_code)
+
+    return httpx.MockTransport(handler)
+
+
+def test_sendgrid_transport(client: TestClient):
+    requests = []
+    transport = SendGridTransport("https://sendgrid.test", transport=stub(requests))
+    payload = {
+        "to": "test_user@test.com",
+        "hi_message": "Hola Test User!",
+        "message": "Te queda poco stock de Ibuprofeno",
+        "subject": "Stock bajo",
+    }
+    client.portal.call(transport.send, payload)
+    client.portal.call(transport.send, payload)
+    client.portal.call(transport.close)
+
+    assert len(requests) == 2
+    assert str(requests[0].url) == "https://sendgrid.test/v3/mail/send"
+    assert requests[0].headers["Authorization"].startswith("Bearer ")
+    body = json.loads(requests[0].content)
+    assert body["personalizations"][0]["to"] == [{"email": "test_user@test.com"}]
+    assert body["personalizations"][0]["dynamic_template_data"]["subject"] == (
+        "Stock bajo"
+    )
+
+
+def test_twilio_transport_errors(client: TestClient):
+    requests = []
+    transport = TwilioTransport(
+        "https://twilio.test", transport=stub(requests, status_code=429)
+    )
+    with pytest.raises(httpx.HTTPStatusError):
+        client.portal.call(transport.send, {"to": "+5493510000000", "message": "Hola"})
+    client.portal.call(transport.close)
+
+    assert requests[0].url.path.endswith("/Messages.json")
+    assert b"To=whatsapp%3A%2B5493510000000" in requests[0].content
+
+
+def test_rate_limiter(client: TestClient):
+    limiter = RateLimiter(rate=50, burst=5)
+
+    async def acquire(times: int):
+        for _ in range(times):
+            await limiter.acquire()
+
+    start = time.monotonic()
+    client.portal.call(acquire, 5)
+    # The burst is not limited
+    assert time.monotonic() - start < 0.05
+    client.portal.call(acquire, 10)
+    # The rest wait for the rate
+    assert time.monotonic() - start >= 0.18
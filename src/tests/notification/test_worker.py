@@ -0,0 +1,272 @@
+from datetime import datetime, timedelta
+
+import pytest
+from firebase_admin.messaging import UnregisteredError
+from sqlalchemy import select, update
+from starlette.status import HTTP_201_CREATED
+from starlette.testclient import TestClient
+
+from api.medicine.models import Medicine
+from api.notification.models.message import (
+    LowStockFromSupervisedUserMessage,
+    LowStockMessage,
+    TodayUserMedicines,
+    YesterdarUserDidntTakeMedicine,
+)
+from api.notification.models.notification import Notification
+from api.notification.models.outbox import NotificationOutbox
+from api.notification.service import (
+    add_notification_preference,
+    get_digest,
+    send_notification,
+    send_notifications_bulk,
+)
+from api.notification.worker import Worker
+from api.user.models import User
+from api.user.service import assert_device, get_or_create_user, get_users_devices
+from config import NOTIFICATION_DIGEST_SECONDS, OUTBOX_MAX_ATTEMPTS
+from database import database
+
+
+def get_deliveries(client: TestClient) -> list[NotificationOutbox]:
+    select_query = select(NotificationOutbox).order_by(NotificationOutbox.id)
+    deliveries = client.portal.call(database.fetch_all, select_query)
+    return [NotificationOutbox(**delivery) for delivery in deliveries]
+
+
+def test_outbox_delivery(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    # The low stock notifications are sent at once, instead of in a digest
+    monkeypatch.setitem(NOTIFICATION_DIGEST_SECONDS, "low_stock", 0)
+    response = client.post(
+        "/notification/preference", params={"notification_preference": "email"}
+    )
+    assert response.status_code == HTTP_201_CREATED
+    user = User(id="test_user", email="test_user@test.com")
+    message = LowStockMessage(medicine=Medicine(name="Ibuprofeno"))
+    client.portal.call(send_notification, message, user)
+
+    deliveries = get_deliveries(client)
+    assert len(deliveries) == 1
+    assert deliveries[0].channel == "email"
+    assert deliveries[0].status == NotificationOutbox.PENDING
+    assert deliveries[0].payload["to"] == "test_user@test.com"
+
+    sent = []
+    worker = Worker(senders={"email": sent.append})
+    assert client.portal.call(worker.drain, "email") == 1
+    assert sent == [deliveries[0].payload]
+    assert get_deliveries(client)[0].status == NotificationOutbox.SENT
+    # There is nothing left to send
+    assert client.portal.call(worker.drain, "email") == 0
+
+
+def test_outbox_retries_and_dead_letter(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+):
+    # The low stock notifications are sent at once, instead of in a digest
+    monkeypatch.setitem(NOTIFICATION_DIGEST_SECONDS, "low_stock", 0)
+    user = User(id="test_user", email="test_user@test.com")
+    message = LowStockMessage(medicine=Medicine(name="Ibuprofeno"))
+    client.portal.call(send_notification, message, user)
+
+    def fail(payload: dict):
+        raise ConnectionError("SendGrid is down")
+
+    worker = Worker(senders={"email": fail})
+    assert client.portal.call(worker.drain, "email") == 1
+    delivery = get_deliveries(client)[-1]
+    assert delivery.status == NotificationOutbox.PENDING
+    assert delivery.attempts == 1
+    assert "SendGrid is down" in delivery.last_error
+    # The retry waits for the backoff
+    assert client.portal.call(worker.drain, "email") == 0
+
+    # The last attempt fails too
+    update_query = (
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id == delivery.id)
+        .values(
+            attempts=OUTBOX_MAX_ATTEMPTS - 1,
+            next_attempt_at=datetime.now() - timedelta(days=1),
+        )
+    )
+    client.portal.call(database.execute, update_query)
+    assert client.portal.call(worker.drain, "email") == 1
+    assert get_deliveries(client)[-1].status == NotificationOutbox.DEAD
+
+
+def test_push_delivery_prunes_unregistered_devices(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+):
+    # The low stock notifications are sent at once, instead of in a digest
+    monkeypatch.setitem(NOTIFICATION_DIGEST_SECONDS, "low_stock", 0)
+    response = client.post(
+        "/notification/preference", params={"notification_preference": "push"}
+    )
+    assert response.status_code == HTTP_201_CREATED
+    user = User(id="test_user", email="test_user@test.com")
+    client.portal.call(assert_device, user, "registered_token")
+    client.portal.call(assert_device, user, "unregistered_token")
+    devices = client.portal.call(get_users_devices, [user.id])
+    tokens = [device.token for device in devices[user.id]]
+    message = LowStockMessage(medicine=Medicine(name="Ibuprofeno"))
+    client.portal.call(send_notification, message, user)
+    client.portal.call(send_notification, message, user)
+
+    calls = []
+
+    def send_pushes(pushes: list[tuple[dict, str]]) -> list[Exception | None]:
+        calls.append(pushes)
+        return [
+            UnregisteredError("Requested entity was not found.")
+            if token == "unregistered_token"
+            else None
+            for _, token in pushes
+        ]
+
+    worker = Worker(senders={"push": send_pushes})
+    assert client.portal.call(worker.drain, "push") == 2
+    # The tokens of both notifications are sent in a single call
+    assert len(calls) == 1
+    assert sorted(token for _, token in calls[0]) == sorted(tokens * 2)
+    assert all(
+        delivery.status == NotificationOutbox.SENT
+        for delivery in get_deliveries(client)
+        if delivery.channel == "push"
+    )
+    devices = client.portal.call(get_users_devices, [user.id])
+    assert "unregistered_token" not in [device.token for device in devices[user.id]]
+    assert len(devices[user.id]) == len(tokens) - 1
+
+
+def test_send_notifications_bulk(client: TestClient):
+    response = client.post(
+        "/notification/preference", params={"notification_preference": "whatsapp"}
+    )
+    assert response.status_code == HTTP_201_CREATED
+    user = User(id="test_user", email="test_user@test.com", phone="+5493510000000")
+    others = [
+        User(
+            **client.portal.call(get_or_create_user, f"bulk_{i}", f"bulk_{i}@test.com")
+        )
+        for i in range(3)
+    ]
+    medicine = Medicine(name="Paracetamol")
+    messages = [(LowStockMessage(medicine=medicine), user)] + [
+        (
+            LowStockFromSupervisedUserMessage(medicine=medicine, supervised_user=user),
+            other,
+        )
+        for other in others
+    ]
+    deliveries = len(get_deliveries(client))
+    client.portal.call(send_notifications_bulk, messages)
+
+    select_query = (
+        select(Notification)
+        .where(Notification.body.like("%Paracetamol%"))
+        .order_by(Notification.id)
+    )
+    notifications = client.portal.call(database.fetch_all, select_query)
+    assert [notification.user_id for notification in notifications] == [
+        message_user.id for _, message_user in messages
+    ]
+    # Only the user has preferences
+    new_deliveries = get_deliveries(client)[deliveries:]
+    assert {delivery.notification_id for delivery in new_deliveries} == {
+        notifications[0].id
+    }
+    whatsapp = [d for d in new_deliveries if d.channel == "whatsapp"]
+    assert whatsapp[0].payload["to"] == "+5493510000000"
+
+
+def test_send_notifications_bulk_pairs_the_deliveries(client: TestClient):
+    users = {}
+    for i in range(20):
+        user = User(
+            **client.portal.call(get_or_create_user, f"pair_{i}", f"pair_{i}@test.com")
+        )
+        user.phone = f"+54935100001{i:02d}"
+        client.portal.call(add_notification_preference, "whatsapp", user)
+        users[user.phone] = user
+    messages = [
+        (LowStockMessage(medicine=Medicine(name=f"Medicamento {i}")), user)
+        for i, user in enumerate(users.values())
+    ]
+    deliveries = len(get_deliveries(client))
+    client.portal.call(send_notifications_bulk, messages)
+
+    new_deliveries = get_deliveries(client)[deliveries:]
+    select_query = select(Notification).where(
+        Notification.id.in_([delivery.notification_id for delivery in new_deliveries])
+    )
+    notifications = {
+        notification.id: notification
+        for notification in client.portal.call(database.fetch_all, select_query)
+    }
+    assert len(new_deliveries) == len(users)
+    for delivery in new_deliveries:
+        # Every delivery is of the notification of its user, with the same message
+        notification = notifications[delivery.notification_id]
+        assert notification.user_id == users[delivery.payload["to"]].id
+        assert notification.body.split(" ")[2:4] == (
+            delivery.payload["message"].split(" ")[2:4]
+        )
+
+
+def test_digest_coalesces_deliveries(client: TestClient):
+    # The default window of the low stock notifications
+    assert NOTIFICATION_DIGEST_SECONDS["low_stock"] == 600
+    user = User(
+        **client.portal.call(get_or_create_user, "digest_user", "digest@test.com")
+    )
+    user.phone = "+5493510000001"
+    client.portal.call(add_notification_preference, "whatsapp", user)
+    names = ["Ibuprofeno", "Paracetamol", "Amoxicilina"]
+    for name in names:
+        message = LowStockMessage(medicine=Medicine(name=name))
+        client.portal.call(send_notification, message, user)
+
+    digest = [
+        delivery
+        for delivery in get_deliveries(client)
+        if delivery.digest_key == "digest_user:low_stock"
+    ]
+    assert len(digest) == 3
+    assert all(
+        delivery.next_attempt_at > datetime.now() + timedelta(minutes=9)
+        for delivery in digest
+    )
+    sent = []
+    worker = Worker(senders={"whatsapp": sent.append})
+    # They are held for the window, only the deliveries of the previous tests are sent
+    client.portal.call(worker.drain, "whatsapp")
+    assert all(payload["to"] != "+5493510000001" for payload in sent)
+    sent.clear()
+
+    update_query = (
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id == digest[0].id)
+        .values(next_attempt_at=datetime.now() - timedelta(minutes=1))
+    )
+    client.portal.call(database.execute, update_query)
+    assert client.portal.call(worker.drain, "whatsapp") == 3
+    # A single message for the three notifications
+    assert len(sent) == 1
+    assert sent[0]["to"] == "+5493510000001"
+    assert sent[0]["message"].startswith("Tienes 3 notificaciones")
+    assert all(name in sent[0]["message"] for name in names)
+    assert all(
+        delivery.status == NotificationOutbox.SENT
+        for delivery in get_deliveries(client)
+        if delivery.digest_key == "digest_user:low_stock"
+    )
+
+
+def test_reminders_are_not_held_with_the_low_stock_digest():
+    user = User(id="test_user", email="test_user@test.com")
+    # The reminders of the jobs are of the same type, but they are sent at once
+    for message in [TodayUserMedicines(), YesterdarUserDidntTakeMedicine()]:
+        assert get_digest(message, user)["digest_key"] is None
+    message = LowStockMessage(medicine=Medicine(name="Ibuprofeno"))
+    assert get_digest(message, user)["digest_key"] == "test_user:low_stock"
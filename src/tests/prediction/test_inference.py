@@ -0,0 +1,70 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+from starlette.testclient import TestClient
+
+from api.prediction import inference, registry
+from api.prediction.inference import MicroBatcher
+
+
+class StandInModel:
+    def predict(self, tensor: np.ndarray) -> np.ndarray:
+        # The process that predicts, and the mean of every image
+        means = tensor.reshape(len(tensor), -1).mean(axis=1)
+        return np.stack([np.full(len(tensor), os.getpid()), means], axis=1)
+
+
+def load_stand_in_model():
+    registry.MODELS["by_image"] = (lambda path: StandInModel(), "")
+    registry.get_model("by_image")
+
+
+def test_inference_pool(monkeypatch: pytest.MonkeyPatch):
+    # The processes of the pool are spawned, so they load the stand-in themselves
+    monkeypatch.setattr(inference, "load_model", load_stand_in_model)
+    monkeypatch.setattr(inference, "PREDICTION_IMAGE_WORKERS", 2)
+    assert inference.executor is None
+
+    async def predict() -> tuple[list[int], np.ndarray]:
+        await inference.start()
+        # Every process of the pool is started
+        pids = list(inference.executor._processes)
+        tensor = np.stack([np.full((32, 32, 3), i, dtype=np.float32) for i in range(3)])
+        return pids, await inference.predict(tensor)
+
+    try:
+        pids, probabilities = asyncio.run(predict())
+    finally:
+        inference.shutdown()
+    assert len(pids) == 2
+    assert int(probabilities[0][0]) in pids
+    assert os.getpid() not in pids
+    assert probabilities[:, 1].tolist() == [0, 1, 2]
+
+    # The processes are stopped
+    assert inference.executor is None
+    for pid in pids:
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
+
+
+def test_micro_batcher_scatters_the_batches(client: TestClient):
+    batches = []
+
+    async def predict(tensor: np.ndarray) -> np.ndarray:
+        batches.append(len(tensor))
+        return tensor.reshape(len(tensor), -1)[:, :1]
+
+    batcher = MicroBatcher(predict, max_size=4, max_wait_ms=10)
+
+    async def predict_concurrently() -> list[np.ndarray]:
+        return await asyncio.gather(
+            *[batcher.predict(np.full((1, 32, 32, 3), i)) for i in range(5)]
+        )
+
+    results = client.portal.call(predict_concurrently)
+    # A full batch, and the one left after the wait
+    assert batches == [4, 1]
+    assert [result.tolist() for result in results] == [[[i]] for i in range(5)]
@@ -0,0 +1,41 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from api.prediction import registry
+from api.prediction.registry import get_model, get_versioned_model, models
+
+
+def test_models_are_not_loaded_on_import():
+    code = (
+        "import sys, app; "
+        "print(any(m in sys.modules for m in ['sklearn', 'tensorflow', 'joblib']))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.splitlines()[-1] == "False"
+
+
+def test_model_is_loaded_once():
+    model = get_model("by_symptom")
+    assert models["by_symptom"][1] is model
+    assert get_model("by_symptom") is model
+
+
+def test_model_is_reloaded_when_its_file_changes(
+    tmp_path, monkeypatch: pytest.MonkeyPatch
+):
+    shutil.copy(f"{registry.PREDICTION_MODELS_FOLDER}/by_symptom.trained", tmp_path)
+    monkeypatch.setattr(registry, "PREDICTION_MODELS_FOLDER", str(tmp_path))
+    version, model = get_versioned_model("by_symptom")
+    assert get_versioned_model("by_symptom") == (version, model)
+
+    # The model is retrained
+    os.utime(tmp_path / "by_symptom.trained", ns=(0, 0))
+    new_version, new_model = get_versioned_model("by_symptom")
+    assert new_version != version
+    assert new_model is not model
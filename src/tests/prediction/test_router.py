@@ -1,6 +1,9 @@
-from starlette.status import HTTP_200_OK, HTTP_400_BAD_REQUEST
+import pytest
+from starlette.status import HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED
 from starlette.testclient import TestClient
 
+from api.auth import dependencies
+
 
 def test_create_get_verify_prediction_by_symptom(client: TestClient):
     symptom_codes = ["C0018681"]  # Headache
@@ -164,3 +167,38 @@ def test_verify_unexisting_prediction(client: TestClient):
         "/prediction/by_image/verify/0", params={"real_disease": "C0021400"}
     )
     assert response.status_code == HTTP_400_BAD_REQUEST
+
+
+def test_prediction_stats(client: TestClient):
+    before = client.get("/dev/prediction-stats").json()
+    client.post("/prediction/by_symptoms", json=["C0018681", "C0015967"])
+    # The same symptoms in another order are a hit
+    client.post("/prediction/by_symptoms", json=["C0015967", "C0018681"])
+    response = client.get("/dev/prediction-stats")
+    stats = response.json()
+    assert response.status_code == HTTP_200_OK
+    assert stats["misses"] == before["misses"] + 1
+    assert stats["hits"] == before["hits"] + 1
+    assert stats["size"] == before["size"] + 1
+
+
+def test_stats_need_the_internal_token(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(dependencies, "INTERNAL_TOKEN", "internal")
+    response = client.get("/dev/prediction-stats")
+    assert response.status_code == HTTP_401_UNAUTHORIZED
+    response = client.get(
+        "/dev/cache-stats", headers={"Authorization": "Bearer not-internal"}
+    )
+    assert response.status_code == HTTP_401_UNAUTHORIZED
+    response = client.get(
+        "/dev/prediction-stats", headers={"Authorization": "Bearer internal"}
+    )
+    assert response.status_code == HTTP_200_OK
+
+    # Without the token, production does not serve them
+    monkeypatch.setattr(dependencies, "INTERNAL_TOKEN", None)
+    monkeypatch.setattr(dependencies, "PROD", True)
+    response = client.get("/dev/prediction-stats")
+    assert response.status_code == HTTP_401_UNAUTHORIZED
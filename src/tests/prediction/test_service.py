@@ -0,0 +1,74 @@
+import random
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from api.prediction import registry
+from api.prediction.exceptions import NotValidSymptoms
+from api.prediction.registry import get_model
+from api.prediction.service import (
+    predict_symptoms,
+    predict_symptoms_cached,
+    predictions_cache,
+)
+
+
+def predict_symptoms_with_dataframe(symptoms_typed: list[str]) -> list[dict]:
+    # Like predict_by_symptoms did, with a DataFrame of every symptom
+    model = get_model("by_symptom")
+    symptoms = model.feature_names_in_
+    symptoms_df = pd.DataFrame(
+        [{**{s: 0 for s in symptoms}, **{s: 1 for s in symptoms_typed}}]
+    )
+    probabilities = model.predict_proba(symptoms_df.reindex(columns=symptoms))
+    predictions = np.argsort(probabilities[0])[-5:][::-1]
+    return [
+        {"disease": model.classes_[i], "probability": probabilities[0][i]}
+        for i in predictions
+    ]
+
+
+def test_predict_symptoms_matches_the_dataframe():
+    symptoms = list(get_model("by_symptom").feature_names_in_)
+    generator = random.Random(0)
+    for amount in [1, 2, 3, 5, 8]:
+        for _ in range(10):
+            symptoms_typed = generator.sample(symptoms, amount)
+            assert predict_symptoms(symptoms_typed) == (
+                predict_symptoms_with_dataframe(symptoms_typed)
+            )
+
+
+def test_predict_unexisting_symptom():
+    with pytest.raises(NotValidSymptoms):
+        predict_symptoms(["C0018681", "UNEXISTING"])
+
+
+def test_predictions_are_cached_by_set_of_symptoms():
+    predictions_cache.clear()
+    hits, misses = predictions_cache.hits, predictions_cache.misses
+    results = predict_symptoms_cached(["C0018681", "C0015967"])
+    results[0]["disease"] = "MODIFIED"
+    # The order and the repeated symptoms do not matter
+    cached = predict_symptoms_cached(["C0015967", "C0018681", "C0015967"])
+    assert cached == predict_symptoms(["C0018681", "C0015967"])
+    assert predictions_cache.hits == hits + 1
+    assert predictions_cache.misses == misses + 1
+
+
+def test_predictions_cache_is_invalidated_by_a_new_model(
+    tmp_path, monkeypatch: pytest.MonkeyPatch
+):
+    predictions_cache.clear()
+    shutil.copy(f"{registry.PREDICTION_MODELS_FOLDER}/by_symptom.trained", tmp_path)
+    monkeypatch.setattr(registry, "PREDICTION_MODELS_FOLDER", str(tmp_path))
+    predict_symptoms_cached(["C0018681"])
+
+    # The model is retrained
+    with open(tmp_path / "by_symptom.trained", "ab") as f:
+        f.write(b"\0")
+    misses = predictions_cache.misses
+    predict_symptoms_cached(["C0018681"])
+    assert predictions_cache.misses == misses + 1
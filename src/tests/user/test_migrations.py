@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+from databases import Database
+
+import migrations
+from config import DB_URL
+
+
+def get_columns(table: str) -> str:
+    return (
+        "SELECT column_name FROM information_schema.columns "
+        f"WHERE table_name = '{table}'"
+    )
+
+
+def test_migrate_adds_the_missing_columns(monkeypatch: pytest.MonkeyPatch):
+    async def migrate_old_tables() -> list[str]:
+        async with Database(DB_URL) as scratch:
+            monkeypatch.setattr(migrations, "database", scratch)
+            async with scratch.transaction(force_rollback=True):
+                # Like a table created before the columns were added
+                await scratch.execute('ALTER TABLE "user" DROP COLUMN timezone')
+                await scratch.execute(
+                    "ALTER TABLE medicine DROP COLUMN low_stock_notified"
+                )
+                await scratch.execute("ALTER TABLE job_run DROP COLUMN error")
+                await migrations.migrate()
+                # Nothing changes when it runs again
+                await migrations.migrate()
+                return {
+                    table: [
+                        row[0] for row in await scratch.fetch_all(get_columns(table))
+                    ]
+                    for table in ["user", "medicine", "job_run"]
+                }
+
+    columns = asyncio.run(migrate_old_tables())
+    assert "timezone" in columns["user"]
+    assert "low_stock_notified" in columns["medicine"]
+    assert "error" in columns["job_run"]